@@ -0,0 +1,94 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import async_session, dialect_insert
+from app.models import AccessLog, AccessRollup, UserAccessRollup
+
+load_dotenv()
+
+FLUSH_INTERVAL = int(os.getenv("ANALYTICS_FLUSH_INTERVAL", "10"))  # 秒，累加寫回資料庫的間隔
+BATCH_SIZE = 1000
+
+def hour_of(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+# 將 AccessLog 累加到兩份統計 Counter
+def count_log(hourly: Counter, daily: Counter, ts: datetime, device_id: int | None, user_id: int | None, status: str):
+    hourly[(hour_of(ts), device_id or 0, status)] += 1
+    if user_id is not None:
+        daily[(ts.date(), user_id, status)] += 1
+
+# 以 ON CONFLICT 加總寫入 (多個 worker 各自寫入增量也不會互相覆蓋)
+async def add_counts(session: AsyncSession, hourly: Counter, daily: Counter):
+    insert = dialect_insert(session)
+    tables = [
+        (AccessRollup, ["bucket", "device_id", "status"], hourly),
+        (UserAccessRollup, ["day", "user_id", "status"], daily),
+    ]
+    for model, keys, counter in tables:
+        rows = [{**dict(zip(keys, key)), "count": n} for key, n in counter.items() if n]
+        for i in range(0, len(rows), BATCH_SIZE):
+            stmt = insert(model).values(rows[i:i + BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(index_elements=keys, set_={"count": model.count + stmt.excluded.count})
+            await session.execute(stmt)
+
+# 於記憶體累計新寫入的 AccessLog，定期批次寫回統計表
+class AnalyticsRecorder:
+    def __init__(self):
+        self.hourly = Counter()
+        self.daily = Counter()
+        self.recorded = 0
+        self.flushes = 0
+        self._task: asyncio.Task | None = None
+        self._session_factory = async_session
+
+    # 在 AccessLog commit 之後呼叫
+    def record(self, log: AccessLog):
+        count_log(self.hourly, self.daily, log.timestamp, log.device_id, log.user_id, log.status)
+        self.recorded += 1
+
+    async def flush(self):
+        if not self.hourly and not self.daily:
+            return
+        hourly, daily = self.hourly, self.daily
+        self.hourly, self.daily = Counter(), Counter()
+        try:
+            async with self._session_factory() as session:
+                await add_counts(session, hourly, daily)
+                await session.commit()
+            self.flushes += 1
+        except Exception:
+            # 寫入失敗，併回下次重試
+            self.hourly.update(hourly)
+            self.daily.update(daily)
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[Analytics] Flush Error: {e}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def metrics(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "pending": len(self.hourly) + len(self.daily),
+            "flushes": self.flushes,
+        }
+
+analytics = AnalyticsRecorder()
@@ -2,12 +2,12 @@ from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_session
 from app.models import Admin
-from pwdlib import PasswordHash
+from app.hashing import hasher
+from app.cache import admin_cache, MISS
 from dotenv import load_dotenv
 import os
 
@@ -18,15 +18,14 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # Token 有效期 1 天
 
-# 密碼雜湊工具
-pwd_context = PasswordHash.recommended()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# 密碼雜湊 (在 hasher 的執行緒池中計算)
+async def verify_password(plain_password, hashed_password):
+    return await hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -35,6 +34,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -45,6 +45,7 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), session: AsyncS
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -53,9 +54,14 @@ async def get_current_admin(token: str = Depends(oauth2_scheme), session: AsyncS
     except JWTError:
         raise credentials_exception
         
-    statement = select(Admin).where(Admin.username == username)
-    result = await session.execute(statement)
-    admin = result.scalars().first()
+    admin = admin_cache.get(username)
+    if admin is MISS:
+        statement = select(Admin).where(Admin.username == username)
+        result = await session.execute(statement)
+        admin = result.scalars().first()
+        if admin is not None:
+            session.expunge(admin)
+            admin_cache.set(username, admin)
     
     if admin is None:
         raise credentials_exception
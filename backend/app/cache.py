@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import socket
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))        # 秒，快取最長有效期 (失效通知遺失時的上限)
+CACHE_BUS = os.getenv("CACHE_BUS", "local")            # local / postgres / unix
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR", "/tmp/esp32-access-bus")
+PG_CHANNEL = "cache_invalidate"
+RECONNECT_DELAY = 5
+MAX_ENTRIES = 10000
+
+MISS = object()
+
+# 程序內的 TTL 快取，修改資料後透過失效通知匯流排同步到其他 worker
+class TTLCache:
+    def __init__(self, name: str, ttl: float = CACHE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self._data: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        caches[name] = self
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() >= entry[0]:
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        if len(self._data) >= MAX_ENTRIES:
+            self._data.clear()
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def drop(self, key=None):
+        self.invalidations += 1
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    # 清除本程序並通知其他 worker，key 為 None 時清除整個快取
+    async def invalidate(self, key=None):
+        self.drop(key)
+        await bus.publish(self.name, key)
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+caches: dict[str, TTLCache] = {}
+# 非快取的廣播事件 (例如在場人數)，name -> handler(key)
+listeners: dict = {}
+
+# 失效通知匯流排 (local: 單一程序，不需廣播)
+class InvalidationBus:
+    name = "local"
+
+    def __init__(self):
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self.sent = 0
+        self.received = 0
+
+    def encode(self, cache: str, key) -> str:
+        return json.dumps({"origin": self.origin, "cache": cache, "key": key})
+
+    def deliver(self, payload: str | bytes):
+        try:
+            msg = json.loads(payload)
+        except ValueError:
+            return
+        if msg.get("origin") == self.origin:
+            return
+        handler = listeners.get(msg.get("cache"))
+        if handler is not None:
+            self.received += 1
+            handler(msg.get("key"))
+            return
+        cache = caches.get(msg.get("cache"))
+        if cache is not None:
+            self.received += 1
+            cache.drop(msg.get("key"))
+
+    def drop_all(self):
+        for cache in caches.values():
+            cache.drop()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, cache: str, key):
+        pass
+
+    def metrics(self) -> dict:
+        return {"type": self.name, "sent": self.sent, "received": self.received}
+
+# Postgres LISTEN/NOTIFY，適用跨主機的多個 worker
+class PostgresBus(InvalidationBus):
+    name = "postgres"
+
+    def __init__(self, dsn: str):
+        super().__init__()
+        self.dsn = dsn.replace("postgresql+asyncpg://", "postgresql://")
+        self._conn: "asyncpg.Connection | None" = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def _listen(self):
+        import asyncpg
+        while True:
+            closed = asyncio.Event()
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                conn.add_termination_listener(lambda _: closed.set())
+                await conn.add_listener(PG_CHANNEL, lambda _conn, _pid, _channel, payload: self.deliver(payload))
+                self._conn = conn
+                # 斷線期間可能漏掉通知，重新連線後清空所有快取
+                self.drop_all()
+                print(f"[CacheBus] Listening on {PG_CHANNEL}")
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[CacheBus] Postgres Error: {e}, reconnecting in {RECONNECT_DELAY}s")
+            self._conn = None
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._conn and not self._conn.is_closed():
+            await self._conn.close()
+
+    async def publish(self, cache, key):
+        if self._conn is None or self._conn.is_closed():
+            return
+        try:
+            async with self._lock:
+                await self._conn.execute("SELECT pg_notify($1, $2)", PG_CHANNEL, self.encode(cache, key))
+            self.sent += 1
+        except Exception as e:
+            print(f"[CacheBus] Publish Error: {e}")
+
+# Unix datagram socket 廣播，適用同一台主機上的多個 worker
+class UnixSocketBus(InvalidationBus):
+    name = "unix"
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self._sock: socket.socket | None = None
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            self.deliver(data)
+
+    async def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.setblocking(False)
+        asyncio.get_running_loop().add_reader(self._sock.fileno(), self._on_readable)
+
+    async def stop(self):
+        if self._sock is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sock = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    async def publish(self, cache, key):
+        if self._sock is None:
+            return
+        data = self.encode(cache, key).encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._sock.sendto(data, path)
+                self.sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # worker 已結束，移除殘留的 socket 檔
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                # 對方緩衝區已滿，交由 TTL 過期處理
+                pass
+
+def create_bus(kind: str) -> InvalidationBus:
+    if kind == "local":
+        return InvalidationBus()
+    if kind == "postgres":
+        return PostgresBus(os.getenv("DATABASE_URL"))
+    if kind == "unix":
+        return UnixSocketBus(CACHE_BUS_DIR)
+    raise ValueError(f"不支援的 CACHE_BUS: {kind}")
+
+bus = create_bus(CACHE_BUS)
+
+device_cache = TTLCache("device")      # device_name -> CachedDevice
+card_cache = TTLCache("card")          # card_uid -> CardAccess | None
+admin_cache = TTLCache("admin")        # username -> Admin
+schedule_cache = TTLCache("schedule")  # schedule_id -> 編譯後的每週時段 bitmap
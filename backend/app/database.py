@@ -1,26 +1,258 @@
+import asyncio
 import os
-from sqlmodel import SQLModel
+import time
+from fastapi import Request
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "false").lower() == "true"
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")  # 選填，唯讀副本
+REPLICA_RETRY_AFTER = float(os.getenv("REPLICA_RETRY_AFTER", "30"))  # 秒，副本連線失敗後改用主庫的時間
 
 if not DATABASE_URL:
     raise ValueError("❌ 錯誤: 未設定 DATABASE_URL，請檢查 .env 檔案")
 
+# 單機小型場域可改用 SQLite (DATABASE_URL=sqlite+aiosqlite:///./access.db)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # WAL 下 NORMAL 只在斷電時可能遺失最後幾筆交易
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # 毫秒，其他程序 (備份、批次腳本) 寫入時的等待上限
+SQLITE_CHECKPOINT_INTERVAL = int(os.getenv("SQLITE_CHECKPOINT_INTERVAL", "60"))  # 秒
+
 # 建立資料庫引擎
 engine = create_async_engine(DATABASE_URL, echo=False, future=True)
 
+if IS_SQLITE:
+    # 每條連線建立時套用：WAL 讓讀取不被寫入阻擋，快取與 mmap 減少磁碟 I/O
+    SQLITE_PRAGMAS = (
+        "journal_mode=WAL",
+        f"synchronous={SQLITE_SYNCHRONOUS}",
+        f"cache_size=-{SQLITE_CACHE_MB * 1024}",
+        f"mmap_size={SQLITE_MMAP_MB * 1024 * 1024}",
+        f"busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        "temp_store=MEMORY",
+        "foreign_keys=ON",
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def apply_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+# 報表、列表等大量讀取走副本，避免與刷卡驗證搶主庫連線
+read_engine = create_async_engine(READ_DATABASE_URL, echo=False, future=True) if READ_DATABASE_URL else None
+
+# 依資料庫選擇支援 ON CONFLICT 的 insert (upsert 用)
+def dialect_insert(session: AsyncSession):
+    return pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+
+# 資料表結構改由 migrate.py 在部署時執行一次，啟動時只確認版本 (AUTO_MIGRATE=true 時自動套用，開發用)
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+    from app import migrations
+    todo = await migrations.pending(engine)
+    if not todo:
+        return
+    if AUTO_MIGRATE:
+        await migrations.upgrade(engine)
+        return
+    names = ", ".join(name for _, name in todo)
+    raise RuntimeError(f"❌ 資料庫尚有未套用的遷移 ({names})，請先執行 uv run migrate.py")
+
+# SQLite 同時只能有一個寫入交易，同一程序內的寫入改為排隊：
+# 第一次寫入 (flush 或 INSERT/UPDATE/DELETE) 時取得寫入鎖，持有到 commit / rollback / close
+write_lock = asyncio.Lock()
+
+class SQLiteStats:
+    def __init__(self):
+        self.writes = 0
+        self.queued = 0
+        self.waited = 0
+        self.max_wait_ms = 0.0
+        self.checkpoints = 0
+        self.last_checkpoint: dict | None = None
+
+    def metrics(self) -> dict:
+        return {
+            "writes": self.writes,
+            "queued_writes": self.waited,
+            "max_write_wait_ms": round(self.max_wait_ms, 1),
+            "queue_length": self.queued,
+            "checkpoints": self.checkpoints,
+            "last_checkpoint": self.last_checkpoint,
+        }
+
+sqlite_stats = SQLiteStats()
+
+class SQLiteSession(AsyncSession):
+    _writing = False
+
+    def _pending(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+    async def _begin_write(self):
+        if self._writing:
+            return
+        # 先取得連線再排隊：持有寫入鎖的 session 不會再等待連線池，避免與排隊中的 session 互相等待
+        await self.connection()
+        if write_lock.locked():
+            start = time.perf_counter()
+            sqlite_stats.queued += 1
+            try:
+                await write_lock.acquire()
+            finally:
+                sqlite_stats.queued -= 1
+            sqlite_stats.waited += 1
+            sqlite_stats.max_wait_ms = max(sqlite_stats.max_wait_ms, (time.perf_counter() - start) * 1000)
+        else:
+            await write_lock.acquire()
+        self._writing = True
+        sqlite_stats.writes += 1
+
+    def _end_write(self):
+        if self._writing:
+            self._writing = False
+            write_lock.release()
+
+    async def execute(self, statement, *args, **kwargs):
+        # 查詢前的 autoflush 也會寫入
+        if getattr(statement, "is_dml", False) or self._pending():
+            await self._begin_write()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None):
+        if self._pending():
+            await self._begin_write()
+        await super().flush(objects)
+
+    async def commit(self):
+        if self._pending():
+            await self._begin_write()
+        try:
+            await super().commit()
+        finally:
+            self._end_write()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            self._end_write()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            self._end_write()
+
+async_session = sessionmaker(engine, class_=SQLiteSession if IS_SQLITE else AsyncSession, expire_on_commit=False)
+
+# 關閉連線池 (aiosqlite 每條連線各有一個執行緒，未關閉時程序無法結束)
+async def close_db():
+    await engine.dispose()
+    if read_engine is not None:
+        await read_engine.dispose()
+
+# 命令列腳本用：執行完畢 (含中途 return) 後關閉連線池
+# 在 async for session in get_session() 內 return 時，session 由背景工作關閉，先等它歸還連線
+def run_script(coro):
+    async def main():
+        try:
+            return await coro
+        finally:
+            await asyncio.sleep(0)
+            pending = asyncio.all_tasks() - {asyncio.current_task()}
+            await asyncio.gather(*pending, return_exceptions=True)
+            await close_db()
+    return asyncio.run(main())
 
 async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
     async with async_session() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+# 定期將 WAL 寫回主檔，避免 WAL 檔持續成長拖慢讀取 (PASSIVE 不阻擋讀寫)，關閉時截斷 WAL
+class Checkpointer:
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+
+    async def checkpoint(self, mode: str = "PASSIVE"):
+        async with engine.connect() as conn:
+            busy, wal_pages, moved = (await conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})")).one()
+        sqlite_stats.checkpoints += 1
+        sqlite_stats.last_checkpoint = {"mode": mode, "busy": bool(busy), "wal_pages": wal_pages, "checkpointed": moved}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(SQLITE_CHECKPOINT_INTERVAL)
+            try:
+                await self.checkpoint()
+            except Exception as e:
+                print(f"[Database] Checkpoint Error: {e}")
+
+    async def start(self):
+        if IS_SQLITE:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            async with write_lock:
+                await self.checkpoint("TRUNCATE")
+        except Exception as e:
+            print(f"[Database] Checkpoint Error: {e}")
+
+checkpointer = Checkpointer()
+
+# 唯讀副本狀態
+class ReplicaState:
+    def __init__(self):
+        self.down_until = 0.0
+        self.reads = 0
+        self.fallbacks = 0
+
+    def metrics(self) -> dict:
+        return {
+            "configured": read_engine is not None,
+            "available": read_engine is not None and time.monotonic() >= self.down_until,
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+        }
+
+replica = ReplicaState()
+
+# 唯讀路由使用的 Session：有設定副本時走副本，副本無法連線時暫時改用主庫
+# 剛寫入後需要讀到最新資料時，請求可帶 ?fresh=true 或 X-Read-Fresh: 1 強制讀主庫
+async def get_read_session(request: Request) -> AsyncSession:
+    fresh = request.query_params.get("fresh") == "true" or request.headers.get("x-read-fresh") == "1"
+    if read_engine is None or fresh or time.monotonic() < replica.down_until:
+        async for session in get_session():
+            yield session
+        return
+
+    session = sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)()
+    try:
+        await session.connection()
+        replica.reads += 1
+    except Exception as e:
+        await session.close()
+        replica.down_until = time.monotonic() + REPLICA_RETRY_AFTER
+        replica.fallbacks += 1
+        print(f"[Database] Replica unavailable ({e}), using primary for {REPLICA_RETRY_AFTER:.0f}s")
+        session = async_session()
+    try:
+        yield session
+    finally:
+        await session.close()
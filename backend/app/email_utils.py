@@ -1,41 +1,181 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from pydantic import EmailStr
-from dotenv import load_dotenv
 import os
+import re
+import time
+import asyncio
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formataddr
+from dotenv import load_dotenv
+from app.verification import CODE_TTL
 
 load_dotenv()
 
-conf = ConnectionConfig(
-    MAIL_USERNAME = os.getenv("MAIL_USERNAME"),
-    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD"),
-    MAIL_FROM = os.getenv("MAIL_FROM"),
-    MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME"),
-    MAIL_PORT = int(os.getenv("MAIL_PORT")),
-    MAIL_SERVER = os.getenv("MAIL_SERVER"),
-    
-    MAIL_STARTTLS = False,
-    MAIL_SSL_TLS = True,
-    USE_CREDENTIALS = True,
-    VALIDATE_CERTS = True
-)
+MAIL_USERNAME = os.getenv("MAIL_USERNAME")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL_FROM = os.getenv("MAIL_FROM")
+MAIL_FROM_NAME = os.getenv("MAIL_FROM_NAME")
+MAIL_PORT = int(os.getenv("MAIL_PORT"))
+MAIL_SERVER = os.getenv("MAIL_SERVER")
+# 本機測試 (SMTP sink) 時可關閉 SSL 與帳密
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "true").lower() == "true"
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "false").lower() == "true"
+MAIL_USE_CREDENTIALS = os.getenv("MAIL_USE_CREDENTIALS", "true").lower() == "true"
+
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", "100"))
+MAIL_RETRIES = int(os.getenv("MAIL_RETRIES", "3"))
+MAIL_BACKOFF = float(os.getenv("MAIL_BACKOFF", "1"))
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", "10"))
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))  # 秒，閒置超過即關閉 SMTP 連線
+LATENCY_WINDOW = 100
+
+# 郵件範本：載入時解析一次，寄送時只填入變數
+class MailTemplate:
+    def __init__(self, subject: str, html: str):
+        self.subject = subject
+        # 依 {name} 切開，偶數位置為固定文字，奇數位置為變數名稱
+        self.parts = re.split(r"\{(\w+)\}", html)
 
-async def send_verification_code(email_to: EmailStr, code: str):
-    html = f"""
+    def render(self, **values) -> str:
+        return "".join(part if i % 2 == 0 else str(values[part]) for i, part in enumerate(self.parts))
+
+VERIFICATION_TEMPLATE = MailTemplate(
+    "[ESP32 門禁] Telegram 綁定驗證碼",
+    """
     <div style="font-family: Arial, sans-serif; padding: 20px; border: 1px solid #ddd; border-radius: 5px;">
         <h2 style="color: #2c3e50;">🚪 ESP32 門禁系統驗證</h2>
         <p>您好，</p>
         <p>這是您的 Telegram 綁定驗證碼：</p>
         <h1 style="color: #3498db; letter-spacing: 5px; background: #f0f8ff; padding: 10px; text-align: center; border-radius: 5px;">{code}</h1>
-        <p style="color: #e74c3c;"><strong>此驗證碼將在 3 分鐘後失效。</strong></p>
+        <p style="color: #e74c3c;"><strong>此驗證碼將在 {minutes} 分鐘後失效。</strong></p>
     </div>
     """
+)
+
+def build_message(email_to: str, template: MailTemplate, **values) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((MAIL_FROM_NAME, MAIL_FROM))
+    message["To"] = email_to
+    message["Subject"] = template.subject
+    message.set_content(template.render(**values), subtype="html")
+    return message
+
+# 寄信佇列：由 lifespan 啟動，單一 worker 重用 SMTP 連線依序寄出
+class MailDispatcher:
+    def __init__(self):
+        self.queue: asyncio.Queue[EmailMessage] | None = None
+        self._smtp: "aiosmtplib.SMTP | None" = None
+        self._task: asyncio.Task | None = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def enqueue(self, message: EmailMessage) -> bool:
+        if self.queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"[Mail] Queue full, dropped mail to {message['To']}")
+            return False
+
+    async def _connect(self):
+        # 第一次寄信時才載入 aiosmtplib
+        import aiosmtplib
+        self._smtp = aiosmtplib.SMTP(
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS,
+            timeout=MAIL_TIMEOUT,
+        )
+        await self._smtp.connect()
+        if MAIL_USE_CREDENTIALS:
+            await self._smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+
+    async def _close(self):
+        if self._smtp is None:
+            return
+        try:
+            if self._smtp.is_connected:
+                await self._smtp.quit()
+        except Exception:
+            self._smtp.close()
+        self._smtp = None
+
+    async def _send(self, message: EmailMessage):
+        if self._smtp is None or not self._smtp.is_connected:
+            await self._connect()
+        await self._smtp.send_message(message)
+
+    async def _deliver(self, message: EmailMessage):
+        for attempt in range(MAIL_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                await self._send(message)
+                self.latencies.append((time.perf_counter() - start) * 1000)
+                self.sent += 1
+                return
+            except Exception as e:
+                await self._close()
+                # 5xx 為永久性錯誤 (收件人不存在等)，不重試
+                from aiosmtplib import SMTPResponseException
+                permanent = isinstance(e, SMTPResponseException) and 500 <= e.code < 600
+                if permanent or attempt == MAIL_RETRIES:
+                    self.failed += 1
+                    print(f"[Mail] Send to {message['To']} failed: {e}")
+                    return
+                self.retried += 1
+                await asyncio.sleep(MAIL_BACKOFF * 2 ** attempt)
+
+    async def _run(self):
+        while True:
+            try:
+                message = await asyncio.wait_for(self.queue.get(), MAIL_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                await self._close()
+                continue
+            try:
+                await self._deliver(message)
+            finally:
+                self.queue.task_done()
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=MAIL_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 10):
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"[Mail] Dropped {self.queue.qsize()} queued mails on shutdown")
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self._close()
+
+    def metrics(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_size": MAIL_QUEUE_SIZE,
+            "connected": bool(self._smtp and self._smtp.is_connected),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "latency_avg_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+        }
 
-    message = MessageSchema(
-        subject="[ESP32 門禁] Telegram 綁定驗證碼",
-        recipients=[email_to],
-        body=html,
-        subtype=MessageType.html
-    )
+mail_dispatcher = MailDispatcher()
 
-    fm = FastMail(conf)
-    await fm.send_message(message)
\ No newline at end of file
+# 排入驗證碼郵件，佇列已滿時回傳 False
+def send_verification_code(email_to: str, code: str) -> bool:
+    return mail_dispatcher.enqueue(build_message(email_to, VERIFICATION_TEMPLATE, code=code, minutes=CODE_TTL // 60))
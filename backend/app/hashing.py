@@ -0,0 +1,78 @@
+import os
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "32"))  # 等待中的雜湊請求上限，超過回應 503
+LATENCY_WINDOW = 200
+
+# argon2 在獨立的執行緒池中計算 (argon2-cffi 會釋放 GIL)，避免阻塞 event loop
+class Hasher:
+    def __init__(self):
+        self._password_hash = None
+        self._executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="argon2")
+        self._semaphore = asyncio.Semaphore(HASH_WORKERS)
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # 含排隊時間
+        self.compute = deque(maxlen=LATENCY_WINDOW)    # 純計算時間
+
+    # argon2 於第一次雜湊時才載入
+    @property
+    def password_hash(self):
+        if self._password_hash is None:
+            from pwdlib import PasswordHash
+            self._password_hash = PasswordHash.recommended()
+        return self._password_hash
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.compute.append((time.perf_counter() - start) * 1000)
+        return result
+
+    async def _run(self, fn, *args):
+        if self.pending >= HASH_WORKERS + HASH_QUEUE_LIMIT:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server Busy", headers={"Retry-After": "1"})
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            async with self._semaphore:
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, fn, *args)
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            self.completed += 1
+            return result
+        finally:
+            self.pending -= 1
+
+    async def hash(self, secret: str) -> str:
+        return await self._run(self.password_hash.hash, secret)
+
+    async def verify(self, secret: str, hashed: str) -> bool:
+        return await self._run(self.password_hash.verify, secret, hashed)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> dict:
+        def p95(values):
+            values = sorted(values)
+            return round(values[int(len(values) * 0.95)], 1) if values else None
+        return {
+            "workers": HASH_WORKERS,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "latency_p95_ms": p95(self.latencies),
+            "compute_p95_ms": p95(self.compute),
+        }
+
+hasher = Hasher()
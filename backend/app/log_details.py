@@ -0,0 +1,34 @@
+import re
+
+# 舊版 AccessLog 只把設備寫在 details：
+# "Device: {名稱} | {訊息}"、"Remote unlock: {名稱} | {訊息}"、"Remote unlock: device #{id} | {訊息}"，
+# 最早的 Telegram 開門則只有 "Remote unlock: {名稱}" (沒有訊息)
+DETAILS_RE = re.compile(r"^(Device|Remote unlock): (?:device #(\d+)|(.*?))(?: \| ?(.*))?$", re.S)
+
+# 各版本格式的範例與預期結果，回填前先以 check() 確認 (調整格式時一併更新)
+SAMPLES = {
+    "Device: door1 | Welcome, Amy": (1, "Welcome, Amy"),
+    "Remote unlock: door1 | ✅ 開門成功": (1, "✅ 開門成功"),
+    "Remote unlock: device #7 | No Permission": (7, "No Permission"),
+    "Remote unlock: door1": (1, "Remote unlock"),
+    "Remote unlock: old door": (None, "Remote unlock"),
+    "Manual entry": (None, "Manual entry"),
+}
+
+# 回傳 (device_id, message)，名稱以目前的設備名稱對應 (已改名或刪除的設備為 None)
+def parse_details(details: str | None, names: dict[str, int]) -> tuple[int | None, str]:
+    match = DETAILS_RE.match(details or "")
+    if not match:
+        return None, details or ""
+    kind, device_ref, device_name, message = match.groups()
+    if message is None:
+        message = kind
+    if device_ref:
+        return int(device_ref), message
+    return names.get(device_name), message
+
+def check():
+    for details, expected in SAMPLES.items():
+        parsed = parse_details(details, {"door1": 1})
+        if parsed != expected:
+            raise RuntimeError(f"parse_details({details!r}) = {parsed}，預期 {expected}")
@@ -0,0 +1,8 @@
+from sqlmodel import SQLModel
+from sqlalchemy.ext.asyncio import AsyncConnection
+import app.models  # noqa: F401 (註冊所有資料表)
+
+# 建立尚不存在的資料表 (取代原本每次啟動執行的 create_all)
+# 之後的版本都以檢查欄位的方式撰寫，新建與既有資料庫皆可套用
+async def upgrade(conn: AsyncConnection):
+    await conn.run_sync(SQLModel.metadata.create_all)
@@ -0,0 +1,10 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import columns
+
+# 驗證碼改存於 verificationcode 表，移除 user 上的舊欄位
+async def upgrade(conn: AsyncConnection):
+    existing = await columns(conn, "user")
+    for column in ("verification_code", "code_expires_at"):
+        if column in existing:
+            await conn.execute(text(f'ALTER TABLE "user" DROP COLUMN {column}'))
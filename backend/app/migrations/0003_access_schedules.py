@@ -0,0 +1,12 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import add_column, columns
+from app.models import EffectivePermission
+
+# 群組授權加上開放時段；實際權限表的主鍵加入 schedule_id，
+# 直接重建空表，由 0008 重新展開
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "groupzonegrant", "schedule_id", "INTEGER REFERENCES schedule(id)")
+    if "schedule_id" not in await columns(conn, "effectivepermission"):
+        await conn.execute(text("DROP TABLE effectivepermission"))
+        await conn.run_sync(EffectivePermission.__table__.create)
@@ -0,0 +1,7 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import add_column
+
+# 進/出門方向與 Zone 人數上限
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "device", "direction", "VARCHAR")
+    await add_column(conn, "zone", "capacity", "INTEGER")
@@ -0,0 +1,9 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import add_column
+
+# AccessLog 的結構化設備欄位 (舊資料以 backfill_access_logs.py 回填)
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "accesslog", "device_id", "INTEGER REFERENCES device(id) ON DELETE SET NULL")
+    await add_column(conn, "accesslog", "message", "VARCHAR")
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_accesslog_device_id ON accesslog (device_id)"))
@@ -0,0 +1,15 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# 學生列表的分頁排序與搜尋索引
+async def upgrade(conn: AsyncConnection):
+    await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_name ON "user" (name)'))
+    await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_card_user_id ON card (user_id)"))
+    if conn.dialect.name != "postgresql":
+        return
+    # 學號前綴查詢 (LIKE 'abc%') 在非 C collation 下需要 text_pattern_ops 才能走索引
+    await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_student_id_pattern ON "user" (student_id text_pattern_ops)'))
+    # 姓名、Email 的任意位置搜尋 (ILIKE '%abc%') 以 trigram GIN 索引加速
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_name_trgm ON "user" USING gin (name gin_trgm_ops)'))
+    await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_email_trgm ON "user" USING gin (email gin_trgm_ops)'))
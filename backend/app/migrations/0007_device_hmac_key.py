@@ -0,0 +1,6 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import add_column
+
+# 設備簽章模式的 HMAC 金鑰 (NULL 表示沿用 x-device-token)
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "device", "hmac_key", "VARCHAR")
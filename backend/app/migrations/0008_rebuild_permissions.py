@@ -0,0 +1,13 @@
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from app import permissions
+
+# 由來源資料重建實際權限表 (0003 重建空表後展開；也修正先前多個 worker 同時重建造成的重複計數)
+# 在遷移的交易內執行，Postgres 上由 advisory lock 保證只有一個程序執行
+async def upgrade(conn: AsyncConnection):
+    session = AsyncSession(bind=conn)
+    try:
+        rows = await permissions.rebuild(session)
+    finally:
+        await session.close()
+    if rows:
+        print(f"[Permissions] Rebuilt {rows} effective permissions")
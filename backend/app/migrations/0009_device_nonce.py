@@ -0,0 +1,6 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.models import DeviceNonce
+
+# 設備簽章的 nonce 改存於資料庫，由主鍵防止跨 worker 重送
+async def upgrade(conn: AsyncConnection):
+    await conn.run_sync(DeviceNonce.__table__.create, checkfirst=True)
@@ -0,0 +1,6 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.migrations import add_column
+
+# 離線日誌的 high-water mark (設備重送同一批紀錄時不重複寫入)
+async def upgrade(conn: AsyncConnection):
+    await add_column(conn, "device", "journal_seq", "INTEGER NOT NULL DEFAULT 0")
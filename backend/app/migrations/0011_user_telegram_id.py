@@ -0,0 +1,6 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+# Bot 每次查詢登入狀態都以 telegram_id 查使用者
+async def upgrade(conn: AsyncConnection):
+    await conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_telegram_id ON "user" (telegram_id)'))
@@ -0,0 +1,66 @@
+import importlib
+import pkgutil
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, select, func, inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+# 版本化的資料庫遷移：每個檔案 NNNN_名稱.py 提供 async def upgrade(conn)
+# 依版本號依序執行，已套用的版本記錄於 schema_version 表
+
+metadata = MetaData()
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# 同時只允許一個程序執行遷移 (Postgres advisory lock 的任意固定 key)
+LOCK_KEY = 720_451
+
+def discover() -> list[tuple[int, str]]:
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        number, _, name = module.name.partition("_")
+        if number.isdigit():
+            found.append((int(number), module.name))
+    return sorted(found)
+
+async def current_version(conn: AsyncConnection) -> int:
+    exists = await conn.run_sync(lambda c: inspect(c).has_table("schema_version"))
+    if not exists:
+        return 0
+    return (await conn.execute(select(func.max(schema_version.c.version)))).scalar() or 0
+
+async def pending(engine: AsyncEngine) -> list[tuple[int, str]]:
+    async with engine.connect() as conn:
+        version = await current_version(conn)
+    return [(number, name) for number, name in discover() if number > version]
+
+# 每個版本各自一個交易，失敗時停在上一個成功的版本
+async def upgrade(engine: AsyncEngine) -> list[str]:
+    applied = []
+    for number, name in discover():
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+            await conn.run_sync(metadata.create_all)
+            if number <= await current_version(conn):
+                continue
+            module = importlib.import_module(f"{__name__}.{name}")
+            await module.upgrade(conn)
+            await conn.execute(schema_version.insert().values(version=number, name=name, applied_at=datetime.now()))
+        applied.append(name)
+        print(f"[Migrate] Applied {name}")
+    return applied
+
+# 遷移輔助函式 (讓每個版本在全新與既有資料庫上都能安全執行)
+async def columns(conn: AsyncConnection, table: str) -> set[str]:
+    return await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns(table)})
+
+async def has_table(conn: AsyncConnection, table: str) -> bool:
+    return await conn.run_sync(lambda c: inspect(c).has_table(table))
+
+async def add_column(conn: AsyncConnection, table: str, column: str, ddl: str):
+    if column not in await columns(conn, table):
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
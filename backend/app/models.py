@@ -1,6 +1,7 @@
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, date
 from sqlmodel import Field, SQLModel, Relationship
+from sqlalchemy import Column, JSON
 
 # 多對多關聯表
 class UserDeviceLink(SQLModel, table=True):
@@ -18,35 +19,67 @@ class DeviceBase(SQLModel):
     device_name: str = Field(index=True, unique=True)
     location: Optional[str] = None
     is_active: bool = Field(default=True)
+    direction: Optional[str] = Field(default=None, regex="^(in|out)$")  # 進/出門，用於在場人數統計
 
 class Device(DeviceBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     token: str = Field(index=True, unique=True)
     mqtt_topic: str = Field(default="door/control") # MQTT 主題
     created_at: datetime = Field(default_factory=datetime.now)
+    hmac_key: Optional[str] = None  # 簽章模式的 HMAC 金鑰 (hex)，驗證時需要原始值，無法雜湊儲存
+    journal_seq: int = Field(default=0)  # 已收到的離線日誌最大 seq，重送的紀錄不再寫入
     
     allowed_users: List["User"] = Relationship(back_populates="accessible_devices", link_model=UserDeviceLink)
 
+    @property
+    def signed(self) -> bool:
+        return self.hmac_key is not None
+
 class DeviceReadPublic(DeviceBase):
     id: int
     created_at: datetime
+    signed: bool = False
+
+class DeviceReadWithStatus(DeviceReadPublic):
+    online: bool = False
+    last_seen: Optional[datetime] = None
+    uptime_s: Optional[int] = None
+    free_heap: Optional[int] = None
+    min_free_heap: Optional[int] = None
+    rssi: Optional[int] = None
+    avg_rssi: Optional[float] = None
+    swipe_count: Optional[int] = None
+    latency_p50_ms: Optional[int] = None
+    latency_p95_ms: Optional[int] = None
+    latency_p99_ms: Optional[int] = None
 
 class DeviceReadWithToken(DeviceBase):
     id: int
     token: str
     created_at: datetime
+    hmac_key: Optional[str] = None  # 只在佈建簽章模式時回傳一次
+
+# 設備心跳快照 (定期由記憶體寫回)
+class DeviceTelemetry(SQLModel, table=True):
+    device_id: int = Field(foreign_key="device.id", primary_key=True)
+    last_seen: datetime
+    uptime_s: Optional[int] = None
+    free_heap: Optional[int] = None
+    min_free_heap: Optional[int] = None
+    rssi: Optional[int] = None
+    avg_rssi: Optional[float] = None
+    swipe_count: Optional[int] = None
+    latency_p50_ms: Optional[int] = None
+    latency_p95_ms: Optional[int] = None
+    latency_p99_ms: Optional[int] = None
 
 # User
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     student_id: str = Field(index=True, unique=True)
-    name: str
+    name: str = Field(index=True)
     email: Optional[str] = Field(default=None, index=True)
-    telegram_id: Optional[str] = Field(default=None)
-    
-    # 驗證碼欄位
-    verification_code: Optional[str] = Field(default=None)
-    code_expires_at: Optional[datetime] = Field(default=None)
+    telegram_id: Optional[str] = Field(default=None, index=True)
     
     is_active: bool = Field(default=True)
     created_at: datetime = Field(default_factory=datetime.now)
@@ -54,11 +87,77 @@ class User(SQLModel, table=True):
     cards: List["Card"] = Relationship(back_populates="owner")
     accessible_devices: List[Device] = Relationship(back_populates="allowed_users", link_model=UserDeviceLink)
 
+# Telegram 綁定驗證碼 (VERIFY_CODE_PERSIST=true 時寫入，供多個後端程序共用)
+class VerificationCode(SQLModel, table=True):
+    telegram_id: str = Field(primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    code: str
+    expires_at: datetime = Field(index=True)
+    attempts: int = Field(default=0)
+
+# 已使用的設備簽章 nonce (主鍵防止重送，多個 worker 共用；過期後刪除)
+class DeviceNonce(SQLModel, table=True):
+    device_id: str = Field(primary_key=True)  # 設備名稱
+    nonce: str = Field(primary_key=True)
+    expires_at: int = Field(index=True)  # Unix 時間 (秒)
+
+# Zone (設備群組，例如一整棟大樓的門)
+class ZoneDeviceLink(SQLModel, table=True):
+    zone_id: Optional[int] = Field(default=None, foreign_key="zone.id", primary_key=True)
+    device_id: Optional[int] = Field(default=None, foreign_key="device.id", primary_key=True, index=True)
+
+class Zone(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+    description: Optional[str] = None
+    capacity: Optional[int] = None  # 人數上限，未設定表示不限
+
+    devices: List[Device] = Relationship(link_model=ZoneDeviceLink)
+
+# 在場人員快照 (定期由記憶體寫回，重啟後還原)
+class ZoneOccupant(SQLModel, table=True):
+    zone_id: int = Field(foreign_key="zone.id", primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    entered_at: datetime = Field(default_factory=datetime.now)
+
+# User Group (使用者群組，以群組授權整個 Zone)
+class UserGroupLink(SQLModel, table=True):
+    group_id: Optional[int] = Field(default=None, foreign_key="usergroup.id", primary_key=True)
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", primary_key=True, index=True)
+
+class GroupZoneGrant(SQLModel, table=True):
+    group_id: Optional[int] = Field(default=None, foreign_key="usergroup.id", primary_key=True)
+    zone_id: Optional[int] = Field(default=None, foreign_key="zone.id", primary_key=True, index=True)
+    schedule_id: Optional[int] = Field(default=None, foreign_key="schedule.id")  # 未設定表示全天開放
+
+class UserGroup(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+    description: Optional[str] = None
+
+    users: List[User] = Relationship(link_model=UserGroupLink)
+    # 授權需帶時段，寫入時直接操作 GroupZoneGrant
+    zones: List[Zone] = Relationship(link_model=GroupZoneGrant, sa_relationship_kwargs={"viewonly": True})
+
+# 實際生效的 使用者→設備 權限 (由直接授權與群組授權累加，ref_count 為授權來源數)
+# schedule_id 為 0 表示不限時段
+class EffectivePermission(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    device_id: int = Field(foreign_key="device.id", primary_key=True, index=True)
+    schedule_id: int = Field(default=0, primary_key=True)
+    ref_count: int = Field(default=1)
+
+# 開放時段，rules 例如 [{"days": [0, 1, 2, 3, 4], "start": "08:00", "end": "22:00"}] (0 = 週一)
+class Schedule(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+    rules: List[dict] = Field(default_factory=list, sa_column=Column(JSON))
+
 # Card
 class Card(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     uid: str = Field(index=True, unique=True)
-    user_id: Optional[int] = Field(default=None, foreign_key="user.id")
+    user_id: Optional[int] = Field(default=None, foreign_key="user.id", index=True)
     is_active: bool = Field(default=True)
     owner: Optional[User] = Relationship(back_populates="cards")
 
@@ -71,12 +170,40 @@ class AccessLog(SQLModel, table=True):
     method: str
     status: str
     details: Optional[str] = None
+    # 結構化欄位 (舊資料由 backfill_access_logs.py 從 details 解析回填)
+    device_id: Optional[int] = Field(default=None, foreign_key="device.id", index=True, ondelete="SET NULL")
+    message: Optional[str] = None
+
+# 刷卡統計 (每小時、每台設備、每種結果的次數)，由寫入 AccessLog 時增量累加
+# device_id 為 0 表示無法對應設備；不設外鍵，設備刪除後仍保留歷史統計
+class AccessRollup(SQLModel, table=True):
+    bucket: datetime = Field(primary_key=True)
+    device_id: int = Field(primary_key=True)
+    status: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+# 每人每日刷卡次數 (排行榜用)
+class UserAccessRollup(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+    user_id: int = Field(primary_key=True, index=True)
+    status: str = Field(primary_key=True)
+    count: int = Field(default=0)
 
 # API Models
 class VerifyRequest(SQLModel):
     card_uid: str
     device_id: str
 
+# 離線日誌回補
+class JournalEntry(SQLModel):
+    seq: int
+    ts: int
+    card_uid: str
+
+class JournalRequest(SQLModel):
+    device_id: str
+    entries: List[JournalEntry]
+
 class AccessLogRead(SQLModel):
     id: int
     timestamp: datetime
@@ -84,4 +211,7 @@ class AccessLogRead(SQLModel):
     method: str
     status: str
     details: Optional[str]
-    user_name: Optional[str] = "Unknown"
\ No newline at end of file
+    device_id: Optional[int] = None
+    message: Optional[str] = None
+    user_name: Optional[str] = "Unknown"
+    device_name: Optional[str] = None
\ No newline at end of file
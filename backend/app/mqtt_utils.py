@@ -0,0 +1,70 @@
+import os
+import ssl
+import json
+import time
+import asyncio
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MQTT_BROKER = os.getenv("MQTT_BROKER")
+MQTT_PORT = int(os.getenv("MQTT_PORT"))
+MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+MQTT_PUBLISH_TIMEOUT = float(os.getenv("MQTT_PUBLISH_TIMEOUT", "5"))  # 秒，等待 Broker 確認 (PUBACK)
+
+# Bot 登入狀態快取失效通知
+BOT_INVALIDATE_TOPIC = "bot/invalidate"
+
+# 建立 MQTT Client (TLS)，aiomqtt 於第一次連線時才載入，縮短 worker 啟動時間
+def create_mqtt_client() -> "aiomqtt.Client":
+    import aiomqtt
+    # 建立 SSL Context
+    tls_context = ssl.create_default_context()
+    return aiomqtt.Client(
+        hostname=MQTT_BROKER, 
+        port=MQTT_PORT,
+        username=MQTT_USERNAME,
+        password=MQTT_PASSWORD,
+        tls_context=tls_context # 啟用 TLS
+    )
+
+# MQTT 開門函式
+async def trigger_mqtt_open(device_topic: str):
+    results = await trigger_mqtt_open_many([device_topic])
+    return results[device_topic]["success"]
+
+# 多門開門：共用一條連線併發送出，回傳每個主題的結果與延遲 (ms)
+async def trigger_mqtt_open_many(device_topics: list[str]) -> dict[str, dict]:
+    results = {}
+
+    async def publish(client: "aiomqtt.Client", topic: str):
+        start = time.perf_counter()
+        try:
+            # qos=1 會等到 Broker 回覆 PUBACK 才完成
+            await asyncio.wait_for(client.publish(topic, payload="OPEN", qos=1), MQTT_PUBLISH_TIMEOUT)
+            results[topic] = {"success": True}
+            print(f"[Backend] MQTT Sent OPEN to {topic}")
+        except Exception as e:
+            results[topic] = {"success": False, "error": str(e) or type(e).__name__}
+            print(f"[Backend] MQTT Error ({topic}): {e}")
+        results[topic]["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    try:
+        async with create_mqtt_client() as client:
+            await asyncio.gather(*(publish(client, topic) for topic in device_topics))
+    except Exception as e:
+        print(f"[Backend] MQTT Error: {e}")
+        for topic in device_topics:
+            results.setdefault(topic, {"success": False, "error": str(e), "latency_ms": None})
+    return results
+
+# 通知 Bot 清除指定帳號的登入狀態快取
+async def publish_bot_invalidation(telegram_ids: list[str]):
+    if not telegram_ids:
+        return
+    try:
+        async with create_mqtt_client() as client:
+            await client.publish(BOT_INVALIDATE_TOPIC, payload=json.dumps({"telegram_ids": telegram_ids}), qos=1)
+    except Exception as e:
+        print(f"[Backend] MQTT Invalidation Error: {e}")
@@ -0,0 +1,151 @@
+import asyncio
+import os
+from datetime import datetime
+from dotenv import load_dotenv
+from sqlmodel import select, delete
+from app.database import async_session, dialect_insert
+from app.models import ZoneOccupant
+from app.cache import bus, listeners
+
+load_dotenv()
+
+PERSIST_INTERVAL = int(os.getenv("OCCUPANCY_PERSIST_INTERVAL", "30"))  # 秒，寫回資料庫的間隔
+BATCH_SIZE = 1000
+CHANNEL = "occupancy"
+
+# 各 Zone 的在場人員，由刷卡成功的進/出門事件增量維護，查詢人數不需掃描 AccessLog
+# 事件格式 [kind, zone_ids, user_id]，kind 為 in / out / leave (使用者離開所有 Zone) / reset (清空 Zone)
+class OccupancyTracker:
+    def __init__(self):
+        self.present: dict[int, dict[int, datetime]] = {}  # zone_id -> {user_id: 進入時間}
+        self.dirty: set[int] = set()
+        self.entries = 0
+        self.exits = 0
+        self.denied = 0
+        self._task: asyncio.Task | None = None
+        self._session_factory = async_session
+        # 其他 worker 的事件經由快取匯流排同步
+        listeners[CHANNEL] = self.apply
+
+    def count(self, zone_id: int) -> int:
+        return len(self.present.get(zone_id, ()))
+
+    def counts(self) -> dict[int, int]:
+        return {zone_id: len(people) for zone_id, people in self.present.items()}
+
+    # 進門前檢查人數上限 (已在場者不受限)，回傳已額滿的 zone_id
+    def full_zone(self, zones: dict[int, int | None], user_id: int) -> int | None:
+        for zone_id, capacity in zones.items():
+            people = self.present.get(zone_id, {})
+            if capacity is not None and user_id not in people and len(people) >= capacity:
+                return zone_id
+        return None
+
+    # 通過 full_zone 檢查後立即在本 worker 佔用名額 (兩者之間沒有 await，同一 worker 並行的進門刷卡不會超收)
+    # 其他 worker 要等匯流排事件送達才會看到，因此多個 worker 時上限為軟性限制
+    # 回傳這次新佔用的 zone_id，寫入紀錄失敗時以 release 歸還
+    def reserve(self, zone_ids, user_id: int) -> list[int]:
+        added = [zone_id for zone_id in zone_ids if user_id not in self.present.get(zone_id, {})]
+        self.apply(["in", added, user_id])
+        return added
+
+    def release(self, zone_ids: list[int], user_id: int):
+        self.apply(["out", zone_ids, user_id])
+
+    def apply(self, event: list):
+        kind, zone_ids, user_id = event
+        if kind == "leave":
+            zone_ids = [z for z, people in self.present.items() if user_id in people]
+        for zone_id in zone_ids:
+            if kind == "reset":
+                self.present.pop(zone_id, None)
+            elif kind == "in":
+                self.present.setdefault(zone_id, {}).setdefault(user_id, datetime.now())
+            else:
+                self.present.get(zone_id, {}).pop(user_id, None)
+            self.dirty.add(zone_id)
+
+    async def publish(self, event: list):
+        self.apply(event)
+        await bus.publish(CHANNEL, event)
+
+    async def record(self, direction: str, zone_ids, user_id: int):
+        if direction == "in":
+            self.entries += 1
+        else:
+            self.exits += 1
+        await self.publish([direction, list(zone_ids), user_id])
+
+    async def reset(self, zone_id: int):
+        await self.publish(["reset", [zone_id], None])
+
+    async def remove_user(self, user_id: int):
+        await self.publish(["leave", [], user_id])
+
+    async def load(self):
+        async with self._session_factory() as session:
+            result = await session.execute(select(ZoneOccupant))
+            for row in result.scalars().all():
+                self.present.setdefault(row.zone_id, {})[row.user_id] = row.entered_at
+
+    # 每個 worker 都會寫入相同的快照：只刪除已離開的人，在場者以 upsert 寫入，並行寫入不會主鍵衝突
+    async def persist(self):
+        if not self.dirty:
+            return
+        zone_ids, self.dirty = self.dirty, set()
+        try:
+            async with self._session_factory() as session:
+                rows = []
+                for zone_id in sorted(zone_ids):
+                    people = self.present.get(zone_id, {})
+                    stmt = delete(ZoneOccupant).where(ZoneOccupant.zone_id == zone_id)
+                    if people:
+                        stmt = stmt.where(ZoneOccupant.user_id.not_in(list(people)))
+                    await session.execute(stmt)
+                    rows += [
+                        {"zone_id": zone_id, "user_id": user_id, "entered_at": entered_at}
+                        for user_id, entered_at in sorted(people.items())
+                    ]
+                insert = dialect_insert(session)
+                for i in range(0, len(rows), BATCH_SIZE):
+                    stmt = insert(ZoneOccupant).values(rows[i:i + BATCH_SIZE])
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["zone_id", "user_id"],
+                        set_={"entered_at": stmt.excluded.entered_at}
+                    )
+                    await session.execute(stmt)
+                await session.commit()
+        except Exception:
+            # 寫入失敗，下次重試
+            self.dirty |= zone_ids
+            raise
+
+    async def _persist_loop(self):
+        while True:
+            await asyncio.sleep(PERSIST_INTERVAL)
+            try:
+                await self.persist()
+            except Exception as e:
+                print(f"[Occupancy] Persist Error: {e}")
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._persist_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.persist()
+
+    def metrics(self) -> dict:
+        return {
+            "zones": len(self.present),
+            "present": sum(len(people) for people in self.present.values()),
+            "entries": self.entries,
+            "exits": self.exits,
+            "denied_capacity": self.denied,
+        }
+
+occupancy = OccupancyTracker()
@@ -0,0 +1,154 @@
+from collections import Counter
+from sqlmodel import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import dialect_insert
+from app.models import (
+    Device, UserDeviceLink, ZoneDeviceLink, UserGroupLink, GroupZoneGrant, EffectivePermission
+)
+
+# 實際權限表 (EffectivePermission) 的增量維護
+# 每一條授權路徑 (直接授權，或 群組→Zone→設備) 讓 (user, device, schedule) 的 ref_count +1，
+# 移除時 -1，歸零即刪除。所有函式只寫入 session，由呼叫端 commit，與來源資料在同一個交易內。
+
+BATCH_SIZE = 1000
+ALWAYS = 0  # 不限時段的 schedule_id
+
+# delta: Counter[(user_id, device_id, schedule_id)] -> ref_count 增減
+async def apply_delta(session: AsyncSession, delta: Counter):
+    rows = [{"user_id": u, "device_id": d, "schedule_id": s, "ref_count": c} for (u, d, s), c in delta.items() if c]
+    if not rows:
+        return
+    insert = dialect_insert(session)
+    for i in range(0, len(rows), BATCH_SIZE):
+        stmt = insert(EffectivePermission).values(rows[i:i + BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "device_id", "schedule_id"],
+            set_={"ref_count": EffectivePermission.ref_count + stmt.excluded.ref_count}
+        )
+        await session.execute(stmt)
+    # 只清理這次有減少的使用者 (走主鍵索引)
+    users = {r["user_id"] for r in rows if r["ref_count"] < 0}
+    if users:
+        await session.execute(
+            delete(EffectivePermission)
+            .where(EffectivePermission.user_id.in_(users), EffectivePermission.ref_count <= 0)
+        )
+
+# Zone 目前授權到的 (使用者, 時段) (同一人經由多個群組取得同一 Zone 時重複計數)
+async def zone_users(session: AsyncSession, zone_id: int) -> Counter:
+    result = await session.execute(
+        select(UserGroupLink.user_id, GroupZoneGrant.schedule_id)
+        .join(GroupZoneGrant, GroupZoneGrant.group_id == UserGroupLink.group_id)
+        .where(GroupZoneGrant.zone_id == zone_id)
+    )
+    return Counter((u, s or ALWAYS) for u, s in result.all())
+
+# 群組經由 Zone 取得的 (設備, 時段) (同一設備屬於多個 Zone 時重複計數)
+async def group_devices(session: AsyncSession, group_id: int) -> Counter:
+    result = await session.execute(
+        select(ZoneDeviceLink.device_id, GroupZoneGrant.schedule_id)
+        .join(GroupZoneGrant, GroupZoneGrant.zone_id == ZoneDeviceLink.zone_id)
+        .where(GroupZoneGrant.group_id == group_id)
+    )
+    return Counter((d, s or ALWAYS) for d, s in result.all())
+
+async def zone_devices(session: AsyncSession, zone_id: int) -> Counter:
+    result = await session.execute(select(ZoneDeviceLink.device_id).where(ZoneDeviceLink.zone_id == zone_id))
+    return Counter(result.scalars().all())
+
+async def group_users(session: AsyncSession, group_id: int) -> Counter:
+    result = await session.execute(select(UserGroupLink.user_id).where(UserGroupLink.group_id == group_id))
+    return Counter(result.scalars().all())
+
+# 使用者直接授權的設備變更 (直接授權不限時段)
+async def direct_devices_changed(session: AsyncSession, user_id: int, old: set[int], new: set[int]):
+    delta = Counter()
+    for d in new - old:
+        delta[(user_id, d, ALWAYS)] += 1
+    for d in old - new:
+        delta[(user_id, d, ALWAYS)] -= 1
+    await apply_delta(session, delta)
+
+# Zone 內的設備變更
+async def zone_devices_changed(session: AsyncSession, zone_id: int, old: set[int], new: set[int]):
+    delta = Counter()
+    for (u, s), n in (await zone_users(session, zone_id)).items():
+        for d in new - old:
+            delta[(u, d, s)] += n
+        for d in old - new:
+            delta[(u, d, s)] -= n
+    await apply_delta(session, delta)
+
+# 群組成員變更
+async def group_users_changed(session: AsyncSession, group_id: int, old: set[int], new: set[int]):
+    delta = Counter()
+    for (d, s), n in (await group_devices(session, group_id)).items():
+        for u in new - old:
+            delta[(u, d, s)] += n
+        for u in old - new:
+            delta[(u, d, s)] -= n
+    await apply_delta(session, delta)
+
+# 群組授權的 Zone 或時段變更，old/new 為 {zone_id: schedule_id}
+async def group_grants_changed(session: AsyncSession, group_id: int, old: dict[int, int | None], new: dict[int, int | None]):
+    users = await group_users(session, group_id)
+    delta = Counter()
+    for zone_id, schedule_id in old.items():
+        if zone_id in new and new[zone_id] == schedule_id:
+            continue
+        for d, nd in (await zone_devices(session, zone_id)).items():
+            for u, nu in users.items():
+                delta[(u, d, schedule_id or ALWAYS)] -= nu * nd
+    for zone_id, schedule_id in new.items():
+        if zone_id in old and old[zone_id] == schedule_id:
+            continue
+        for d, nd in (await zone_devices(session, zone_id)).items():
+            for u, nu in users.items():
+                delta[(u, d, schedule_id or ALWAYS)] += nu * nd
+    await apply_delta(session, delta)
+
+async def remove_user(session: AsyncSession, user_id: int):
+    await session.execute(delete(UserGroupLink).where(UserGroupLink.user_id == user_id))
+    await session.execute(delete(EffectivePermission).where(EffectivePermission.user_id == user_id))
+
+async def remove_device(session: AsyncSession, device_id: int):
+    await session.execute(delete(ZoneDeviceLink).where(ZoneDeviceLink.device_id == device_id))
+    await session.execute(delete(EffectivePermission).where(EffectivePermission.device_id == device_id))
+
+# 使用者實際可進入的設備與各自的時段 (單一索引查詢)
+async def user_grants(session: AsyncSession, user_id: int) -> dict[int, frozenset[int]]:
+    result = await session.execute(
+        select(EffectivePermission.device_id, EffectivePermission.schedule_id)
+        .where(EffectivePermission.user_id == user_id)
+    )
+    grants: dict[int, set[int]] = {}
+    for d, s in result.all():
+        grants.setdefault(d, set()).add(s)
+    return {d: frozenset(s) for d, s in grants.items()}
+
+async def user_devices(session: AsyncSession, user_id: int) -> list[tuple[Device, frozenset[int]]]:
+    result = await session.execute(
+        select(Device, EffectivePermission.schedule_id)
+        .join(EffectivePermission, EffectivePermission.device_id == Device.id)
+        .where(EffectivePermission.user_id == user_id)
+        .order_by(Device.id)
+    )
+    devices: dict[int, tuple[Device, set[int]]] = {}
+    for device, s in result.all():
+        devices.setdefault(device.id, (device, set()))[1].add(s)
+    return [(device, frozenset(s)) for device, s in devices.values()]
+
+# 由來源資料完整重建 (首次升級或資料修復用)
+async def rebuild(session: AsyncSession) -> int:
+    await session.execute(delete(EffectivePermission))
+    delta = Counter()
+    result = await session.execute(select(UserDeviceLink.user_id, UserDeviceLink.device_id))
+    delta.update((u, d, ALWAYS) for u, d in result.all())
+    result = await session.execute(
+        select(UserGroupLink.user_id, ZoneDeviceLink.device_id, GroupZoneGrant.schedule_id)
+        .join(GroupZoneGrant, GroupZoneGrant.group_id == UserGroupLink.group_id)
+        .join(ZoneDeviceLink, ZoneDeviceLink.zone_id == GroupZoneGrant.zone_id)
+    )
+    delta.update((u, d, s or ALWAYS) for u, d, s in result.all())
+    await apply_delta(session, delta)
+    return len(delta)
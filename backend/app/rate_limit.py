@@ -0,0 +1,101 @@
+import os
+import math
+import time
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_KEYS = 10000  # 每個限制器最多追蹤的 key 數
+TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true"  # 位於 Nginx 後方時讀取 X-Forwarded-For
+
+# 解析 "次數/秒數"，例如 "20/60" 表示每 60 秒 20 次 (可瞬間用完)
+def parse_limit(value: str) -> tuple[float, float]:
+    count, period = value.split("/")
+    return float(count), float(period)
+
+# Token Bucket 限流器，依 key (device_id、telegram_id、IP) 各自計算
+class RateLimiter:
+    def __init__(self, name: str, limit: str):
+        self.name = name
+        self.burst, period = parse_limit(limit)
+        self.rate = self.burst / period  # 每秒補充的 token 數
+        self.buckets: dict[str, list[float]] = {}  # key -> [tokens, updated]
+        self.allowed = 0
+        self.throttled = 0
+
+    def _evict(self, now: float):
+        # 先移除已補滿 (閒置) 的 bucket，仍超過上限則移除最早建立的
+        for key in [k for k, (tokens, updated) in self.buckets.items() if tokens + (now - updated) * self.rate >= self.burst]:
+            del self.buckets[key]
+        while len(self.buckets) >= MAX_KEYS:
+            del self.buckets[next(iter(self.buckets))]
+
+    # 消耗一個 token，回傳需等待的秒數 (0 表示允許)
+    def hit(self, key: str) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= MAX_KEYS:
+                self._evict(now)
+            bucket = self.buckets[key] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            self.allowed += 1
+            return 0
+        bucket[0] = tokens
+        self.throttled += 1
+        return (1 - tokens) / self.rate
+
+    def check(self, key: str):
+        retry_after = self.hit(key)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Too Many Requests",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    def metrics(self) -> dict:
+        return {
+            "limit": f"{self.burst:g}/{self.burst / self.rate:g}",
+            "keys": len(self.buckets),
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+        }
+
+ip_limiter = RateLimiter("ip", os.getenv("RATE_LIMIT_IP", "120/60"))
+device_limiter = RateLimiter("device", os.getenv("RATE_LIMIT_DEVICE", "30/60"))
+telegram_limiter = RateLimiter("telegram", os.getenv("RATE_LIMIT_TELEGRAM", "20/60"))
+limiters = [ip_limiter, device_limiter, telegram_limiter]
+
+def client_ip(request: Request) -> str:
+    if TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+async def body_field(request: Request, field: str) -> str | None:
+    if request.method not in ("POST", "PUT", "PATCH"):
+        return None
+    try:
+        # Starlette 會快取解析結果，路由本身不會重複讀取 body
+        data = await request.json()
+    except ValueError:
+        return None
+    value = data.get(field) if isinstance(data, dict) else None
+    return str(value) if value is not None else None
+
+# 設備端點：驗證 Token 與查詢資料庫之前先依 IP 限流
+# device_id 由請求內容提供、尚未驗證，其額度在設備驗證成功後才扣除 (避免他人以偽造請求耗盡某扇門的額度)
+async def limit_device(request: Request):
+    ip_limiter.check(client_ip(request))
+
+# Bot 端點：請求皆來自 Bot 主機，依 telegram_id 限流
+async def limit_telegram(request: Request):
+    telegram_id = await body_field(request, "telegram_id")
+    if telegram_id:
+        telegram_limiter.check(telegram_id)
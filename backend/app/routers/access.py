@@ -1,62 +1,168 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from fastapi.responses import StreamingResponse
-from sqlmodel import select
+from sqlmodel import select, update
+from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_session
-from app.models import User, Card, AccessLog, Device, VerifyRequest, AccessLogRead, Admin
+from app.database import get_session, get_read_session
+from app.models import User, Card, AccessLog, Device, VerifyRequest, AccessLogRead, Admin, JournalRequest, Zone, ZoneDeviceLink
 from app.routers.devices import verify_token
 from app.auth import get_current_admin
+from app.rate_limit import limit_device, device_limiter
+from app.cache import device_cache, card_cache, MISS
+from app import permissions
+from app.schedules import allowed_now
+from app.occupancy import occupancy
+from app.analytics import analytics
+from app.responses import parse_fields, as_dicts, json_response
+from app.signing import signatures, SignatureError, body_digest
+from datetime import datetime
 import csv
 import io
+import hashlib
 
 router = APIRouter(prefix="/access", tags=["Access"])
 
-# 刷卡驗證
-@router.post("/verify")
-async def verify_access(
-    req: VerifyRequest, 
-    x_device_token: str = Header(..., alias="x-device-token"),
-    session: AsyncSession = Depends(get_session)
-):
-    # 驗證設備
-    result = await session.execute(select(Device).where(Device.device_name == req.device_id))
-    device = result.scalars().first()
+# 設備未校時的時間戳記 (早於 2020-01-01) 視為無效
+MIN_DEVICE_TS = 1577836800
+
+# 快取的設備資料 (不持有 ORM 物件，可跨 session 使用)
+class CachedDevice:
+    def __init__(self, device: Device, zones: dict[int, int | None]):
+        self.id = device.id
+        self.device_name = device.device_name
+        self.token = device.token
+        self.is_active = device.is_active
+        self.direction = device.direction
+        self.hmac_key = device.hmac_key  # 有金鑰的設備必須以簽章驗證
+        self.zones = zones  # 所屬 zone_id -> 人數上限
+        self.verified: set[str] = set()  # 已通過 argon2 驗證的 token 摘要 (sha256)
+
+# 快取的卡片權限
+class CardAccess:
+    def __init__(self, card: Card, user: User | None, grants: dict[int, frozenset[int]]):
+        self.card_active = card.is_active
+        self.user_id = user.id if user else None
+        self.user_name = user.name if user else None
+        self.student_id = user.student_id if user else None
+        self.user_active = user.is_active if user else False
+        self.grants = grants  # device_id -> 授權時段 (schedule_id)
+
+# 設備憑證：舊韌體帶 x-device-token，簽章模式帶 x-device-timestamp / x-device-nonce / x-device-signature
+class DeviceCredentials:
+    def __init__(self, token: str | None, timestamp: str | None, nonce: str | None, signature: str | None):
+        self.token = token
+        self.timestamp = timestamp
+        self.nonce = nonce
+        self.signature = signature
+
+def device_credentials(
+    x_device_token: str | None = Header(None, alias="x-device-token"),
+    x_device_timestamp: str | None = Header(None, alias="x-device-timestamp"),
+    x_device_nonce: str | None = Header(None, alias="x-device-nonce"),
+    x_device_signature: str | None = Header(None, alias="x-device-signature"),
+) -> DeviceCredentials:
+    return DeviceCredentials(x_device_token, x_device_timestamp, x_device_nonce, x_device_signature)
+
+# 驗證設備 (subject 為簽章涵蓋的內容：卡號或請求內容摘要)
+async def authenticate_device(session: AsyncSession, device_id: str, credentials: DeviceCredentials, subject: str) -> CachedDevice:
+    device = device_cache.get(device_id)
+    if device is MISS:
+        result = await session.execute(select(Device).where(Device.device_name == device_id))
+        row = result.scalars().first()
+        device = None
+        if row:
+            zones = await session.execute(
+                select(Zone.id, Zone.capacity)
+                .join(ZoneDeviceLink, ZoneDeviceLink.zone_id == Zone.id)
+                .where(ZoneDeviceLink.device_id == row.id)
+            )
+            device = CachedDevice(row, {zone_id: capacity for zone_id, capacity in zones.all()})
+        device_cache.set(device_id, device)
     
     if not device:
         raise HTTPException(status_code=401, detail="Invalid Device ID")
 
-    if not verify_token(x_device_token, device.token):
-        print(f"SECURITY WARNING: Invalid token used for device {req.device_id}")
-        raise HTTPException(status_code=401, detail="Invalid Device Token")
-    
+    if device.hmac_key:
+        # 簽章模式：HMAC 只需數微秒，並以時間窗與 nonce 防止重送
+        if not credentials.signature:
+            raise HTTPException(status_code=401, detail="Device Signature Required")
+        try:
+            await signatures.verify(device.hmac_key, device_id, subject, credentials.timestamp or "", credentials.nonce or "", credentials.signature)
+        except SignatureError as e:
+            print(f"SECURITY WARNING: {e} for device {device_id}")
+            raise HTTPException(status_code=401, detail=str(e))
+    else:
+        if not credentials.token:
+            raise HTTPException(status_code=401, detail="Missing Device Token")
+        # 同一組 Token 驗證過一次後，快取有效期間內不再重算 argon2
+        digest = hashlib.sha256(credentials.token.encode()).hexdigest()
+        if digest not in device.verified:
+            if not await verify_token(credentials.token, device.token):
+                print(f"SECURITY WARNING: Invalid token used for device {device_id}")
+                raise HTTPException(status_code=401, detail="Invalid Device Token")
+            device.verified.add(digest)
+
+    # 通過驗證後才扣除該設備的限流額度
+    device_limiter.check(device_id)
     if not device.is_active:
         raise HTTPException(status_code=403, detail="Device is disabled")
+    return device
 
-    # 驗證使用者
-    card_result = await session.execute(select(Card).where(Card.uid == req.card_uid))
+async def load_card_access(session: AsyncSession, card_uid: str) -> CardAccess | None:
+    access = card_cache.get(card_uid)
+    if access is not MISS:
+        return access
+    card_result = await session.execute(select(Card).where(Card.uid == card_uid))
     card = card_result.scalars().first()
+    access = None
+    if card:
+        user = await session.get(User, card.user_id) if card.user_id is not None else None
+        # 直接授權與群組授權都已展開在 EffectivePermission，一次索引查詢即可
+        grants = await permissions.user_grants(session, user.id) if user else {}
+        access = CardAccess(card, user, grants)
+    card_cache.set(card_uid, access)
+    return access
+
+# 刷卡驗證
+@router.post("/verify", dependencies=[Depends(limit_device)])
+async def verify_access(
+    req: VerifyRequest, 
+    credentials: DeviceCredentials = Depends(device_credentials),
+    session: AsyncSession = Depends(get_session)
+):
+    # 驗證設備
+    device = await authenticate_device(session, req.device_id, credentials, req.card_uid)
+
+    # 驗證使用者
+    access = await load_card_access(session, req.card_uid)
     
     access_granted = False
     message = "Access Denied"
     user_id = None
-    user = None
     log_status = "DENIED"
+    reserved: list[int] = []
 
-    if card and card.is_active:
-        user_res = await session.execute(select(User).where(User.id == card.user_id))
-        user = user_res.scalars().first()
-        
-        if user:
-            user_id = user.id
-            if user.is_active:
-                await session.refresh(user, ["accessible_devices"])
-                if device in user.accessible_devices:
-                    access_granted = True
-                    message = f"Welcome, {user.name}"
-                    log_status = "SUCCESS"
-                else:
+    if access and access.card_active:
+        if access.user_id is not None:
+            user_id = access.user_id
+            if access.user_active:
+                schedule_ids = access.grants.get(device.id)
+                if schedule_ids is None:
                     message = "No Permission for this door"
                     log_status = "DENIED_DEVICE"
+                elif not await allowed_now(session, schedule_ids):
+                    message = "Outside access hours"
+                    log_status = "DENIED_SCHEDULE"
+                elif device.direction == "in" and occupancy.full_zone(device.zones, user_id) is not None:
+                    occupancy.denied += 1
+                    message = "Zone is full"
+                    log_status = "DENIED_CAPACITY"
+                else:
+                    if device.direction == "in":
+                        reserved = occupancy.reserve(device.zones, user_id)
+                    access_granted = True
+                    message = f"Welcome, {access.user_name}"
+                    log_status = "SUCCESS"
             else:
                 message = "User Inactive"
                 log_status = "DENIED_USER_INACTIVE"
@@ -72,45 +178,134 @@ async def verify_access(
         card_uid=req.card_uid,
         method="RFID",
         status=log_status,
-        details=f"Device: {req.device_id} | {message}"
+        details=f"Device: {req.device_id} | {message}",
+        device_id=device.id,
+        message=message
     )
     session.add(log)
-    await session.commit()
+    try:
+        await session.commit()
+    except Exception:
+        occupancy.release(reserved, user_id)
+        raise
+    analytics.record(log)
+
+    # 進/出門刷卡成功才更新在場人數 (其他 worker 經由匯流排同步)
+    if access_granted and device.direction and device.zones:
+        await occupancy.record(device.direction, device.zones, user_id)
 
     return {
         "access": access_granted,
         "message": message,
-        "user_name": user.name if user else "Unknown",
-        "student_id": user.student_id if user else ""
+        "user_name": access.user_name if access and access.user_name else "Unknown",
+        "student_id": access.student_id if access and access.student_id else ""
     }
 
+# 回補設備離線期間的刷卡紀錄
+# 回應遺失時設備會重送同一批，seq 不大於 Device.journal_seq 的紀錄直接略過；
+# 整批 seq 都小於 journal_seq 表示設備 Flash 被清除後重新編號，改為全部寫入
+@router.post("/journal", dependencies=[Depends(limit_device)])
+async def upload_journal(
+    req: JournalRequest,
+    request: Request,
+    credentials: DeviceCredentials = Depends(device_credentials),
+    session: AsyncSession = Depends(get_session)
+):
+    device = await authenticate_device(session, req.device_id, credentials, body_digest(await request.body()))
+
+    if not req.entries:
+        return {"ok": True, "accepted": 0, "last_seq": None}
+    last_seq = max(e.seq for e in req.entries)
+
+    seen = (await session.execute(select(Device.journal_seq).where(Device.id == device.id))).scalar_one()
+    floor = seen
+    if last_seq < seen:
+        print(f"[Journal] {req.device_id} seq reset ({last_seq} < {seen}), accepting batch")
+        floor = 0
+    entries = [e for e in req.entries if e.seq > floor]
+    if not entries:
+        return {"ok": True, "accepted": 0, "last_seq": last_seq}
+    # 以 compare-and-set 更新 high-water mark，同一批並行送達時只有一個請求寫入
+    result = await session.execute(
+        update(Device)
+        .where(Device.id == device.id, Device.journal_seq == seen)
+        .values(journal_seq=last_seq)
+    )
+    if result.rowcount != 1:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="Journal upload in progress")
+
+    # 一次查出所有卡片的持有者
+    uids = {e.card_uid for e in entries}
+    card_result = await session.execute(select(Card).where(Card.uid.in_(uids)))
+    owner_map = {c.uid: c.user_id for c in card_result.scalars().all()}
+
+    logs = []
+    for entry in entries:
+        if entry.ts >= MIN_DEVICE_TS:
+            timestamp = datetime.fromtimestamp(entry.ts)
+            note = f"Offline swipe #{entry.seq}"
+        else:
+            timestamp = datetime.now()
+            note = f"Offline swipe #{entry.seq} (device clock unsynced)"
+        logs.append(AccessLog(
+            timestamp=timestamp,
+            user_id=owner_map.get(entry.card_uid),
+            card_uid=entry.card_uid,
+            method="RFID",
+            status="DENIED_OFFLINE",
+            details=f"Device: {req.device_id} | {note}",
+            device_id=device.id,
+            message=note
+        ))
+    session.add_all(logs)
+    await session.commit()
+    for log in logs:
+        analytics.record(log)
+
+    return {"ok": True, "accepted": len(logs), "last_seq": last_seq}
+
 # 讀取 Log
+# 紀錄列表可回傳的欄位 (姓名與設備名稱以 JOIN 取得)
+LOG_FIELDS = {
+    "id": AccessLog.id,
+    "timestamp": AccessLog.timestamp,
+    "card_uid": AccessLog.card_uid,
+    "method": AccessLog.method,
+    "status": AccessLog.status,
+    "details": AccessLog.details,
+    "device_id": AccessLog.device_id,
+    "message": AccessLog.message,
+    "user_name": func.coalesce(User.name, "Unknown"),
+    "device_name": Device.device_name,
+}
+
+# 取得刷卡紀錄，fields=id,timestamp,... 可只取需要的欄位
 @router.get("/logs", response_model=list[AccessLogRead])
 async def read_logs(
+    request: Request,
     limit: int = 50, 
-    session: AsyncSession = Depends(get_session),
+    device_id: int | None = None,
+    fields: str | None = None,
+    session: AsyncSession = Depends(get_read_session),
     current_admin: Admin = Depends(get_current_admin)
 ):
-    statement = select(AccessLog).order_by(AccessLog.timestamp.desc()).limit(limit)
+    names = parse_fields(fields, LOG_FIELDS)
+    statement = select(*(LOG_FIELDS[name] for name in names)).select_from(AccessLog)
+    if "user_name" in names:
+        statement = statement.outerjoin(User, User.id == AccessLog.user_id)
+    if "device_name" in names:
+        statement = statement.outerjoin(Device, Device.id == AccessLog.device_id)
+    statement = statement.order_by(AccessLog.timestamp.desc()).limit(limit)
+    if device_id is not None:
+        statement = statement.where(AccessLog.device_id == device_id)
     result = await session.execute(statement)
-    logs = result.scalars().all()
-    
-    response_data = []
-    for log in logs:
-        user_name = "Unknown"
-        if log.user_id:
-            u = await session.get(User, log.user_id)
-            if u: user_name = u.name
-        
-        response_data.append(AccessLogRead(
-            **log.model_dump(), user_name=user_name
-        ))
-    return response_data
+    return await json_response(request, as_dicts(names, result.all()))
 
 # 匯出 CSV
 @router.get("/export")
 async def export_logs(
-    session: AsyncSession = Depends(get_session),
+    session: AsyncSession = Depends(get_read_session),
     current_admin: Admin = Depends(get_current_admin)
 ):
     statement = select(AccessLog).order_by(AccessLog.timestamp.desc())
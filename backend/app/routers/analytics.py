@@ -0,0 +1,112 @@
+from typing import Optional
+from collections import Counter
+from datetime import datetime, date, timedelta
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import select
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_read_session
+from app.models import AccessRollup, UserAccessRollup, Device, User
+from app.analytics import hour_of
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+DIMENSIONS = ("hour", "day", "device", "status")
+MAX_RANGE = timedelta(days=366)
+
+def parse_dimensions(group_by: str) -> list[str]:
+    dims = [d.strip() for d in group_by.split(",") if d.strip()]
+    if any(d not in DIMENSIONS for d in dims) or ("hour" in dims and "day" in dims):
+        raise HTTPException(status_code=400, detail=f"group_by must be a combination of {', '.join(DIMENSIONS)} (hour and day are exclusive)")
+    return dims
+
+def check_range(start, end):
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > MAX_RANGE:
+        raise HTTPException(status_code=400, detail="Range too large (max 366 days)")
+
+async def device_names(session: AsyncSession, ids) -> dict[int, str]:
+    ids = [i for i in ids if i]
+    if not ids:
+        return {}
+    result = await session.execute(select(Device.id, Device.device_name).where(Device.id.in_(ids)))
+    return dict(result.all())
+
+# 刷卡次數統計，只讀取每小時彙總表
+# 例：group_by=hour,device (每小時每扇門)、group_by=status&start=... (本週各拒絕原因)
+@router.get("/access")
+async def access_stats(
+    start: datetime,
+    end: Optional[datetime] = None,
+    group_by: str = "hour",
+    device_id: Optional[int] = None,
+    status: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    end = end or datetime.now()
+    check_range(start, end)
+    dims = parse_dimensions(group_by)
+
+    statement = select(AccessRollup).where(AccessRollup.bucket >= hour_of(start), AccessRollup.bucket < end)
+    if device_id is not None:
+        statement = statement.where(AccessRollup.device_id == device_id)
+    if status:
+        statement = statement.where(AccessRollup.status == status)
+    result = await session.execute(statement)
+
+    totals = Counter()
+    for row in result.scalars().all():
+        values = {"hour": row.bucket, "day": row.bucket.date(), "device": row.device_id, "status": row.status}
+        totals[tuple(values[d] for d in dims)] += row.count
+
+    names = await device_names(session, {key[dims.index("device")] for key in totals}) if "device" in dims else {}
+    rows = []
+    for key in sorted(totals):
+        row = {}
+        for dim, value in zip(dims, key):
+            if dim == "device":
+                row["device_id"] = value
+                row["device_name"] = names.get(value)
+            else:
+                row[dim] = value
+        row["count"] = totals[key]
+        rows.append(row)
+    return {"start": start, "end": end, "group_by": dims, "total": sum(totals.values()), "rows": rows}
+
+# 刷卡次數最多的使用者 (讀取每日彙總表)
+@router.get("/top-users")
+async def top_users(
+    start: date,
+    end: Optional[date] = None,
+    status: Optional[str] = "SUCCESS",
+    limit: int = 10,
+    session: AsyncSession = Depends(get_read_session)
+):
+    end = end or date.today() + timedelta(days=1)
+    check_range(start, end)
+    total = func.sum(UserAccessRollup.count).label("total")
+    statement = (
+        select(UserAccessRollup.user_id, total)
+        .where(UserAccessRollup.day >= start, UserAccessRollup.day < end)
+        .group_by(UserAccessRollup.user_id)
+        .order_by(total.desc())
+        .limit(min(limit, 100))
+    )
+    if status:
+        statement = statement.where(UserAccessRollup.status == status)
+    ranking = (await session.execute(statement)).all()
+
+    users = {}
+    if ranking:
+        result = await session.execute(select(User).where(User.id.in_([u for u, _ in ranking])))
+        users = {u.id: u for u in result.scalars().all()}
+    return [
+        {
+            "user_id": user_id,
+            "name": users[user_id].name if user_id in users else "Unknown",
+            "student_id": users[user_id].student_id if user_id in users else None,
+            "count": count
+        }
+        for user_id, count in ranking
+    ]
@@ -5,6 +5,7 @@ from sqlmodel import select
 from app.database import get_session
 from app.models import Admin
 from app.auth import verify_password, create_access_token, get_password_hash, get_current_admin
+from app.cache import admin_cache
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
@@ -21,7 +22,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     result = await session.execute(statement)
     admin = result.scalars().first()
     
-    if not admin or not verify_password(form_data.password, admin.hashed_password):
+    if not admin or not await verify_password(form_data.password, admin.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -38,11 +39,13 @@ async def change_password(
     current_admin: Admin = Depends(get_current_admin), 
     session: AsyncSession = Depends(get_session)
 ):
-    if not verify_password(req.old_password, current_admin.hashed_password):
+    if not await verify_password(req.old_password, current_admin.hashed_password):
         raise HTTPException(status_code=400, detail="舊密碼輸入錯誤")
     
-    current_admin.hashed_password = get_password_hash(req.new_password)
-    session.add(current_admin)
+    # current_admin 可能來自快取 (detached)，合併回目前的 session 再修改
+    admin = await session.merge(current_admin)
+    admin.hashed_password = await get_password_hash(req.new_password)
     await session.commit()
+    await admin_cache.invalidate(admin.username)
     
     return {"msg": "Password updated successfully"}
\ No newline at end of file
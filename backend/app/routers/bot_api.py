@@ -1,27 +1,24 @@
 import os
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException, Header, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Header
 from sqlmodel import select
-from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_session
 from app.models import User, Device, AccessLog
 from app.email_utils import send_verification_code
+from app.verification import verification_codes, CODE_TTL, VERIFY_MISSING, VERIFY_EXPIRED, VERIFY_LOCKED, VERIFY_INVALID
+from app.mqtt_utils import trigger_mqtt_open_many
+from app.rate_limit import limit_telegram
+from app import permissions
+from app.schedules import allowed_now
+from app.analytics import analytics
 from pydantic import BaseModel
-import secrets
-from datetime import datetime, timedelta
-import aiomqtt
-import ssl
 
 load_dotenv()
 
-router = APIRouter(prefix="/bot", tags=["Bot Integration"])
+router = APIRouter(prefix="/bot", tags=["Bot Integration"], dependencies=[Depends(limit_telegram)])
 
 BOT_SECRET = os.getenv("BOT_API_SECRET")
-MQTT_BROKER = os.getenv("MQTT_BROKER")
-MQTT_PORT = int(os.getenv("MQTT_PORT"))
-MQTT_USERNAME = os.getenv("MQTT_USERNAME")
-MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
 
 class BotLoginRequest(BaseModel):
     email: str
@@ -33,6 +30,10 @@ class BotVerifyRequest(BaseModel):
 
 class BotUnlockRequest(BaseModel):
     telegram_id: str
+    device_id: int | list[int] | None = None  # 單一門或多門，未指定時僅有一扇門才會直接開啟
+
+class BotDevicesRequest(BaseModel):
+    telegram_id: str
 
 class BotLogoutRequest(BaseModel):
     telegram_id: str
@@ -45,36 +46,20 @@ async def verify_bot_token(x_bot_token: str = Header(..., alias="x-bot-token")):
     if x_bot_token != BOT_SECRET:
         raise HTTPException(status_code=403, detail="Invalid Bot Token")
 
-# MQTT 開門函式
-async def trigger_mqtt_open(device_topic: str):
-    try:
-        # 建立 SSL Context
-        tls_context = ssl.create_default_context()
-        
-        async with aiomqtt.Client(
-            hostname=MQTT_BROKER, 
-            port=MQTT_PORT,
-            username=MQTT_USERNAME,
-            password=MQTT_PASSWORD,
-            tls_context=tls_context # 啟用 TLS
-        ) as client:
-            await client.publish(device_topic, payload="OPEN")
-            print(f"[Backend] MQTT Sent OPEN to {device_topic}")
-            return True
-    except Exception as e:
-        print(f"[Backend] MQTT Error: {e}")
-        return False
+# 登入狀態 (check-status 回應格式，Bot 端會快取)
+def login_status(user: User | None) -> dict:
+    if user:
+        return {"is_logged_in": True, "message": f"⚠️ 您已登入為：{user.name}\n若要切換帳號，請先執行 /logout。"}
+    return {"is_logged_in": False, "message": "尚未登入"}
 
 @router.post("/check-status", dependencies=[Depends(verify_bot_token)])
 async def bot_check_status(req: BotCheckStatusRequest, session: AsyncSession = Depends(get_session)):
     result = await session.execute(select(User).where(User.telegram_id == req.telegram_id))
     user = result.scalars().first()
-    if user:
-        return {"is_logged_in": True, "message": f"⚠️ 您已登入為：{user.name}\n若要切換帳號，請先執行 /logout。"}
-    return {"is_logged_in": False, "message": "尚未登入"}
+    return login_status(user)
 
 @router.post("/request-code", dependencies=[Depends(verify_bot_token)])
-async def bot_request_code(req: BotLoginRequest, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)):
+async def bot_request_code(req: BotLoginRequest, session: AsyncSession = Depends(get_session)):
     check_login = await session.execute(select(User).where(User.telegram_id == req.telegram_id))
     if check_login.scalars().first():
         return {"success": False, "message": "⚠️ 您已登入囉！"}
@@ -88,14 +73,13 @@ async def bot_request_code(req: BotLoginRequest, background_tasks: BackgroundTas
     if user.telegram_id and user.telegram_id != req.telegram_id:
         return {"success": False, "message": "⚠️ 此 Email 已被其他帳號綁定。"}
 
-    code = secrets.token_hex(3).upper()
-    user.verification_code = code
-    user.code_expires_at = datetime.now() + timedelta(minutes=3)
-    session.add(user)
-    await session.commit()
+    code = await verification_codes.issue(req.telegram_id, user.id)
+    if code is None:
+        return {"success": False, "message": "⚠️ 驗證碼已發送，請稍後再重新索取。"}
     
-    background_tasks.add_task(send_verification_code, req.email, code)
-    return {"success": True, "message": f"✅ 驗證碼已發送至 {req.email}。\n請在 3 分鐘內輸入: /code 進行驗證。"}
+    if not send_verification_code(req.email, code):
+        return {"success": False, "message": "⚠️ 系統忙碌中，請稍後再試。"}
+    return {"success": True, "message": f"✅ 驗證碼已發送至 {req.email}。\n請在 {CODE_TTL // 60} 分鐘內輸入: /code 進行驗證。"}
 
 @router.post("/verify-code", dependencies=[Depends(verify_bot_token)])
 async def bot_verify_code(req: BotVerifyRequest, session: AsyncSession = Depends(get_session)):
@@ -103,43 +87,122 @@ async def bot_verify_code(req: BotVerifyRequest, session: AsyncSession = Depends
     if check_login.scalars().first():
         return {"success": False, "message": "⚠️ 您已登入囉！"}
 
-    result = await session.execute(select(User).where(User.verification_code == req.code))
-    user = result.scalars().first()
-    
-    if not user:
+    result, user_id = await verification_codes.verify(req.telegram_id, req.code)
+    if result == VERIFY_MISSING:
+        return {"success": False, "message": "⚠️ 尚未索取驗證碼，請使用 /login 取得驗證碼。", "code_expired": True}
+    if result == VERIFY_EXPIRED:
+        return {"success": False, "message": "⚠️ 驗證碼已過期，請使用 /login 重新取得驗證碼。", "code_expired": True}
+    if result == VERIFY_LOCKED:
+        return {"success": False, "message": "⛔ 錯誤次數過多，驗證碼已失效，請使用 /login 重新取得驗證碼。", "code_expired": True}
+    if result == VERIFY_INVALID:
         return {"success": False, "message": "❌ 驗證碼錯誤。"}
-    if not user.code_expires_at or datetime.now() > user.code_expires_at:
-        return {"success": False, "message": "⚠️ 驗證碼已過期，請使用 /login 重新取得驗證碼。"}
+
+    user = await session.get(User, user_id)
+    if not user:
+        return {"success": False, "message": "❌ 找不到此帳號。"}
+    if user.telegram_id and user.telegram_id != req.telegram_id:
+        return {"success": False, "message": "⚠️ 此 Email 已被其他帳號綁定。"}
     
     user.telegram_id = req.telegram_id
-    user.verification_code = None
-    user.code_expires_at = None
     session.add(user)
     await session.commit()
-    return {"success": True, "message": f"🎉 綁定成功！你好 {user.name}。\n現在你可以使用 /unlock 進行遠端開門。"}
+    return {
+        "success": True,
+        "message": f"🎉 綁定成功！你好 {user.name}。\n現在你可以使用 /unlock 進行遠端開門。",
+        "status": login_status(user)
+    }
+
+async def get_bot_user(session: AsyncSession, telegram_id: str) -> User | None:
+    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+    return result.scalars().first()
+
+# 可遠端開啟的門 (Bot 以此建立選單)
+@router.post("/devices", dependencies=[Depends(verify_bot_token)])
+async def bot_devices(req: BotDevicesRequest, session: AsyncSession = Depends(get_session)):
+    user = await get_bot_user(session, req.telegram_id)
+
+    if not user: return {"success": False, "message": "❌ 尚未綁定，請先 /login。"}
+    if not user.is_active: return {"success": False, "message": "⛔ 帳號已被停用。"}
+
+    devices = [
+        {"id": d.id, "device_name": d.device_name, "location": d.location}
+        for d, _ in await permissions.user_devices(session, user.id) if d.is_active
+    ]
+    if not devices: return {"success": False, "message": "⚠️ 無任何門禁權限。"}
+    return {"success": True, "devices": devices}
 
 @router.post("/unlock", dependencies=[Depends(verify_bot_token)])
 async def bot_unlock(req: BotUnlockRequest, session: AsyncSession = Depends(get_session)):
-    statement = select(User).where(User.telegram_id == req.telegram_id).options(selectinload(User.accessible_devices))
-    result = await session.execute(statement)
-    user = result.scalars().first()
+    user = await get_bot_user(session, req.telegram_id)
     
     if not user: return {"success": False, "message": "❌ 尚未綁定，請先 /login。"}
     if not user.is_active: return {"success": False, "message": "⛔ 帳號已被停用。"}
-    if not user.accessible_devices: return {"success": False, "message": "⚠️ 無任何門禁權限。"}
 
-    target_device = user.accessible_devices[0]
-    mqtt_topic = f"door/{target_device.device_name}"
-    
-    is_sent = await trigger_mqtt_open(mqtt_topic)
-    
-    if is_sent:
-        log = AccessLog(user_id=user.id, method="TELEGRAM", status="SUCCESS", details=f"Remote unlock: {target_device.device_name}")
-        session.add(log)
-        await session.commit()
-        return {"success": True, "message": f"🟢 已發送開門指令至 [{target_device.device_name}]！"}
+    grants = [(d, s) for d, s in await permissions.user_devices(session, user.id) if d.is_active]
+    allowed = {d.id: d for d, _ in grants}
+    schedules = {d.id: s for d, s in grants}
+    if not allowed: return {"success": False, "message": "⚠️ 無任何門禁權限。"}
+
+    if req.device_id is None:
+        if len(allowed) > 1:
+            return {"success": False, "message": "⚠️ 請指定要開啟的門。"}
+        requested = list(allowed)
     else:
-        return {"success": False, "message": "❌ MQTT 連線失敗。"}
+        requested = list(dict.fromkeys(req.device_id if isinstance(req.device_id, list) else [req.device_id]))
+    if not requested: return {"success": False, "message": "⚠️ 請指定要開啟的門。"}
+
+    # 遠端開門同樣受開放時段限制
+    in_hours = {i for i in requested if i in allowed and await allowed_now(session, schedules[i])}
+    targets = [allowed[i] for i in requested if i in in_hours]
+    topics = {d.id: f"door/{d.device_name}" for d in targets}
+    sent = await trigger_mqtt_open_many(list(topics.values())) if targets else {}
+
+    def remote_log(status: str, name: str, message: str, device_id: int | None = None) -> AccessLog:
+        return AccessLog(
+            user_id=user.id, method="TELEGRAM", status=status,
+            details=f"Remote unlock: {name} | {message}", device_id=device_id, message=message
+        )
+
+    results, logs = [], []
+    for device_id in requested:
+        device = allowed.get(device_id)
+        if device is None:
+            results.append({"device_id": device_id, "device_name": None, "success": False, "latency_ms": None, "error": "No Permission"})
+            logs.append(remote_log("DENIED_DEVICE", f"device #{device_id}", "No Permission"))
+            continue
+        if device_id not in in_hours:
+            results.append({"device_id": device_id, "device_name": device.device_name, "success": False, "latency_ms": None, "error": "Outside access hours"})
+            logs.append(remote_log("DENIED_SCHEDULE", device.device_name, "Outside access hours", device_id))
+            continue
+        r = sent[topics[device_id]]
+        results.append({"device_id": device_id, "device_name": device.device_name, **r})
+        if r["success"]:
+            logs.append(remote_log("SUCCESS", device.device_name, f"{r['latency_ms']} ms", device_id))
+        else:
+            logs.append(remote_log("FAILED_MQTT", device.device_name, str(r.get('error')), device_id))
+
+    # 所有門的紀錄一次寫入
+    session.add_all(logs)
+    await session.commit()
+    for log in logs:
+        analytics.record(log)
+
+    lines = []
+    for r in results:
+        name = r["device_name"] or f"#{r['device_id']}"
+        if r["success"]:
+            lines.append(f"🟢 [{name}] 已發送開門指令 ({r['latency_ms']:.0f} ms)")
+        elif r["device_name"] is None:
+            lines.append(f"⛔ [{name}] 無此門權限")
+        elif r["error"] == "Outside access hours":
+            lines.append(f"⏰ [{name}] 目前不在開放時段")
+        else:
+            lines.append(f"❌ [{name}] MQTT 發送失敗")
+    return {
+        "success": any(r["success"] for r in results),
+        "message": "\n".join(lines),
+        "results": results
+    }
 
 @router.post("/logout", dependencies=[Depends(verify_bot_token)])
 async def bot_logout(req: BotLogoutRequest, session: AsyncSession = Depends(get_session)):
@@ -149,5 +212,5 @@ async def bot_logout(req: BotLogoutRequest, session: AsyncSession = Depends(get_
         user.telegram_id = None
         session.add(user)
         await session.commit()
-        return {"success": True, "message": "👋 已解除綁定。"}
-    return {"success": False, "message": "ℹ️ 尚未登入。"}
\ No newline at end of file
+        return {"success": True, "message": "👋 已解除綁定。", "status": login_status(None)}
+    return {"success": False, "message": "ℹ️ 尚未登入。", "status": login_status(None)}
\ No newline at end of file
@@ -1,30 +1,51 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_session
-from app.models import Device, DeviceReadPublic, DeviceReadWithToken, DeviceBase
+from app.database import get_session, get_read_session
+from app.models import Device, DeviceReadPublic, DeviceReadWithToken, DeviceReadWithStatus, DeviceBase, DeviceTelemetry
+from app.telemetry import telemetry_monitor
+from app.cache import device_cache, card_cache
+from app import permissions
 import secrets
-from pwdlib import PasswordHash
+from app.hashing import hasher
+from app.responses import parse_fields, json_response
+from app.signing import new_key
 
 router = APIRouter(prefix="/devices", tags=["Devices"])
 
-password_hash = PasswordHash.recommended()
+async def get_token_hash(token: str) -> str:
+    return await hasher.hash(token)
 
-def get_token_hash(token: str) -> str:
-    return password_hash.hash(token)
+async def verify_token(plain_token: str, hashed_token: str) -> bool:
+    return await hasher.verify(plain_token, hashed_token)
 
-def verify_token(plain_token: str, hashed_token: str) -> bool:
-    return password_hash.verify(plain_token, hashed_token)
+# 取得設備列表 (含即時連線狀態)
+# 設備列表可回傳的欄位，其餘欄位為記憶體中的心跳狀態
+DEVICE_COLUMNS = {name: getattr(Device, name) for name in DeviceReadPublic.model_fields if name != "signed"}
+DEVICE_COLUMNS["signed"] = Device.hmac_key.is_not(None)
+STATUS_FIELDS = tuple(name for name in DeviceReadWithStatus.model_fields if name not in DEVICE_COLUMNS)
+OFFLINE = {name: None for name in STATUS_FIELDS} | {"online": False}
 
-# 取得設備列表
-@router.get("/", response_model=list[DeviceReadPublic])
-async def read_devices(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(Device))
-    return result.scalars().all()
+# 取得設備列表，fields=id,device_name,... 可只取需要的欄位
+@router.get("/", response_model=list[DeviceReadWithStatus])
+async def read_devices(request: Request, fields: str | None = None, session: AsyncSession = Depends(get_read_session)):
+    names = parse_fields(fields, tuple(DeviceReadWithStatus.model_fields))
+    selected = [name for name in names if name in DEVICE_COLUMNS]
+    status = [name for name in names if name in STATUS_FIELDS]
+    result = await session.execute(select(Device.device_name, *(DEVICE_COLUMNS[name] for name in selected)))
+    items = []
+    for device_name, *values in result.all():
+        item = dict(zip(selected, values))
+        if status:
+            telemetry = OFFLINE | telemetry_monitor.get(device_name)
+            item.update((name, telemetry[name]) for name in status)
+        items.append({name: item[name] for name in names})
+    return await json_response(request, items)
 
 # 新增設備 (自動生成專屬 MQTT Topic)
+# signed=true 時另外產生 HMAC 金鑰，設備須改以簽章驗證 (見 app/signing.py)
 @router.post("/", response_model=DeviceReadWithToken)
-async def create_device(device_base: DeviceBase, session: AsyncSession = Depends(get_session)):
+async def create_device(device_base: DeviceBase, signed: bool = False, session: AsyncSession = Depends(get_session)):
     # 檢查名稱重複
     existing = await session.execute(select(Device).where(Device.device_name == device_base.device_name))
     if existing.scalars().first():
@@ -33,7 +54,7 @@ async def create_device(device_base: DeviceBase, session: AsyncSession = Depends
     # 產生原始 Token
     raw_token = secrets.token_hex(16)
     # 產生雜湊 Token
-    hashed_token = get_token_hash(raw_token)
+    hashed_token = await get_token_hash(raw_token)
     
     # 自動生成專屬 Topic: door/{設備名稱}
     unique_topic = f"door/{device_base.device_name}"
@@ -42,22 +63,17 @@ async def create_device(device_base: DeviceBase, session: AsyncSession = Depends
     db_device = Device(
         **device_base.model_dump(), 
         token=hashed_token,
-        mqtt_topic=unique_topic
+        mqtt_topic=unique_topic,
+        hmac_key=new_key() if signed else None
     )
     
     session.add(db_device)
     await session.commit()
     await session.refresh(db_device)
+    await device_cache.invalidate(db_device.device_name)
     
     # 回傳
-    return DeviceReadWithToken(
-        id=db_device.id,
-        device_name=db_device.device_name,
-        location=db_device.location,
-        is_active=db_device.is_active,
-        created_at=db_device.created_at,
-        token=raw_token
-    )
+    return DeviceReadWithToken.model_validate(db_device, update={"token": raw_token})
 
 # 修改設備 (連動修改 Topic)
 @router.put("/{device_id}", response_model=DeviceReadPublic)
@@ -72,16 +88,22 @@ async def update_device(device_id: int, device_data: DeviceBase, session: AsyncS
         if existing.scalars().first():
             raise HTTPException(status_code=400, detail="Device name already exists")
 
+    old_name = db_device.device_name
+
     # 更新欄位
     db_device.device_name = device_data.device_name
     db_device.location = device_data.location
     db_device.is_active = device_data.is_active
+    db_device.direction = device_data.direction
     
     db_device.mqtt_topic = f"door/{device_data.device_name}"
     
     session.add(db_device)
     await session.commit()
     await session.refresh(db_device)
+    await device_cache.invalidate(old_name)
+    if old_name != db_device.device_name:
+        await device_cache.invalidate(db_device.device_name)
     return db_device
 
 # 刪除設備
@@ -90,28 +112,30 @@ async def delete_device(device_id: int, session: AsyncSession = Depends(get_sess
     device = await session.get(Device, device_id)
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
+    telemetry = await session.get(DeviceTelemetry, device_id)
+    if telemetry:
+        await session.delete(telemetry)
+    await permissions.remove_device(session, device_id)
     await session.delete(device)
     await session.commit()
+    await device_cache.invalidate(device.device_name)
+    await card_cache.invalidate()
     return {"ok": True}
 
-# 重設 Token
+# 重設 Token (同時輪換 HMAC 金鑰；signed=false 則改回舊的 Token 模式)
 @router.post("/{device_id}/reset-token", response_model=DeviceReadWithToken)
-async def reset_device_token(device_id: int, session: AsyncSession = Depends(get_session)):
+async def reset_device_token(device_id: int, signed: bool = False, session: AsyncSession = Depends(get_session)):
     db_device = await session.get(Device, device_id)
     if not db_device:
         raise HTTPException(status_code=404, detail="Device not found")
     
     raw_token = secrets.token_hex(16)
-    db_device.token = get_token_hash(raw_token)
+    db_device.token = await get_token_hash(raw_token)
+    db_device.hmac_key = new_key() if signed else None
+    db_device.journal_seq = 0  # 重新佈建的設備離線日誌從頭編號
     
     session.add(db_device)
     await session.commit()
     await session.refresh(db_device)
-    return DeviceReadWithToken(
-        id=db_device.id,
-        device_name=db_device.device_name,
-        location=db_device.location,
-        is_active=db_device.is_active,
-        created_at=db_device.created_at,
-        token=raw_token
-    )
\ No newline at end of file
+    await device_cache.invalidate(db_device.device_name)
+    return DeviceReadWithToken.model_validate(db_device, update={"token": raw_token})
\ No newline at end of file
@@ -0,0 +1,158 @@
+from typing import Optional, List, Dict
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import select, delete
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_session
+from app.models import UserGroup, User, Zone, GroupZoneGrant, Schedule
+from app.cache import card_cache
+from app import permissions
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/groups", tags=["Groups"])
+
+class GroupRead(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    user_ids: List[int] = []
+    zone_ids: List[int] = []
+    zone_names: List[str] = []
+    zone_schedules: Dict[int, Optional[int]] = {}
+
+class GroupCreateUpdate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    user_ids: List[int] = []
+    zone_ids: List[int] = []
+    zone_schedules: Dict[int, Optional[int]] = {}  # zone_id -> schedule_id，未指定則不限時段
+
+def to_read(group: UserGroup, grants: Dict[int, Optional[int]]) -> GroupRead:
+    return GroupRead(
+        id=group.id,
+        name=group.name,
+        description=group.description,
+        user_ids=[u.id for u in group.users],
+        zone_ids=[z.id for z in group.zones],
+        zone_names=[z.name for z in group.zones],
+        zone_schedules={z.id: grants.get(z.id) for z in group.zones}
+    )
+
+async def load_group(session: AsyncSession, group_id: int) -> UserGroup:
+    result = await session.execute(
+        select(UserGroup)
+        .where(UserGroup.id == group_id)
+        .options(selectinload(UserGroup.users), selectinload(UserGroup.zones))
+        .execution_options(populate_existing=True)  # zones 為唯讀關聯，寫入授權後需重新載入
+    )
+    group = result.scalars().first()
+    if not group:
+        raise HTTPException(status_code=404, detail="Group not found")
+    return group
+
+async def load_by_ids(session: AsyncSession, model, ids: List[int]) -> list:
+    if not ids:
+        return []
+    result = await session.execute(select(model).where(model.id.in_(ids)))
+    return list(result.scalars().all())
+
+# 群組目前的授權 {zone_id: schedule_id}
+async def load_grants(session: AsyncSession, group_ids: List[int]) -> Dict[int, Dict[int, Optional[int]]]:
+    grants: Dict[int, Dict[int, Optional[int]]] = {gid: {} for gid in group_ids}
+    if not group_ids:
+        return grants
+    result = await session.execute(
+        select(GroupZoneGrant.group_id, GroupZoneGrant.zone_id, GroupZoneGrant.schedule_id)
+        .where(GroupZoneGrant.group_id.in_(group_ids))
+    )
+    for gid, zid, sid in result.all():
+        grants[gid][zid] = sid
+    return grants
+
+# 將請求轉為 {zone_id: schedule_id}，並確認 Zone 與時段皆存在
+async def resolve_grants(session: AsyncSession, group_in: GroupCreateUpdate) -> Dict[int, Optional[int]]:
+    zones = await load_by_ids(session, Zone, group_in.zone_ids)
+    grants = {z.id: group_in.zone_schedules.get(z.id) for z in zones}
+    schedule_ids = {s for s in grants.values() if s is not None}
+    if len(await load_by_ids(session, Schedule, list(schedule_ids))) != len(schedule_ids):
+        raise HTTPException(status_code=400, detail="Schedule not found")
+    return grants
+
+async def write_grants(session: AsyncSession, group_id: int, grants: Dict[int, Optional[int]]):
+    await session.execute(delete(GroupZoneGrant).where(GroupZoneGrant.group_id == group_id))
+    session.add_all([GroupZoneGrant(group_id=group_id, zone_id=z, schedule_id=s) for z, s in grants.items()])
+
+async def read_group(session: AsyncSession, group_id: int) -> GroupRead:
+    group = await load_group(session, group_id)
+    return to_read(group, (await load_grants(session, [group_id]))[group_id])
+
+# 取得所有群組
+@router.get("/", response_model=List[GroupRead])
+async def read_groups(session: AsyncSession = Depends(get_session)):
+    result = await session.execute(
+        select(UserGroup).options(selectinload(UserGroup.users), selectinload(UserGroup.zones))
+    )
+    groups = result.scalars().all()
+    grants = await load_grants(session, [g.id for g in groups])
+    return [to_read(group, grants[group.id]) for group in groups]
+
+# 新增群組
+@router.post("/", response_model=GroupRead)
+async def create_group(group_in: GroupCreateUpdate, session: AsyncSession = Depends(get_session)):
+    existing = await session.execute(select(UserGroup).where(UserGroup.name == group_in.name))
+    if existing.scalars().first():
+        raise HTTPException(status_code=400, detail="Group name already exists")
+
+    users = await load_by_ids(session, User, group_in.user_ids)
+    grants = await resolve_grants(session, group_in)
+    group = UserGroup(name=group_in.name, description=group_in.description, users=users)
+    session.add(group)
+    await session.flush()
+    # 先加入成員，再以授權 Zone 的差異展開權限 (只計算一次)
+    await permissions.group_grants_changed(session, group.id, {}, grants)
+    await write_grants(session, group.id, grants)
+    await session.commit()
+    if users and grants:
+        await card_cache.invalidate()
+    return await read_group(session, group.id)
+
+# 修改群組 (成員或授權變更會增量更新實際權限)
+@router.put("/{group_id}", response_model=GroupRead)
+async def update_group(group_id: int, group_in: GroupCreateUpdate, session: AsyncSession = Depends(get_session)):
+    group = await load_group(session, group_id)
+    if group.name != group_in.name:
+        existing = await session.execute(select(UserGroup).where(UserGroup.name == group_in.name))
+        if existing.scalars().first():
+            raise HTTPException(status_code=400, detail="Group name already exists")
+
+    old_users = {u.id for u in group.users}
+    old_grants = (await load_grants(session, [group_id]))[group_id]
+    users = await load_by_ids(session, User, group_in.user_ids)
+    new_grants = await resolve_grants(session, group_in)
+    new_users = {u.id for u in users}
+
+    # 分兩步套用：先以舊授權套用成員差異，寫入新成員後再套用授權差異
+    await permissions.group_users_changed(session, group.id, old_users, new_users)
+    group.users = users
+    await session.flush()
+    await permissions.group_grants_changed(session, group.id, old_grants, new_grants)
+    await write_grants(session, group.id, new_grants)
+    group.name = group_in.name
+    group.description = group_in.description
+    session.add(group)
+    await session.commit()
+    if old_users != new_users or old_grants != new_grants:
+        await card_cache.invalidate()
+    return await read_group(session, group_id)
+
+# 刪除群組
+@router.delete("/{group_id}")
+async def delete_group(group_id: int, session: AsyncSession = Depends(get_session)):
+    group = await load_group(session, group_id)
+    await permissions.group_users_changed(session, group.id, {u.id for u in group.users}, set())
+    group.users = []
+    await session.execute(delete(GroupZoneGrant).where(GroupZoneGrant.group_id == group_id))
+    await session.delete(group)
+    await session.commit()
+    await card_cache.invalidate()
+    return {"ok": True}
@@ -0,0 +1,76 @@
+from typing import List, Annotated
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_session
+from app.models import Schedule, GroupZoneGrant
+from app.cache import schedule_cache
+from pydantic import BaseModel, Field
+
+router = APIRouter(prefix="/schedules", tags=["Schedules"])
+
+# 單一規則：每週哪幾天 (0=週一) 的 start~end，end <= start 表示跨夜
+class ScheduleRule(BaseModel):
+    days: List[Annotated[int, Field(ge=0, le=6)]] = Field(min_length=1)
+    start: str = Field(pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    end: str = Field(pattern=r"^([01]\d|2[0-3]):[0-5]\d$|^24:00$")
+
+class ScheduleCreateUpdate(BaseModel):
+    name: str
+    rules: List[ScheduleRule] = []
+
+class ScheduleRead(ScheduleCreateUpdate):
+    id: int
+
+async def load_schedule(session: AsyncSession, schedule_id: int) -> Schedule:
+    schedule = await session.get(Schedule, schedule_id)
+    if not schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return schedule
+
+async def check_name(session: AsyncSession, name: str):
+    existing = await session.execute(select(Schedule).where(Schedule.name == name))
+    if existing.scalars().first():
+        raise HTTPException(status_code=400, detail="Schedule name already exists")
+
+# 取得所有時段
+@router.get("/", response_model=List[ScheduleRead])
+async def read_schedules(session: AsyncSession = Depends(get_session)):
+    result = await session.execute(select(Schedule))
+    return result.scalars().all()
+
+# 新增時段
+@router.post("/", response_model=ScheduleRead)
+async def create_schedule(schedule_in: ScheduleCreateUpdate, session: AsyncSession = Depends(get_session)):
+    await check_name(session, schedule_in.name)
+    schedule = Schedule(name=schedule_in.name, rules=[r.model_dump() for r in schedule_in.rules])
+    session.add(schedule)
+    await session.commit()
+    await session.refresh(schedule)
+    return schedule
+
+# 修改時段 (各 worker 下次刷卡時重新編譯)
+@router.put("/{schedule_id}", response_model=ScheduleRead)
+async def update_schedule(schedule_id: int, schedule_in: ScheduleCreateUpdate, session: AsyncSession = Depends(get_session)):
+    schedule = await load_schedule(session, schedule_id)
+    if schedule.name != schedule_in.name:
+        await check_name(session, schedule_in.name)
+    schedule.name = schedule_in.name
+    schedule.rules = [r.model_dump() for r in schedule_in.rules]
+    session.add(schedule)
+    await session.commit()
+    await session.refresh(schedule)
+    await schedule_cache.invalidate(schedule_id)
+    return schedule
+
+# 刪除時段 (仍被群組授權使用時拒絕)
+@router.delete("/{schedule_id}")
+async def delete_schedule(schedule_id: int, session: AsyncSession = Depends(get_session)):
+    schedule = await load_schedule(session, schedule_id)
+    in_use = await session.execute(select(GroupZoneGrant).where(GroupZoneGrant.schedule_id == schedule_id))
+    if in_use.scalars().first():
+        raise HTTPException(status_code=400, detail="Schedule is in use by a group")
+    await session.delete(schedule)
+    await session.commit()
+    await schedule_cache.invalidate(schedule_id)
+    return {"ok": True}
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from app.email_utils import mail_dispatcher
+from app.verification import verification_codes
+from app.rate_limit import limiters
+from app.hashing import hasher
+from app.cache import bus, caches
+from app.occupancy import occupancy
+from app.analytics import analytics
+from app.startup import report
+from app.database import replica, sqlite_stats, IS_SQLITE
+from app.signing import signatures
+
+router = APIRouter(prefix="/system", tags=["System"])
+
+# 背景服務的執行狀態
+@router.get("/metrics")
+async def read_metrics():
+    return {
+        "mail": mail_dispatcher.metrics(),
+        "verification": verification_codes.metrics(),
+        "hashing": hasher.metrics(),
+        "rate_limit": {limiter.name: limiter.metrics() for limiter in limiters},
+        "cache": {name: cache.metrics() for name, cache in caches.items()},
+        "cache_bus": bus.metrics(),
+        "occupancy": occupancy.metrics(),
+        "analytics": analytics.metrics(),
+        "startup": report.metrics(),
+        "replica": replica.metrics(),
+        "sqlite": sqlite_stats.metrics() if IS_SQLITE else None,
+        "device_signing": signatures.metrics(),
+    }
@@ -1,10 +1,20 @@
+import json
 from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import select
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Request
+from sqlmodel import select, delete, update
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_session
-from app.models import User, Card, Device
+from app.database import get_session, get_read_session
+from app.models import User, Card, Device, ZoneOccupant, UserDeviceLink, AccessLog
+from app.mqtt_utils import publish_bot_invalidation
+from app.verification import verification_codes
+from app.cache import card_cache
+from app import permissions
+from app.occupancy import occupancy
+from app.responses import parse_fields, json_response
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter(prefix="/users", tags=["Users"])
@@ -15,6 +25,7 @@ class UserReadWithDetails(BaseModel):
     name: str
     email: Optional[str] = None
     is_active: bool
+    telegram_bound: bool = False
     card_uid: Optional[str] = None
     accessible_device_ids: List[int] = [] # 回傳給前端，用於顯示已選設備
     accessible_device_names: List[str] = [] # 用於列表顯示設備名稱
@@ -27,33 +38,92 @@ class UserCreateUpdate(BaseModel):
     card_uid: Optional[str] = None
     accessible_device_ids: List[int] = [] # 接收前端傳來的設備 ID 列表
 
-# 取得所有學生 (含詳細資料)
-@router.get("/", response_model=List[UserReadWithDetails])
-async def read_users(session: AsyncSession = Depends(get_session)):
-    # 預先載入 cards 和 accessible_devices
-    statement = select(User).options(selectinload(User.cards), selectinload(User.accessible_devices))
-    result = await session.execute(statement)
-    users = result.scalars().all()
-    
-    response_data = []
-    for user in users:
-        current_card_uid = user.cards[0].uid if user.cards else None
-        
-        # 整理設備 ID 與 名稱
-        device_ids = [d.id for d in user.accessible_devices]
-        device_names = [d.device_name for d in user.accessible_devices]
-
-        response_data.append(UserReadWithDetails(
-            id=user.id,
-            student_id=user.student_id,
-            name=user.name,
-            email=user.email,
-            is_active=user.is_active,
-            card_uid=current_card_uid,
-            accessible_device_ids=device_ids,
-            accessible_device_names=device_names
+class UserPage(BaseModel):
+    total: int
+    items: List[UserReadWithDetails]
+
+SORT_COLUMNS = {"id": User.id, "student_id": User.student_id, "name": User.name, "email": User.email}
+USER_FIELDS = tuple(UserReadWithDetails.model_fields)
+DEVICE_FIELDS = ("accessible_device_ids", "accessible_device_names")
+MAX_PAGE_SIZE = 500
+
+# 依資料庫彙整成清單 (Postgres: array_agg，SQLite: json_group_array)
+def list_agg(session: AsyncSession, column):
+    if session.bind.dialect.name == "postgresql":
+        return func.array_agg(aggregate_order_by(column, Device.id))
+    return func.json_group_array(column)
+
+def as_list(value) -> list:
+    if value is None:
+        return []
+    return json.loads(value) if isinstance(value, str) else list(value)
+
+# 取得學生列表 (分頁、排序、搜尋)
+# q 比對學號開頭，或姓名、Email 的任一部分 (Postgres 以 trigram 索引加速)
+# fields=id,name,... 可只取需要的欄位，未選設備欄位時不查詢授權設備
+@router.get("/", response_model=UserPage)
+async def read_users(
+    request: Request,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    sort: str = "id",
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    q: Optional[str] = None,
+    fields: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session)
+):
+    names = parse_fields(fields, USER_FIELDS)
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_COLUMNS)}")
+    conditions = []
+    if q and q.strip():
+        q = q.strip()
+        conditions.append(or_(
+            User.student_id.startswith(q, autoescape=True),
+            User.name.icontains(q, autoescape=True),
+            User.email.icontains(q, autoescape=True)
         ))
-    return response_data
+
+    total = (await session.execute(select(func.count()).select_from(User).where(*conditions))).scalar_one()
+
+    # 只取需要的欄位，卡號以子查詢取得 (第一欄固定為 id，用於對應授權設備)
+    sort_column = SORT_COLUMNS[sort]
+    columns = {
+        "student_id": User.student_id,
+        "name": User.name,
+        "email": User.email,
+        "is_active": User.is_active,
+        "telegram_bound": User.telegram_id.is_not(None),
+        "card_uid": select(func.min(Card.uid)).where(Card.user_id == User.id).scalar_subquery(),
+    }
+    selected = [name for name in names if name in columns]
+    result = await session.execute(
+        select(User.id, *(columns[name] for name in selected))
+        .where(*conditions)
+        .order_by(sort_column.desc() if order == "desc" else sort_column.asc(), User.id)
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )
+    rows = result.all()
+
+    # 當頁使用者的直接授權設備，在資料庫端彙整成清單
+    devices = {}
+    if rows and any(name in DEVICE_FIELDS for name in names):
+        result = await session.execute(
+            select(UserDeviceLink.user_id, list_agg(session, Device.id), list_agg(session, Device.device_name))
+            .join(Device, Device.id == UserDeviceLink.device_id)
+            .where(UserDeviceLink.user_id.in_([row[0] for row in rows]))
+            .group_by(UserDeviceLink.user_id)
+        )
+        devices = {user_id: (as_list(ids), as_list(names)) for user_id, ids, names in result.all()}
+
+    items = []
+    for user_id, *values in rows:
+        item = dict(zip(selected, values))
+        item["id"] = user_id
+        item["accessible_device_ids"], item["accessible_device_names"] = devices.get(user_id, ([], []))
+        items.append({name: item[name] for name in names})
+    return await json_response(request, {"total": total, "items": items})
 
 # 新增學生
 @router.post("/", response_model=UserReadWithDetails)
@@ -78,14 +148,19 @@ async def create_user(user_in: UserCreateUpdate, session: AsyncSession = Depends
     )
     
     # 處理設備關聯
+    device_ids = set()
     if user_in.accessible_device_ids:
         # 查詢所有對應的 Device 物件
         for dev_id in user_in.accessible_device_ids:
             device = await session.get(Device, dev_id)
             if device:
                 db_user.accessible_devices.append(device)
+                device_ids.add(device.id)
 
     session.add(db_user)
+    await session.flush()
+    # 沒有授權設備時 flush 後讀取 accessible_devices 會觸發 lazy load，改用上面收集的 id
+    await permissions.direct_devices_changed(session, db_user.id, set(), device_ids)
     await session.commit()
     await session.refresh(db_user)
 
@@ -94,6 +169,7 @@ async def create_user(user_in: UserCreateUpdate, session: AsyncSession = Depends
         new_card = Card(uid=user_in.card_uid, user_id=db_user.id, is_active=True)
         session.add(new_card)
         await session.commit()
+        await card_cache.invalidate(user_in.card_uid)
         
     # 重新載入以獲取完整關聯資料
     await session.refresh(db_user, ["cards", "accessible_devices"])
@@ -104,6 +180,7 @@ async def create_user(user_in: UserCreateUpdate, session: AsyncSession = Depends
         name=db_user.name,
         email=db_user.email,
         is_active=db_user.is_active,
+        telegram_bound=db_user.telegram_id is not None,
         card_uid=user_in.card_uid,
         accessible_device_ids=[d.id for d in db_user.accessible_devices],
         accessible_device_names=[d.device_name for d in db_user.accessible_devices]
@@ -111,7 +188,7 @@ async def create_user(user_in: UserCreateUpdate, session: AsyncSession = Depends
 
 # 更新學生
 @router.put("/{user_id}", response_model=UserReadWithDetails)
-async def update_user(user_id: int, user_in: UserCreateUpdate, session: AsyncSession = Depends(get_session)):
+async def update_user(user_id: int, user_in: UserCreateUpdate, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)):
     # 載入 User 及其關聯
     result = await session.execute(
         select(User)
@@ -123,6 +200,10 @@ async def update_user(user_id: int, user_in: UserCreateUpdate, session: AsyncSes
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    # 停用帳號或更換 Email 時，通知 Bot 清除登入狀態快取
+    if db_user.telegram_id and (db_user.is_active != user_in.is_active or db_user.email != user_in.email):
+        background_tasks.add_task(publish_bot_invalidation, [db_user.telegram_id])
+
     # 更新基本資料
     db_user.student_id = user_in.student_id
     db_user.name = user_in.name
@@ -130,6 +211,7 @@ async def update_user(user_id: int, user_in: UserCreateUpdate, session: AsyncSes
     db_user.is_active = user_in.is_active
     
     # 更新設備權限 (先清空再重加)
+    old_device_ids = {d.id for d in db_user.accessible_devices}
     db_user.accessible_devices.clear()
     if user_in.accessible_device_ids:
         for dev_id in user_in.accessible_device_ids:
@@ -137,8 +219,12 @@ async def update_user(user_id: int, user_in: UserCreateUpdate, session: AsyncSes
             if device:
                 db_user.accessible_devices.append(device)
     
+    await permissions.direct_devices_changed(session, db_user.id, old_device_ids, {d.id for d in db_user.accessible_devices})
+
     # 更新卡片 (保持一人一卡邏輯)
     current_card = db_user.cards[0] if db_user.cards else None
+    # 狀態、權限或卡號變更都會影響刷卡結果，新舊卡號的快取都要清除
+    stale_uids = {c.uid for c in db_user.cards} | ({user_in.card_uid} if user_in.card_uid else set())
     
     if user_in.card_uid:
         if current_card:
@@ -163,6 +249,8 @@ async def update_user(user_id: int, user_in: UserCreateUpdate, session: AsyncSes
     except Exception:
         await session.rollback()
         raise HTTPException(status_code=400, detail="Update failed")
+    for uid in stale_uids:
+        await card_cache.invalidate(uid)
     
     return UserReadWithDetails(
         id=db_user.id,
@@ -170,22 +258,52 @@ async def update_user(user_id: int, user_in: UserCreateUpdate, session: AsyncSes
         name=db_user.name,
         email=db_user.email,
         is_active=db_user.is_active,
+        telegram_bound=db_user.telegram_id is not None,
         card_uid=user_in.card_uid,
         accessible_device_ids=[d.id for d in db_user.accessible_devices],
         accessible_device_names=[d.device_name for d in db_user.accessible_devices]
     )
 
+# 解除 Telegram 綁定
+@router.post("/{user_id}/unbind-telegram")
+async def unbind_telegram(user_id: int, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)):
+    user = await session.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    if user.telegram_id:
+        background_tasks.add_task(publish_bot_invalidation, [user.telegram_id])
+        user.telegram_id = None
+        session.add(user)
+        await session.commit()
+    return {"ok": True}
+
 # 刪除學生
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, session: AsyncSession = Depends(get_session)):
+async def delete_user(user_id: int, background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)):
     user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if user.telegram_id:
+        background_tasks.add_task(publish_bot_invalidation, [user.telegram_id])
     
     cards_result = await session.execute(select(Card).where(Card.user_id == user_id))
-    for card in cards_result.scalars().all():
+    cards = cards_result.scalars().all()
+    for card in cards:
         await session.delete(card)
+    await verification_codes.discard_user(user_id)
+    await permissions.remove_user(session, user_id)
+    await occupancy.remove_user(user_id)
+    await session.execute(delete(ZoneOccupant).where(ZoneOccupant.user_id == user_id))
+    await session.execute(delete(UserDeviceLink).where(UserDeviceLink.user_id == user_id))
+    # 保留刷卡紀錄 (含卡號)，只解除與使用者的關聯
+    await session.execute(update(AccessLog).where(AccessLog.user_id == user_id).values(user_id=None))
 
     await session.delete(user)
-    await session.commit()
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(status_code=409, detail="User is still referenced by other records")
+    for card in cards:
+        await card_cache.invalidate(card.uid)
     return {"ok": True}
\ No newline at end of file
@@ -0,0 +1,140 @@
+from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import select, delete
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_session
+from app.models import Zone, Device, GroupZoneGrant, ZoneOccupant
+from app.cache import card_cache, device_cache
+from app.occupancy import occupancy
+from app import permissions
+from pydantic import BaseModel, Field
+
+router = APIRouter(prefix="/zones", tags=["Zones"])
+
+class ZoneRead(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    device_ids: List[int] = []
+    device_names: List[str] = []
+    capacity: Optional[int] = None
+    occupancy: int = 0
+
+class ZoneCreateUpdate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    device_ids: List[int] = []
+    capacity: Optional[int] = Field(default=None, ge=0)
+
+class OccupancyRead(BaseModel):
+    zone_id: int
+    occupancy: int
+    capacity: Optional[int] = None
+
+def to_read(zone: Zone) -> ZoneRead:
+    return ZoneRead(
+        id=zone.id,
+        name=zone.name,
+        description=zone.description,
+        device_ids=[d.id for d in zone.devices],
+        device_names=[d.device_name for d in zone.devices],
+        capacity=zone.capacity,
+        occupancy=occupancy.count(zone.id)
+    )
+
+async def load_zone(session: AsyncSession, zone_id: int) -> Zone:
+    result = await session.execute(select(Zone).where(Zone.id == zone_id).options(selectinload(Zone.devices)))
+    zone = result.scalars().first()
+    if not zone:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    return zone
+
+async def load_devices(session: AsyncSession, device_ids: List[int]) -> List[Device]:
+    if not device_ids:
+        return []
+    result = await session.execute(select(Device).where(Device.id.in_(device_ids)))
+    return list(result.scalars().all())
+
+# 取得所有 Zone
+@router.get("/", response_model=List[ZoneRead])
+async def read_zones(session: AsyncSession = Depends(get_session)):
+    result = await session.execute(select(Zone).options(selectinload(Zone.devices)))
+    return [to_read(zone) for zone in result.scalars().all()]
+
+# 所有 Zone 的目前在場人數 (直接讀取記憶體計數)
+@router.get("/occupancy", response_model=dict[int, int])
+async def read_occupancy():
+    return occupancy.counts()
+
+@router.get("/{zone_id}/occupancy", response_model=OccupancyRead)
+async def read_zone_occupancy(zone_id: int, session: AsyncSession = Depends(get_session)):
+    zone = await session.get(Zone, zone_id)
+    if not zone:
+        raise HTTPException(status_code=404, detail="Zone not found")
+    return OccupancyRead(zone_id=zone_id, occupancy=occupancy.count(zone_id), capacity=zone.capacity)
+
+# 清空在場人數 (例如閉館後有人未刷卡離開)
+@router.post("/{zone_id}/occupancy/reset")
+async def reset_zone_occupancy(zone_id: int):
+    await occupancy.reset(zone_id)
+    return {"ok": True}
+
+# 新增 Zone
+@router.post("/", response_model=ZoneRead)
+async def create_zone(zone_in: ZoneCreateUpdate, session: AsyncSession = Depends(get_session)):
+    existing = await session.execute(select(Zone).where(Zone.name == zone_in.name))
+    if existing.scalars().first():
+        raise HTTPException(status_code=400, detail="Zone name already exists")
+
+    zone = Zone(
+        name=zone_in.name, description=zone_in.description, capacity=zone_in.capacity,
+        devices=await load_devices(session, zone_in.device_ids)
+    )
+    session.add(zone)
+    await session.commit()
+    # 設備快取帶有所屬 Zone 與人數上限
+    await device_cache.invalidate()
+    # 新 Zone 尚未授權給任何群組，不影響實際權限
+    return to_read(await load_zone(session, zone.id))
+
+# 修改 Zone (設備變更會增量更新實際權限)
+@router.put("/{zone_id}", response_model=ZoneRead)
+async def update_zone(zone_id: int, zone_in: ZoneCreateUpdate, session: AsyncSession = Depends(get_session)):
+    zone = await load_zone(session, zone_id)
+    if zone.name != zone_in.name:
+        existing = await session.execute(select(Zone).where(Zone.name == zone_in.name))
+        if existing.scalars().first():
+            raise HTTPException(status_code=400, detail="Zone name already exists")
+
+    old_ids = {d.id for d in zone.devices}
+    old_capacity = zone.capacity
+    devices = await load_devices(session, zone_in.device_ids)
+    zone.name = zone_in.name
+    zone.description = zone_in.description
+    zone.capacity = zone_in.capacity
+    zone.devices = devices
+    await permissions.zone_devices_changed(session, zone.id, old_ids, {d.id for d in devices})
+    session.add(zone)
+    await session.commit()
+    if old_ids != {d.id for d in devices}:
+        await card_cache.invalidate()
+    if old_ids != {d.id for d in devices} or old_capacity != zone.capacity:
+        await device_cache.invalidate()
+    return to_read(await load_zone(session, zone_id))
+
+# 刪除 Zone
+@router.delete("/{zone_id}")
+async def delete_zone(zone_id: int, session: AsyncSession = Depends(get_session)):
+    zone = await load_zone(session, zone_id)
+    await permissions.zone_devices_changed(session, zone.id, {d.id for d in zone.devices}, set())
+    grants = await session.execute(select(GroupZoneGrant).where(GroupZoneGrant.zone_id == zone_id))
+    for grant in grants.scalars().all():
+        await session.delete(grant)
+    await occupancy.reset(zone_id)
+    await session.execute(delete(ZoneOccupant).where(ZoneOccupant.zone_id == zone_id))
+    await session.delete(zone)
+    await session.commit()
+    await card_cache.invalidate()
+    await device_cache.invalidate()
+    return {"ok": True}
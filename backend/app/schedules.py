@@ -0,0 +1,53 @@
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Schedule
+from app.cache import schedule_cache, MISS
+from app.permissions import ALWAYS
+
+# 開放時段編譯成每週 10080 個分鐘槽的 bitmap (1260 bytes)，刷卡時只需測試一個 bit
+MINUTES_PER_DAY = 24 * 60
+SLOTS_PER_WEEK = 7 * MINUTES_PER_DAY
+
+def parse_minute(value: str) -> int:
+    hour, minute = value.split(":")
+    return int(hour) * 60 + int(minute)
+
+def compile_rules(rules: list[dict]) -> bytes:
+    bits = bytearray(SLOTS_PER_WEEK // 8)
+    for rule in rules:
+        start = parse_minute(rule["start"])
+        end = parse_minute(rule["end"])
+        if end <= start:
+            end += MINUTES_PER_DAY  # 跨夜時段，延續到隔天
+        for day in rule["days"]:
+            base = day * MINUTES_PER_DAY
+            for minute in range(start, end):
+                slot = (base + minute) % SLOTS_PER_WEEK
+                bits[slot >> 3] |= 1 << (slot & 7)
+    return bytes(bits)
+
+def slot_of(now: datetime) -> int:
+    return now.weekday() * MINUTES_PER_DAY + now.hour * 60 + now.minute
+
+def test_bit(bitmap: bytes, slot: int) -> bool:
+    return bool(bitmap[slot >> 3] >> (slot & 7) & 1)
+
+# 取得編譯後的 bitmap，僅在快取未命中 (首次使用或時段被修改) 時重新編譯
+async def get_bitmap(session: AsyncSession, schedule_id: int) -> bytes | None:
+    bitmap = schedule_cache.get(schedule_id)
+    if bitmap is MISS:
+        schedule = await session.get(Schedule, schedule_id)
+        bitmap = compile_rules(schedule.rules) if schedule else None
+        schedule_cache.set(schedule_id, bitmap)
+    return bitmap
+
+# 任一授權路徑在目前時段開放即允許
+async def allowed_now(session: AsyncSession, schedule_ids: frozenset[int], now: datetime | None = None) -> bool:
+    if ALWAYS in schedule_ids:
+        return True
+    slot = slot_of(now or datetime.now())
+    for schedule_id in schedule_ids:
+        bitmap = await get_bitmap(session, schedule_id)
+        if bitmap and test_bit(bitmap, slot):
+            return True
+    return False
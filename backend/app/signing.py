@@ -0,0 +1,91 @@
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import time
+from dotenv import load_dotenv
+from sqlmodel import delete
+from app.database import async_session, dialect_insert
+from app.models import DeviceNonce
+
+load_dotenv()
+
+SIGNATURE_WINDOW = int(os.getenv("DEVICE_SIGNATURE_WINDOW", "60"))  # 秒，設備時間與伺服器時間的容許誤差
+MAX_NONCE_LENGTH = 64
+SIGNATURE_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+# 設備請求簽章 (取代每次刷卡都要計算 argon2 的靜態 Token)
+# 設備以佈建時取得的金鑰計算 HMAC-SHA256("device_id\nsubject\ntimestamp\nnonce")，
+# subject 為卡號 (/access/verify) 或請求內容的 SHA-256 (/access/journal)
+# 時間戳記須在 SIGNATURE_WINDOW 內，同一個 nonce 在有效期間內只能使用一次
+
+def new_key() -> str:
+    return secrets.token_hex(32)
+
+def sign(key: str, device_id: str, subject: str, timestamp: int, nonce: str) -> str:
+    message = f"{device_id}\n{subject}\n{timestamp}\n{nonce}".encode()
+    return hmac.new(bytes.fromhex(key), message, hashlib.sha256).hexdigest()
+
+def body_digest(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+class SignatureError(Exception):
+    pass
+
+# 已使用的 nonce 寫入 DeviceNonce，主鍵衝突即為重送 (多個 worker 之間同樣有效，並行重送也只有一個成功)
+# 過期的 nonce 每隔 SIGNATURE_WINDOW 秒清除一次，未過期的不會被移除
+class SignatureVerifier:
+    def __init__(self):
+        self._session_factory = async_session
+        self.verified = 0
+        self.rejected = {"stale": 0, "signature": 0, "replay": 0}
+        self.purged = 0
+        self._next_purge = 0.0
+
+    def _reject(self, reason: str, detail: str):
+        self.rejected[reason] += 1
+        raise SignatureError(detail)
+
+    # 記錄 nonce，已存在時回傳 False
+    async def _claim(self, device_id: str, nonce: str, expires_at: int, now: float) -> bool:
+        async with self._session_factory() as session:
+            if now >= self._next_purge:
+                self._next_purge = now + SIGNATURE_WINDOW
+                result = await session.execute(delete(DeviceNonce).where(DeviceNonce.expires_at < now))
+                self.purged += result.rowcount
+            stmt = dialect_insert(session)(DeviceNonce).values(device_id=device_id, nonce=nonce, expires_at=expires_at)
+            result = await session.execute(stmt.on_conflict_do_nothing())
+            await session.commit()
+            return result.rowcount == 1
+
+    async def verify(self, key: str, device_id: str, subject: str, timestamp: str, nonce: str, signature: str):
+        now = time.time()
+        try:
+            ts = int(timestamp)
+        except ValueError:
+            self._reject("stale", "Invalid Timestamp")
+        if abs(now - ts) > SIGNATURE_WINDOW:
+            self._reject("stale", "Timestamp Outside Window")
+        if not nonce or len(nonce) > MAX_NONCE_LENGTH:
+            self._reject("signature", "Invalid Nonce")
+        # 標頭以 latin-1 解碼，非 ASCII 字元會讓 compare_digest 拋出 TypeError，先檢查格式
+        if not SIGNATURE_RE.fullmatch(signature):
+            self._reject("signature", "Invalid Signature")
+        if not hmac.compare_digest(sign(key, device_id, subject, ts, nonce), signature.lower()):
+            self._reject("signature", "Invalid Signature")
+
+        # 時間戳記超出容許範圍後即無法重送，nonce 只需保留到那時
+        if not await self._claim(device_id, nonce, ts + SIGNATURE_WINDOW, now):
+            self._reject("replay", "Replayed Request")
+        self.verified += 1
+
+    def metrics(self) -> dict:
+        return {
+            "window_s": SIGNATURE_WINDOW,
+            "verified": self.verified,
+            "rejected": dict(self.rejected),
+            "purged": self.purged,
+        }
+
+signatures = SignatureVerifier()
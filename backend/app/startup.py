@@ -0,0 +1,94 @@
+import builtins
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STARTUP_REPORT = os.getenv("STARTUP_REPORT", "true").lower() == "true"
+TOP_IMPORTS = 10
+
+# worker 啟動耗時報告：各模組 import 時間 (扣除子模組)、lifespan 各階段、到第一個請求完成的時間
+class StartupReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: dict[str, float] = {}
+        self.phases: list[tuple[str, float]] = []
+        self.first_request_ms: float | None = None
+        self._last = self.started
+        self._stack: list[float] = []
+        self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            children = self._stack.pop()
+            elapsed = time.perf_counter() - start
+            self.imports[name] = self.imports.get(name, 0.0) + elapsed - children
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def trace_imports(self):
+        if STARTUP_REPORT and self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop_tracing(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+        self.phase("imports")
+
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self._last) * 1000))
+        self._last = now
+
+    def request_served(self):
+        if self.first_request_ms is not None:
+            return
+        self.first_request_ms = (time.perf_counter() - self.started) * 1000
+        if STARTUP_REPORT:
+            self.print()
+
+    def slowest_imports(self) -> list[tuple[str, float]]:
+        ranked = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+        return [(name, seconds * 1000) for name, seconds in ranked[:TOP_IMPORTS]]
+
+    def print(self):
+        pid = os.getpid()
+        phases = ", ".join(f"{name} {ms:.0f} ms" for name, ms in self.phases)
+        print(f"[Startup] pid {pid}: {phases}; first request served at {self.first_request_ms:.0f} ms")
+        for name, ms in self.slowest_imports():
+            print(f"[Startup]   import {name:<32} {ms:7.1f} ms")
+
+    def metrics(self) -> dict:
+        return {
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases},
+            "first_request_ms": round(self.first_request_ms, 1) if self.first_request_ms is not None else None,
+            "slowest_imports_ms": {name: round(ms, 1) for name, ms in self.slowest_imports()},
+        }
+
+report = StartupReport()
+
+# 第一個 HTTP 回應送出後記錄時間 (純 ASGI，之後只多一次判斷)
+class FirstRequestProbe:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or report.first_request_ms is not None:
+            return await self.app(scope, receive, send)
+
+        async def send_and_record(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                report.request_served()
+
+        await self.app(scope, receive, send_and_record)
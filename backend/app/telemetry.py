@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlmodel import select
+from app.database import async_session
+from app.models import Device, DeviceTelemetry
+from app.mqtt_utils import create_mqtt_client
+
+load_dotenv()
+
+TELEMETRY_TOPIC = "door/+/telemetry"
+OFFLINE_AFTER = int(os.getenv("TELEMETRY_OFFLINE_AFTER", "90"))      # 秒，超過未收到心跳視為離線
+PERSIST_INTERVAL = int(os.getenv("TELEMETRY_PERSIST_INTERVAL", "60"))  # 秒，寫回資料庫的間隔
+ROLLING_WINDOW = 20  # 滾動統計保留的心跳數
+DEVICE_REFRESH = 30  # 秒，收到未知設備名稱時重新載入設備清單的最短間隔
+RECONNECT_DELAY = 5
+
+# 心跳欄位只接受數值，其餘視為未回報
+def number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+# 單一設備的即時狀態
+class DeviceStats:
+    def __init__(self):
+        self.last_seen: datetime | None = None
+        self.uptime_s = None
+        self.free_heap = None
+        self.rssi = None
+        self.swipe_count = None
+        self.latency_p50_ms = None
+        self.latency_p95_ms = None
+        self.latency_p99_ms = None
+        self.heap_window = deque(maxlen=ROLLING_WINDOW)
+        self.rssi_window = deque(maxlen=ROLLING_WINDOW)
+        # 從資料庫載入的滾動值 (尚未收到新心跳前使用)
+        self.restored_min_heap = None
+        self.restored_avg_rssi = None
+
+    def update(self, data: dict):
+        self.last_seen = datetime.now()
+        self.uptime_s = number(data.get("up"))
+        self.free_heap = number(data.get("heap"))
+        self.rssi = number(data.get("rssi"))
+        self.swipe_count = number(data.get("sw"))
+        self.latency_p50_ms = number(data.get("p50"))
+        self.latency_p95_ms = number(data.get("p95"))
+        self.latency_p99_ms = number(data.get("p99"))
+        if self.free_heap is not None:
+            self.heap_window.append(self.free_heap)
+        if self.rssi is not None:
+            self.rssi_window.append(self.rssi)
+
+    @property
+    def min_free_heap(self):
+        return min(self.heap_window) if self.heap_window else self.restored_min_heap
+
+    @property
+    def avg_rssi(self):
+        if self.rssi_window:
+            return round(sum(self.rssi_window) / len(self.rssi_window), 1)
+        return self.restored_avg_rssi
+
+    @property
+    def online(self) -> bool:
+        return self.last_seen is not None and datetime.now() - self.last_seen < timedelta(seconds=OFFLINE_AFTER)
+
+    def as_dict(self) -> dict:
+        return {
+            "online": self.online,
+            "last_seen": self.last_seen,
+            "uptime_s": self.uptime_s,
+            "free_heap": self.free_heap,
+            "min_free_heap": self.min_free_heap,
+            "rssi": self.rssi,
+            "avg_rssi": self.avg_rssi,
+            "swipe_count": self.swipe_count,
+            "latency_p50_ms": self.latency_p50_ms,
+            "latency_p95_ms": self.latency_p95_ms,
+            "latency_p99_ms": self.latency_p99_ms,
+        }
+
+# 訂閱設備心跳，於記憶體維護狀態並定期寫回資料庫
+# 只記錄已註冊的設備，未知的主題直接忽略 (避免 stats 無限制成長)
+class TelemetryMonitor:
+    def __init__(self):
+        self.stats: dict[str, DeviceStats] = {}
+        self.devices: set[str] = set()
+        self.devices_loaded = 0.0
+        self.ignored = 0
+        self.dirty: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+        self._session_factory = async_session
+
+    def get(self, device_name: str) -> dict:
+        stats = self.stats.get(device_name)
+        return stats.as_dict() if stats else {"online": False}
+
+    def ingest(self, device_name: str, payload: bytes):
+        if device_name not in self.devices:
+            self.ignored += 1
+            return
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            print(f"[Telemetry] Invalid payload from {device_name}")
+            return
+        self.stats.setdefault(device_name, DeviceStats()).update(data)
+        self.dirty.add(device_name)
+
+    # 重新載入設備清單，並移除已刪除 (或改名) 設備的狀態
+    async def load_devices(self):
+        async with self._session_factory() as session:
+            result = await session.execute(select(Device.device_name))
+            self.devices = set(result.scalars().all())
+        self.devices_loaded = time.monotonic()
+        for device_name in set(self.stats) - self.devices:
+            del self.stats[device_name]
+            self.dirty.discard(device_name)
+
+    async def load(self):
+        await self.load_devices()
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(Device.device_name, DeviceTelemetry).join(DeviceTelemetry, DeviceTelemetry.device_id == Device.id)
+            )
+            for device_name, row in result.all():
+                stats = self.stats.setdefault(device_name, DeviceStats())
+                stats.last_seen = row.last_seen
+                stats.uptime_s = row.uptime_s
+                stats.free_heap = row.free_heap
+                stats.rssi = row.rssi
+                stats.swipe_count = row.swipe_count
+                stats.latency_p50_ms = row.latency_p50_ms
+                stats.latency_p95_ms = row.latency_p95_ms
+                stats.latency_p99_ms = row.latency_p99_ms
+                stats.restored_min_heap = row.min_free_heap
+                stats.restored_avg_rssi = row.avg_rssi
+
+    async def persist(self):
+        if not self.dirty:
+            return
+        names, self.dirty = self.dirty, set()
+        try:
+            async with self._session_factory() as session:
+                result = await session.execute(select(Device.id, Device.device_name).where(Device.device_name.in_(names)))
+                for device_id, device_name in result.all():
+                    values = self.stats[device_name].as_dict()
+                    values.pop("online")
+                    row = await session.get(DeviceTelemetry, device_id)
+                    if row is None:
+                        row = DeviceTelemetry(device_id=device_id, **values)
+                    else:
+                        for key, value in values.items():
+                            setattr(row, key, value)
+                    session.add(row)
+                await session.commit()
+        except Exception:
+            # 寫入失敗，下次重試
+            self.dirty |= names
+            raise
+
+    async def _consume(self):
+        while True:
+            try:
+                async with create_mqtt_client() as client:
+                    await client.subscribe(TELEMETRY_TOPIC)
+                    print(f"[Telemetry] Subscribed to {TELEMETRY_TOPIC}")
+                    async for message in client.messages:
+                        # door/{device_name}/telemetry
+                        device_name = message.topic.value.split("/")[1]
+                        if device_name not in self.devices and time.monotonic() - self.devices_loaded >= DEVICE_REFRESH:
+                            await self.load_devices()
+                        self.ingest(device_name, message.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Telemetry] MQTT Error: {e}, reconnecting in {RECONNECT_DELAY}s")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _persist_loop(self):
+        while True:
+            await asyncio.sleep(PERSIST_INTERVAL)
+            try:
+                await self.persist()
+            except Exception as e:
+                print(f"[Telemetry] Persist Error: {e}")
+
+    async def start(self):
+        await self.load()
+        self._tasks = [
+            asyncio.create_task(self._consume()),
+            asyncio.create_task(self._persist_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.persist()
+
+telemetry_monitor = TelemetryMonitor()
@@ -0,0 +1,211 @@
+import os
+import asyncio
+import secrets
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlmodel import delete, update
+from app.database import async_session, dialect_insert
+from app.models import VerificationCode
+
+load_dotenv()
+
+CODE_TTL = int(os.getenv("VERIFY_CODE_TTL", "180"))                # 秒，驗證碼有效期
+MAX_ATTEMPTS = int(os.getenv("VERIFY_MAX_ATTEMPTS", "5"))          # 同一組驗證碼可嘗試次數
+RESEND_COOLDOWN = int(os.getenv("VERIFY_RESEND_COOLDOWN", "30"))   # 秒，重新索取驗證碼的間隔
+PERSIST = os.getenv("VERIFY_CODE_PERSIST", "false").lower() == "true"
+SWEEP_INTERVAL = 60
+
+# 驗證結果
+VERIFY_OK = "ok"
+VERIFY_MISSING = "missing"
+VERIFY_EXPIRED = "expired"
+VERIFY_INVALID = "invalid"
+VERIFY_LOCKED = "locked"
+
+# 以 bytes 比對：使用者輸入可能含非 ASCII 字元，compare_digest 對這類 str 會拋出 TypeError
+def code_matches(expected: str, code: str) -> bool:
+    return secrets.compare_digest(expected.encode(), code.strip().upper().encode())
+
+class PendingCode:
+    def __init__(self, user_id: int, code: str, expires_at: datetime, attempts: int = 0):
+        self.user_id = user_id
+        self.code = code
+        self.expires_at = expires_at
+        self.attempts = attempts
+
+    @property
+    def expired(self) -> bool:
+        return datetime.now() >= self.expires_at
+
+# 以 telegram_id 為 key 的驗證碼儲存，過期自動清除，並限制錯誤嘗試次數
+# PERSIST 時以資料庫為準 (多個 worker 共用)，不使用記憶體中的 codes
+class VerificationCodeStore:
+    def __init__(self):
+        self.codes: dict[str, PendingCode] = {}
+        self._task: asyncio.Task | None = None
+        self._session_factory = async_session
+        self.issued = 0
+        self.verified = 0
+        self.failed_attempts = 0
+        self.locked = 0
+
+    async def _load(self, telegram_id: str) -> PendingCode | None:
+        async with self._session_factory() as session:
+            row = await session.get(VerificationCode, telegram_id)
+            if row is None:
+                return None
+            return PendingCode(row.user_id, row.code, row.expires_at, row.attempts)
+
+    async def _save(self, telegram_id: str, pending: PendingCode):
+        values = {"user_id": pending.user_id, "code": pending.code, "expires_at": pending.expires_at, "attempts": pending.attempts}
+        async with self._session_factory() as session:
+            stmt = dialect_insert(session)(VerificationCode).values(telegram_id=telegram_id, **values)
+            await session.execute(stmt.on_conflict_do_update(index_elements=["telegram_id"], set_=values))
+            await session.commit()
+
+    async def _remove(self, telegram_id: str):
+        async with self._session_factory() as session:
+            await session.execute(delete(VerificationCode).where(VerificationCode.telegram_id == telegram_id))
+            await session.commit()
+
+    async def get(self, telegram_id: str) -> PendingCode | None:
+        # 每次都讀取資料庫，其他 worker 可能已重發或作廢驗證碼
+        pending = await self._load(telegram_id) if PERSIST else self.codes.get(telegram_id)
+        if pending is not None and pending.expired:
+            await self.discard(telegram_id)
+            return None
+        return pending
+
+    # 產生新驗證碼，冷卻時間內回傳 None
+    async def issue(self, telegram_id: str, user_id: int) -> str | None:
+        pending = await self.get(telegram_id)
+        if pending is not None:
+            issued_at = pending.expires_at - timedelta(seconds=CODE_TTL)
+            if datetime.now() - issued_at < timedelta(seconds=RESEND_COOLDOWN):
+                return None
+        code = secrets.token_hex(3).upper()
+        pending = PendingCode(user_id, code, datetime.now() + timedelta(seconds=CODE_TTL))
+        if PERSIST:
+            await self._save(telegram_id, pending)
+        else:
+            self.codes[telegram_id] = pending
+        self.issued += 1
+        return code
+
+    # 回傳 (結果, user_id)
+    async def verify(self, telegram_id: str, code: str) -> tuple[str, int | None]:
+        if PERSIST:
+            return await self._verify_persisted(telegram_id, code)
+        pending = self.codes.get(telegram_id)
+        if pending is None:
+            return VERIFY_MISSING, None
+        if pending.expired:
+            await self.discard(telegram_id)
+            return VERIFY_EXPIRED, None
+
+        if code_matches(pending.code, code):
+            await self.discard(telegram_id)
+            self.verified += 1
+            return VERIFY_OK, pending.user_id
+
+        self.failed_attempts += 1
+        pending.attempts += 1
+        if pending.attempts >= MAX_ATTEMPTS:
+            # 錯誤次數過多，作廢此驗證碼
+            await self.discard(telegram_id)
+            self.locked += 1
+            return VERIFY_LOCKED, None
+        return VERIFY_INVALID, None
+
+    # 錯誤次數以單一 UPDATE ... RETURNING 累加，多個 worker 合計不會超過 MAX_ATTEMPTS；
+    # 正確時以 DELETE 作廢，同一組驗證碼只有一個請求能使用
+    async def _verify_persisted(self, telegram_id: str, code: str) -> tuple[str, int | None]:
+        pending = await self._load(telegram_id)
+        if pending is None:
+            return VERIFY_MISSING, None
+        if pending.expired:
+            await self.discard(telegram_id)
+            return VERIFY_EXPIRED, None
+        if pending.attempts >= MAX_ATTEMPTS:
+            return VERIFY_LOCKED, None
+
+        current = (VerificationCode.telegram_id == telegram_id, VerificationCode.code == pending.code)
+        async with self._session_factory() as session:
+            if code_matches(pending.code, code):
+                result = await session.execute(delete(VerificationCode).where(*current, VerificationCode.attempts < MAX_ATTEMPTS))
+                await session.commit()
+                if result.rowcount != 1:
+                    return VERIFY_MISSING, None
+                self.verified += 1
+                return VERIFY_OK, pending.user_id
+            result = await session.execute(
+                update(VerificationCode)
+                .where(*current)
+                .values(attempts=VerificationCode.attempts + 1)
+                .returning(VerificationCode.attempts)
+            )
+            attempts = result.scalar_one_or_none()
+            await session.commit()
+
+        self.failed_attempts += 1
+        if attempts is None:
+            return VERIFY_MISSING, None
+        if attempts >= MAX_ATTEMPTS:
+            await self.discard(telegram_id)
+            self.locked += 1
+            return VERIFY_LOCKED, None
+        return VERIFY_INVALID, None
+
+    async def discard(self, telegram_id: str):
+        self.codes.pop(telegram_id, None)
+        if PERSIST:
+            await self._remove(telegram_id)
+
+    async def discard_user(self, user_id: int):
+        for telegram_id in [k for k, v in self.codes.items() if v.user_id == user_id]:
+            del self.codes[telegram_id]
+        if PERSIST:
+            async with self._session_factory() as session:
+                await session.execute(delete(VerificationCode).where(VerificationCode.user_id == user_id))
+                await session.commit()
+
+    async def sweep(self) -> int:
+        now = datetime.now()
+        expired = [k for k, v in self.codes.items() if now >= v.expires_at]
+        for telegram_id in expired:
+            del self.codes[telegram_id]
+        if PERSIST:
+            async with self._session_factory() as session:
+                await session.execute(delete(VerificationCode).where(VerificationCode.expires_at <= now))
+                await session.commit()
+        return len(expired)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[Verification] Sweep Error: {e}")
+
+    async def start(self):
+        self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "pending": None if PERSIST else len(self.codes),  # PERSIST 時存放於資料庫
+            "persist": PERSIST,
+            "issued": self.issued,
+            "verified": self.verified,
+            "failed_attempts": self.failed_attempts,
+            "locked": self.locked,
+        }
+
+verification_codes = VerificationCodeStore()
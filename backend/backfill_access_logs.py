@@ -0,0 +1,82 @@
+import asyncio
+import sys
+import time
+from sqlmodel import select, update
+from sqlalchemy import func, or_, and_
+from app.database import init_db, get_session, run_script
+from app.models import AccessLog, Device
+from app.log_details import parse_details, check
+
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_PAUSE = 0.1  # 秒，每批之間暫停，降低對線上流量的影響
+
+# 從 details 回填 AccessLog.device_id 與 message
+# 已回填的紀錄 message 不為 NULL，中斷後重新執行會自動從剩下的第一筆繼續
+# 舊版解析器無法辨識的格式會留下 device_id 為 NULL、message 等於整段 details，這些紀錄也重新處理
+async def backfill(batch_size: int, pause: float):
+    check()
+    await init_db()
+    async for session in get_session():
+        result = await session.execute(select(Device.device_name, Device.id))
+        names = dict(result.all())
+        device_ids = set(names.values())
+
+        pending = or_(
+            AccessLog.message.is_(None),
+            and_(
+                AccessLog.device_id.is_(None),
+                AccessLog.message == AccessLog.details,
+                or_(AccessLog.details.like("Device: %"), AccessLog.details.like("Remote unlock: %")),
+            ),
+        )
+        remaining = (await session.execute(select(func.count()).select_from(AccessLog).where(pending))).scalar_one()
+        if not remaining:
+            print("沒有需要回填的紀錄")
+            return
+        last_id = (await session.execute(select(func.min(AccessLog.id)).where(pending))).scalar_one() - 1
+        print(f"共 {remaining} 筆待回填，從 id {last_id + 1} 開始")
+
+        done, matched, started = 0, 0, time.monotonic()
+        while True:
+            result = await session.execute(
+                select(AccessLog.id, AccessLog.details)
+                .where(AccessLog.id > last_id, pending)
+                .order_by(AccessLog.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            updates = []
+            for log_id, details in rows:
+                device_id, message = parse_details(details, names)
+                # 已刪除的設備不能寫入外鍵
+                if device_id not in device_ids:
+                    device_id = None
+                matched += device_id is not None
+                updates.append({"id": log_id, "device_id": device_id, "message": message})
+            # 依主鍵批次更新，每批一個短交易
+            await session.execute(update(AccessLog), updates)
+            await session.commit()
+
+            last_id = rows[-1][0]
+            done += len(rows)
+            rate = done / max(time.monotonic() - started, 1e-6)
+            eta = (remaining - done) / rate if rate else 0
+            print(f"{done}/{remaining} ({done * 100 / remaining:.1f}%) id <= {last_id}，{rate:.0f} 筆/秒，預計剩餘 {eta:.0f} 秒")
+            await asyncio.sleep(pause)
+
+        print(f"完成！共回填 {done} 筆，其中 {matched} 筆對應到設備")
+        return
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print("用法: uv run backfill_access_logs.py [每批筆數] [每批間隔秒數]")
+        print(f"範例: uv run backfill_access_logs.py {DEFAULT_BATCH_SIZE} {DEFAULT_PAUSE}")
+    else:
+        batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE
+        pause = float(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PAUSE
+        try:
+            run_script(backfill(batch_size, pause))
+        except KeyboardInterrupt:
+            print("\n已中斷，重新執行即可從中斷處繼續。")
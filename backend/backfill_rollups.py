@@ -0,0 +1,59 @@
+import sys
+from collections import Counter
+from datetime import date, datetime
+from sqlmodel import select, delete
+from app.database import init_db, get_session, run_script
+from app.models import AccessLog, AccessRollup, UserAccessRollup, Device
+from app.analytics import count_log, add_counts
+from app.log_details import parse_details, check
+
+BATCH_SIZE = 5000
+
+# 依主鍵分批掃描區間內的 AccessLog 一次，最後在同一個交易內以重新計算的結果取代區間內的統計
+async def backfill(start: date, end: date):
+    check()
+    await init_db()
+    range_start = datetime.combine(start, datetime.min.time())
+    range_end = datetime.combine(end, datetime.min.time())
+    async for session in get_session():
+        result = await session.execute(select(Device.device_name, Device.id))
+        names = dict(result.all())
+
+        hourly, daily = Counter(), Counter()
+        last_id, scanned = 0, 0
+        while True:
+            result = await session.execute(
+                select(AccessLog.id, AccessLog.timestamp, AccessLog.user_id, AccessLog.status, AccessLog.device_id, AccessLog.details)
+                .where(AccessLog.id > last_id, AccessLog.timestamp >= range_start, AccessLog.timestamp < range_end)
+                .order_by(AccessLog.id)
+                .limit(BATCH_SIZE)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            for log_id, ts, user_id, status, device_id, details in rows:
+                # 尚未回填 device_id 的舊紀錄從 details 解析
+                if device_id is None:
+                    device_id, _ = parse_details(details, names)
+                count_log(hourly, daily, ts, device_id, user_id, status)
+            last_id = rows[-1][0]
+            scanned += len(rows)
+            print(f"已掃描 {scanned} 筆 (id <= {last_id})")
+
+        await session.execute(delete(AccessRollup).where(AccessRollup.bucket >= range_start, AccessRollup.bucket < range_end))
+        await session.execute(delete(UserAccessRollup).where(UserAccessRollup.day >= start, UserAccessRollup.day < end))
+        await add_counts(session, hourly, daily)
+        await session.commit()
+        print(f"完成！{start} ~ {end}: {scanned} 筆紀錄 -> {len(hourly)} 筆小時統計、{len(daily)} 筆使用者統計")
+        return
+
+if __name__ == "__main__":
+    # 只回補到昨天，今天的統計由執行中的後端持續累加，避免重複計算
+    today = date.today()
+    if len(sys.argv) < 2:
+        print("用法: uv run backfill_rollups.py <起始日期> [結束日期 (不含)]")
+        print("範例: uv run backfill_rollups.py 2025-01-01 2025-02-01")
+    else:
+        start = date.fromisoformat(sys.argv[1])
+        end = min(date.fromisoformat(sys.argv[2]), today) if len(sys.argv) > 2 else today
+        run_script(backfill(start, end))
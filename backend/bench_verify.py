@@ -0,0 +1,66 @@
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_REQUESTS = 2000
+DEFAULT_CONCURRENCY = 16
+
+# /access/verify 壓力測試，用來比較 Postgres 與 SQLite 模式在同一組刷卡負載下的表現
+# 每次刷卡都會寫入一筆 AccessLog，可觀察並行寫入時的延遲與錯誤 (例如 database is locked 造成的 500)
+# 測試前請把 RATE_LIMIT_DEVICE 調高 (例如 1000000/1)，否則大部分請求會被限流 (429)
+def swipe(url: str, device_id: str, token: str, card_uid: str) -> tuple[int, float]:
+    body = json.dumps({"card_uid": card_uid, "device_id": device_id}).encode()
+    request = urllib.request.Request(
+        f"{url}/access/verify", data=body, method="POST",
+        headers={"Content-Type": "application/json", "x-device-token": token},
+    )
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, (time.perf_counter() - start) * 1000
+
+def percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def bench(url: str, device_id: str, token: str, card_uids: list[str], total: int, concurrency: int):
+    # 先刷一次，讓設備 Token 的 argon2 驗證結果與權限進入快取，不計入結果
+    status, _ = swipe(url, device_id, token, card_uids[0])
+    if status != 200:
+        print(f"❌ 暖機請求失敗 (狀態碼 {status or '連線失敗'})，請確認網址、設備 ID 與 Token")
+        return
+    print(f"對 {url}/access/verify 送出 {total} 次刷卡，並行 {concurrency}")
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        results = list(pool.map(lambda i: swipe(url, device_id, token, card_uids[i % len(card_uids)]), range(total)))
+        elapsed = time.perf_counter() - started
+
+    statuses = Counter(status for status, _ in results)
+    latencies = sorted(ms for _, ms in results)
+    print(f"總耗時 {elapsed:.2f} 秒，{total / elapsed:.0f} 次/秒")
+    print(f"延遲 p50 {percentile(latencies, 0.5):.1f} ms、p95 {percentile(latencies, 0.95):.1f} ms、"
+          f"p99 {percentile(latencies, 0.99):.1f} ms、最大 {latencies[-1]:.1f} ms")
+    print("狀態碼: " + ", ".join(f"{status or '連線失敗'} x{count}" for status, count in sorted(statuses.items())))
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+    if errors:
+        print(f"⚠️ {errors} 次請求失敗，請檢查伺服器日誌")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 5:
+        print("用法: uv run bench_verify.py <伺服器網址> <設備 ID> <設備 Token> <卡號,卡號,...> [請求數] [並行數]")
+        print(f"範例: uv run bench_verify.py http://127.0.0.1:8000 door-1 abc123 A1B2C3D4,11223344 {DEFAULT_REQUESTS} {DEFAULT_CONCURRENCY}")
+    else:
+        url, device_id, token = sys.argv[1].rstrip("/"), sys.argv[2], sys.argv[3]
+        card_uids = sys.argv[4].split(",")
+        total = int(sys.argv[5]) if len(sys.argv) > 5 else DEFAULT_REQUESTS
+        concurrency = int(sys.argv[6]) if len(sys.argv) > 6 else DEFAULT_CONCURRENCY
+        bench(url, device_id, token, card_uids, total, concurrency)
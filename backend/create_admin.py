@@ -1,7 +1,6 @@
-import asyncio
 import getpass
 from sqlmodel import select
-from app.database import get_session
+from app.database import get_session, run_script
 from app.models import Admin
 from app.auth import get_password_hash
 
@@ -42,7 +41,7 @@ async def create_admin_interactive():
         # 建立新管理員
         new_admin = Admin(
             username=username,
-            hashed_password=get_password_hash(password)
+            hashed_password=await get_password_hash(password)
         )
         session.add(new_admin)
         await session.commit()
@@ -52,7 +51,7 @@ async def create_admin_interactive():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(create_admin_interactive())
+        run_script(create_admin_interactive())
     except KeyboardInterrupt:
         print("\n已取消操作。")
     except Exception as e:
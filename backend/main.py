@@ -1,14 +1,44 @@
+from app.startup import report, FirstRequestProbe
+report.trace_imports()
+
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.database import init_db
-from app.routers import users, access, devices, auth, bot_api
+from app.database import init_db, checkpointer, close_db
+from app.routers import users, access, devices, auth, bot_api, system, zones, groups, schedules, analytics
 from app.auth import get_current_admin
+from app.telemetry import telemetry_monitor
+from app.email_utils import mail_dispatcher
+from app.verification import verification_codes
+from app.hashing import hasher
+from app.cache import bus
+from app.occupancy import occupancy
+from app.analytics import analytics as analytics_recorder
+
+report.stop_tracing()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await checkpointer.start()
+    report.phase("database")
+    await bus.start()
+    await telemetry_monitor.start()
+    await occupancy.start()
+    await analytics_recorder.start()
+    await mail_dispatcher.start()
+    await verification_codes.start()
+    report.phase("services")
     yield
+    await verification_codes.stop()
+    await mail_dispatcher.stop()
+    hasher.shutdown()
+    await analytics_recorder.stop()
+    await occupancy.stop()
+    await telemetry_monitor.stop()
+    await bus.stop()
+    await checkpointer.stop()
+    await close_db()
 
 app = FastAPI(
     lifespan=lifespan,
@@ -19,6 +49,7 @@ app = FastAPI(
 
 origins = ["https://test.bob0623.net", "http://localhost:5173", "http://127.0.0.1:5173"]
 
+app.add_middleware(FirstRequestProbe)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -32,6 +63,11 @@ app.include_router(access.router)
 app.include_router(bot_api.router)
 app.include_router(users.router, dependencies=[Depends(get_current_admin)])
 app.include_router(devices.router, dependencies=[Depends(get_current_admin)])
+app.include_router(zones.router, dependencies=[Depends(get_current_admin)])
+app.include_router(groups.router, dependencies=[Depends(get_current_admin)])
+app.include_router(schedules.router, dependencies=[Depends(get_current_admin)])
+app.include_router(analytics.router, dependencies=[Depends(get_current_admin)])
+app.include_router(system.router, dependencies=[Depends(get_current_admin)])
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,30 @@
+import asyncio
+import sys
+from app.database import engine
+from app import migrations
+
+async def status():
+    async with engine.connect() as conn:
+        version = await migrations.current_version(conn)
+    for number, name in migrations.discover():
+        print(f"{'✔' if number <= version else ' '} {name}")
+    await engine.dispose()
+
+async def upgrade():
+    todo = await migrations.pending(engine)
+    if not todo:
+        print("資料庫已是最新版本")
+    else:
+        print(f"套用 {len(todo)} 個遷移 ...")
+        await migrations.upgrade(engine)
+        print("完成！")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    # 部署時 (啟動 worker 前) 執行一次
+    if len(sys.argv) > 1 and sys.argv[1] == "status":
+        asyncio.run(status())
+    elif len(sys.argv) > 1:
+        print("用法: uv run migrate.py [status]")
+    else:
+        asyncio.run(upgrade())
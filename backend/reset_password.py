@@ -1,6 +1,5 @@
-import asyncio
 from sqlmodel import select
-from app.database import get_session
+from app.database import get_session, run_script
 from app.models import Admin
 from app.auth import get_password_hash
 
@@ -17,7 +16,7 @@ async def reset_password(username, new_password):
             return
 
         print(f"找到使用者，正在重設密碼...")
-        admin.hashed_password = get_password_hash(new_password)
+        admin.hashed_password = await get_password_hash(new_password)
         session.add(admin)
         await session.commit()
         print(f"🎉 密碼已成功重設為: {new_password}")
@@ -31,4 +30,4 @@ if __name__ == "__main__":
     else:
         user = sys.argv[1]
         pwd = sys.argv[2]
-        asyncio.run(reset_password(user, pwd))
\ No newline at end of file
+        run_script(reset_password(user, pwd))
\ No newline at end of file
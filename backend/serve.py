@@ -0,0 +1,37 @@
+import os
+import asyncio
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 正式環境啟動程式：以多個 worker 程序執行 (開發時請用 main.py)
+HOST = os.getenv("WEB_HOST", "127.0.0.1")
+PORT = int(os.getenv("WEB_PORT", "8000"))
+# SQLite 的寫入佇列在程序內，單機 SQLite 模式預設只開一個 worker
+SQLITE = os.getenv("DATABASE_URL", "").startswith("sqlite")
+WORKERS = int(os.getenv("WEB_WORKERS", "1" if SQLITE else str(os.cpu_count() or 1)))
+
+# 在啟動 worker 前由單一程序套用資料庫遷移，worker 啟動時只檢查版本
+async def migrate():
+    from app.database import engine
+    from app import migrations
+    await migrations.upgrade(engine)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
+    if WORKERS > 1 and SQLITE:
+        print("⚠️ SQLite 模式下多個 worker 的寫入只能靠 SQLITE_BUSY_TIMEOUT 等待，建議 WEB_WORKERS=1")
+    if WORKERS > 1 and os.getenv("CACHE_BUS", "local") == "local":
+        print("⚠️ 多個 worker 未設定 CACHE_BUS，權限變更需等快取過期 (CACHE_TTL) 才會在其他 worker 生效")
+    if WORKERS > 1 and os.getenv("VERIFY_CODE_PERSIST", "false").lower() != "true":
+        print("⚠️ 多個 worker 建議設定 VERIFY_CODE_PERSIST=true，驗證碼才能在 worker 間共用")
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=WORKERS,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    )
@@ -0,0 +1,50 @@
+import os
+import unittest
+
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from app import verification
+from app.verification import VerificationCodeStore, VERIFY_OK, VERIFY_INVALID, VERIFY_LOCKED, MAX_ATTEMPTS
+
+# 執行: uv run python -m unittest discover tests
+class VerifyCodeTest(unittest.IsolatedAsyncioTestCase):
+    persist = False
+
+    async def asyncSetUp(self):
+        self.store = VerificationCodeStore()
+        self._persist = verification.PERSIST
+        verification.PERSIST = self.persist
+        if self.persist:
+            self.engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+            async with self.engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.create_all)
+            self.store._session_factory = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def asyncTearDown(self):
+        verification.PERSIST = self._persist
+        if self.persist:
+            await self.engine.dispose()
+
+    async def test_correct_code(self):
+        code = await self.store.issue("42", 1)
+        self.assertEqual(await self.store.verify("42", f" {code.lower()} "), (VERIFY_OK, 1))
+
+    async def test_non_ascii_code_is_failed_attempt(self):
+        await self.store.issue("42", 1)
+        self.assertEqual(await self.store.verify("42", "驗證碼"), (VERIFY_INVALID, None))
+        self.assertEqual(self.store.failed_attempts, 1)
+
+    async def test_locked_after_max_attempts(self):
+        await self.store.issue("42", 1)
+        for _ in range(MAX_ATTEMPTS - 1):
+            self.assertEqual((await self.store.verify("42", "驗證碼"))[0], VERIFY_INVALID)
+        self.assertEqual((await self.store.verify("42", "驗證碼"))[0], VERIFY_LOCKED)
+
+class PersistedVerifyCodeTest(VerifyCodeTest):
+    persist = True
+
+if __name__ == "__main__":
+    unittest.main()
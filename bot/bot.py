@@ -1,14 +1,21 @@
 import os
+import ssl
+import json
+import asyncio
+import random
 import logging
-import requests
+import httpx
+import aiomqtt
 from dotenv import load_dotenv
-from telegram import Update
+from state_store import create_state_store
+from webhook import run_webhook
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
+    CallbackQueryHandler,
     MessageHandler,
-    ConversationHandler,
     ContextTypes,
     filters,
 )
@@ -19,6 +26,32 @@ TG_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 BACKEND_URL = os.getenv("BACKEND_API_URL")
 BOT_SECRET = os.getenv("BOT_API_SECRET")
 
+# 後端連線設定
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "10"))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "2"))
+BACKEND_BACKOFF = float(os.getenv("BACKEND_BACKOFF", "0.5"))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "20"))
+CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))
+
+# 執行模式: polling 或 webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")        # 對外 HTTPS 網址，留空則不向 Telegram 註冊
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # 對應 X-Telegram-Bot-Api-Secret-Token，webhook 模式必填
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "256"))
+
+# 登入狀態快取
+LOGIN_CACHE_TTL = int(os.getenv("LOGIN_CACHE_TTL", "300"))
+
+# MQTT 設定 (接收後端推送的快取失效通知，未設定則只依賴 TTL)
+MQTT_BROKER = os.getenv("MQTT_BROKER")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "8883"))
+MQTT_USERNAME = os.getenv("MQTT_USERNAME")
+MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+INVALIDATE_TOPIC = "bot/invalidate"
+
 # Logging 設定
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -27,20 +60,131 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Conversation 狀態常數
-ASK_EMAIL, ASK_CODE = range(2)
-waiting_for_code = set()
+ASK_EMAIL, ASK_CODE = "ASK_EMAIL", "ASK_CODE"
+
+# 對話狀態儲存 (memory 或 sqlite:///path)，多個 Bot worker 可共用 SQLite 檔案
+BOT_STATE_STORE = os.getenv("BOT_STATE_STORE", "sqlite:///bot_state.db")
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "300"))
+PENDING_CODE_TTL = int(os.getenv("PENDING_CODE_TTL", "180"))  # 與後端驗證碼有效期相同
+STATE_SWEEP_INTERVAL = int(os.getenv("STATE_SWEEP_INTERVAL", "60"))
+
+NS_CONVERSATION = "conversation"  # chat -> 目前等待輸入的狀態
+NS_PENDING_CODE = "pending_code"  # chat -> 已申請驗證碼
+NS_LOGIN = "login"                # chat -> check-status 回應快取
+
+state_store = create_state_store(BOT_STATE_STORE)
+
+# 共用的 HTTP 連線池 (keep-alive)
+http_client: httpx.AsyncClient | None = None
+RETRY_STATUS = {502, 503, 504}
+
+async def init_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        base_url=BACKEND_URL,
+        headers={"Content-Type": "application/json", "x-bot-token": BOT_SECRET},
+        timeout=BACKEND_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS,
+            max_keepalive_connections=BACKEND_MAX_CONNECTIONS,
+            keepalive_expiry=30,
+        ),
+    )
+
+async def close_http_client():
+    if http_client:
+        await http_client.aclose()
+
+async def backoff(attempt: int):
+    delay = BACKEND_BACKOFF * (2 ** attempt)
+    await asyncio.sleep(delay + random.uniform(0, delay))
 
 # 後端 API 呼叫
-def call_backend(endpoint: str, data: dict):
-    url = f"{BACKEND_URL}/{endpoint}"
-    headers = {"Content-Type": "application/json", "x-bot-token": BOT_SECRET}
-    try:
-        resp = requests.post(url, json=data, headers=headers, timeout=10)
-        if resp.status_code == 200:
-            return resp.json()
-        return {"success": False, "message": f"Server Error: {resp.status_code}"}
-    except Exception as e:
-        return {"success": False, "message": f"連線失敗: {e}"}
+# 連線失敗 (請求未送達) 一律重試；retry_on_status 控制 502/503/504 是否重試，非冪等操作 (如開門) 應關閉
+async def call_backend(endpoint: str, data: dict, timeout: float | None = None, retry_on_status: bool = True):
+    for attempt in range(BACKEND_RETRIES + 1):
+        last = attempt == BACKEND_RETRIES
+        try:
+            resp = await http_client.post(endpoint, json=data, timeout=timeout or BACKEND_TIMEOUT)
+            if resp.status_code == 200:
+                return resp.json()
+            if resp.status_code == 429:
+                return {"success": False, "message": "⚠️ 操作太頻繁，請稍後再試。"}
+            if retry_on_status and resp.status_code in RETRY_STATUS and not last:
+                await backoff(attempt)
+                continue
+            return {"success": False, "message": f"Server Error: {resp.status_code}"}
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            if not last:
+                logger.warning("Backend %s connect failed (%s), retrying", endpoint, e)
+                await backoff(attempt)
+                continue
+            return {"success": False, "message": f"連線失敗: {e}"}
+        except Exception as e:
+            return {"success": False, "message": f"連線失敗: {e}"}
+
+# 取得登入狀態，快取未命中才呼叫後端
+async def get_login_status(telegram_id: str) -> dict:
+    status = await state_store.get(NS_LOGIN, telegram_id)
+    if status is None:
+        status = await call_backend("check-status", {"telegram_id": telegram_id})
+        if "is_logged_in" in status:
+            await state_store.set(NS_LOGIN, telegram_id, status, LOGIN_CACHE_TTL)
+    return status
+
+# 訂閱後端推送的快取失效通知
+async def listen_invalidations():
+    while True:
+        try:
+            async with aiomqtt.Client(
+                hostname=MQTT_BROKER,
+                port=MQTT_PORT,
+                username=MQTT_USERNAME,
+                password=MQTT_PASSWORD,
+                tls_context=ssl.create_default_context(),
+            ) as client:
+                await client.subscribe(INVALIDATE_TOPIC, qos=1)
+                # 斷線期間可能漏掉通知，重新連線後清空快取
+                await state_store.clear(NS_LOGIN)
+                logger.info("Subscribed to %s", INVALIDATE_TOPIC)
+                async for message in client.messages:
+                    try:
+                        data = json.loads(message.payload)
+                    except ValueError:
+                        continue
+                    for telegram_id in data.get("telegram_ids", []):
+                        await state_store.delete(NS_LOGIN, str(telegram_id))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Invalidation listener error (%s), reconnecting in 5s", e)
+            await asyncio.sleep(5)
+
+# 定期清除過期的對話狀態
+async def sweep_state():
+    while True:
+        await asyncio.sleep(STATE_SWEEP_INTERVAL)
+        try:
+            removed = await state_store.sweep()
+            if removed:
+                logger.info("Swept %d expired state entries", removed)
+        except Exception as e:
+            logger.warning("State sweep error: %s", e)
+
+background_tasks: list[asyncio.Task] = []
+
+async def on_startup(application):
+    await init_http_client()
+    background_tasks.append(asyncio.create_task(sweep_state()))
+    if MQTT_BROKER:
+        background_tasks.append(asyncio.create_task(listen_invalidations()))
+
+async def on_shutdown(application):
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await close_http_client()
+    await state_store.close()
 
 # /start /help
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -58,64 +202,112 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # /login → ASK_EMAIL
 async def login_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = str(update.message.chat_id)
-    status = call_backend("check-status", {"telegram_id": telegram_id})
+    status = await get_login_status(telegram_id)
     if status.get("is_logged_in"):
         await update.message.reply_text(status.get("message"))
-        return ConversationHandler.END
+        return
+    await state_store.set(NS_CONVERSATION, telegram_id, ASK_EMAIL, CONVERSATION_TTL)
     await update.message.reply_text("請輸入您的 Email：")
-    return ASK_EMAIL
 
 # 接收 Email
 async def login_receive_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
     email = update.message.text.strip()
-    if email.startswith("/"):
-        await update.message.reply_text("操作已取消")
-        return ConversationHandler.END
     telegram_id = str(update.message.chat_id)
-    res = call_backend("request-code", {"email": email, "telegram_id": telegram_id})
+    res = await call_backend("request-code", {"email": email, "telegram_id": telegram_id})
     if res.get("success"):
-        waiting_for_code.add(telegram_id)
+        await state_store.set(NS_PENDING_CODE, telegram_id, True, PENDING_CODE_TTL)
     await update.message.reply_text(res.get("message"))
-    return ConversationHandler.END
 
 # /code → ASK_CODE
 async def code_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = str(update.message.chat_id)
-    status = call_backend("check-status", {"telegram_id": telegram_id})
+    status = await get_login_status(telegram_id)
     if status.get("is_logged_in"):
         await update.message.reply_text(status.get("message"))
-        return ConversationHandler.END
-    if telegram_id not in waiting_for_code:
+        return
+    if not await state_store.get(NS_PENDING_CODE, telegram_id):
         await update.message.reply_text("您尚未申請驗證碼，請先執行 /login")
-        return ConversationHandler.END
+        return
+    await state_store.set(NS_CONVERSATION, telegram_id, ASK_CODE, CONVERSATION_TTL)
     await update.message.reply_text("請輸入 6 位數驗證碼：")
-    return ASK_CODE
 
 # 接收驗證碼
 async def verify_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     code = update.message.text.strip()
     telegram_id = str(update.message.chat_id)
-    if code.startswith("/"):
-        await update.message.reply_text("操作已取消")
-        return ConversationHandler.END
-    res = call_backend("verify-code", {"code": code, "telegram_id": telegram_id})
-    if res.get("success") and telegram_id in waiting_for_code:
-        waiting_for_code.remove(telegram_id)
+    res = await call_backend("verify-code", {"code": code, "telegram_id": telegram_id})
+    if res.get("status"):
+        await state_store.set(NS_LOGIN, telegram_id, res["status"], LOGIN_CACHE_TTL)
+    # 綁定成功或驗證碼已失效 (過期、錯誤次數過多) 時清除待驗證狀態
+    if res.get("success") or res.get("code_expired"):
+        await state_store.delete(NS_PENDING_CODE, telegram_id)
     await update.message.reply_text(res.get("message"))
-    return ConversationHandler.END
+
+# 一般文字訊息，依儲存的對話狀態分派
+async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    telegram_id = str(update.message.chat_id)
+    state = await state_store.get(NS_CONVERSATION, telegram_id)
+    if state is None:
+        await unknown(update, context)
+        return
+    await state_store.delete(NS_CONVERSATION, telegram_id)
+    if state == ASK_EMAIL:
+        await login_receive_email(update, context)
+    elif state == ASK_CODE:
+        await verify_code(update, context)
 
 # /unlock
 async def unlock(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = str(update.message.chat_id)
-    res = call_backend("unlock", {"telegram_id": telegram_id})
-    await update.message.reply_text(res.get("message"))
+    res = await call_backend("devices", {"telegram_id": telegram_id})
+    if not res.get("success"):
+        await update.message.reply_text(res.get("message"))
+        return
+
+    devices = res["devices"]
+    if len(devices) == 1:
+        res = await call_backend("unlock", {"telegram_id": telegram_id, "device_id": devices[0]["id"]}, timeout=15, retry_on_status=False)
+        await update.message.reply_text(res.get("message"))
+        return
+
+    # 多扇門時以按鈕選擇
+    keyboard = [
+        [InlineKeyboardButton(f"🚪 {d['device_name']}" + (f" ({d['location']})" if d.get("location") else ""), callback_data=f"unlock:{d['id']}")]
+        for d in devices
+    ]
+    keyboard.append([InlineKeyboardButton("🔓 全部開啟", callback_data="unlock:all")])
+    await update.message.reply_text("請選擇要開啟的門：", reply_markup=InlineKeyboardMarkup(keyboard))
+
+# 門選單按鈕
+async def unlock_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    telegram_id = str(query.message.chat_id)
+    target = query.data.split(":", 1)[1]
+
+    if target == "all":
+        res = await call_backend("devices", {"telegram_id": telegram_id})
+        if not res.get("success"):
+            await query.edit_message_text(res.get("message"))
+            return
+        device_id = [d["id"] for d in res["devices"]]
+    else:
+        device_id = int(target)
+
+    await query.edit_message_text("⏳ 開門指令發送中...")
+    res = await call_backend("unlock", {"telegram_id": telegram_id, "device_id": device_id}, timeout=15, retry_on_status=False)
+    await query.edit_message_text(res.get("message"))
 
 # /logout
 async def logout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = str(update.message.chat_id)
-    res = call_backend("logout", {"telegram_id": telegram_id})
-    if telegram_id in waiting_for_code:
-        waiting_for_code.remove(telegram_id)
+    res = await call_backend("logout", {"telegram_id": telegram_id})
+    if res.get("status"):
+        await state_store.set(NS_LOGIN, telegram_id, res["status"], LOGIN_CACHE_TTL)
+    else:
+        await state_store.delete(NS_LOGIN, telegram_id)
+    await state_store.delete(NS_PENDING_CODE, telegram_id)
+    await state_store.delete(NS_CONVERSATION, telegram_id)
     await update.message.reply_text(res.get("message"))
 
 # 未知指令
@@ -126,34 +318,41 @@ async def unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def main():
     if not TG_TOKEN:
         raise RuntimeError("未讀取到 TELEGRAM_BOT_TOKEN")
-    application = ApplicationBuilder().token(TG_TOKEN).build()
-    login_conv = ConversationHandler(
-        entry_points=[CommandHandler("login", login_command)],
-        states={
-            ASK_EMAIL: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, login_receive_email)
-            ],
-        },
-        fallbacks=[],
-    )
-    code_conv = ConversationHandler(
-        entry_points=[CommandHandler("code", code_command)],
-        states={
-            ASK_CODE: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, verify_code)
-            ],
-        },
-        fallbacks=[],
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        raise RuntimeError("BOT_MODE=webhook 必須設定 WEBHOOK_SECRET")
+    application = (
+        ApplicationBuilder()
+        .token(TG_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
     )
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", start))
-    application.add_handler(login_conv)
-    application.add_handler(code_conv)
+    application.add_handler(CommandHandler("login", login_command))
+    application.add_handler(CommandHandler("code", code_command))
     application.add_handler(CommandHandler("unlock", unlock))
+    application.add_handler(CallbackQueryHandler(unlock_callback, pattern=r"^unlock:"))
     application.add_handler(CommandHandler("logout", logout))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     application.add_handler(MessageHandler(filters.ALL, unknown))
-    print("Bot Client Running...")
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        # Webhook 模式自行分派更新，不使用 Application 內建的併發處理
+        print(f"Bot Client Running (webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{WEBHOOK_PATH})...")
+        asyncio.run(run_webhook(
+            application,
+            WEBHOOK_LISTEN,
+            WEBHOOK_PORT,
+            WEBHOOK_PATH,
+            WEBHOOK_URL,
+            WEBHOOK_SECRET,
+            CONCURRENT_UPDATES,
+            WEBHOOK_QUEUE_SIZE,
+        ))
+    else:
+        print("Bot Client Running...")
+        application.run_polling()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
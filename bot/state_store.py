@@ -0,0 +1,124 @@
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+# Bot 對話狀態儲存
+# 以 (namespace, key) 存放 JSON 值，每筆都有到期時間，過期資料由 sweep() 清除
+# 使用 SQLite 時，同一台主機上的多個 Bot worker 可共用狀態，重啟後也不會遺失
+
+class StateStore(ABC):
+    @abstractmethod
+    async def get(self, namespace: str, key: str): ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value, ttl: float): ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str): ...
+
+    @abstractmethod
+    async def clear(self, namespace: str): ...
+
+    @abstractmethod
+    async def sweep(self) -> int: ...
+
+    async def close(self):
+        pass
+
+# 記憶體版本 (單一行程)
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self._data: dict[tuple[str, str], tuple[float, object]] = {}
+
+    async def get(self, namespace, key):
+        entry = self._data.get((namespace, key))
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.time() >= expires_at:
+            del self._data[(namespace, key)]
+            return None
+        return value
+
+    async def set(self, namespace, key, value, ttl):
+        self._data[(namespace, key)] = (time.time() + ttl, value)
+
+    async def delete(self, namespace, key):
+        self._data.pop((namespace, key), None)
+
+    async def clear(self, namespace):
+        for k in [k for k in self._data if k[0] == namespace]:
+            del self._data[k]
+
+    async def sweep(self):
+        now = time.time()
+        expired = [k for k, (expires_at, _) in self._data.items() if now >= expires_at]
+        for k in expired:
+            del self._data[k]
+        return len(expired)
+
+# SQLite 版本 (可跨行程共用，重啟後保留)
+class SQLiteStateStore(StateStore):
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS bot_state ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_bot_state_expires_at ON bot_state (expires_at)")
+
+    def _run(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def _execute(self, sql: str, params: tuple = ()):
+        return await asyncio.to_thread(self._run, sql, params)
+
+    async def get(self, namespace, key):
+        rows = await self._execute(
+            "SELECT value FROM bot_state WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, time.time()),
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    async def set(self, namespace, key, value, ttl):
+        await self._execute(
+            "INSERT INTO bot_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (namespace, key, json.dumps(value), time.time() + ttl),
+        )
+
+    async def delete(self, namespace, key):
+        await self._execute("DELETE FROM bot_state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    async def clear(self, namespace):
+        await self._execute("DELETE FROM bot_state WHERE namespace = ?", (namespace,))
+
+    async def sweep(self):
+        def run():
+            with self._lock:
+                return self._conn.execute("DELETE FROM bot_state WHERE expires_at <= ?", (time.time(),)).rowcount
+        return await asyncio.to_thread(run)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+# 依設定建立儲存後端: "memory" 或 "sqlite:///path/to/file.db"
+def create_state_store(url: str) -> StateStore:
+    if url == "memory":
+        return MemoryStateStore()
+    if url.startswith("sqlite:///"):
+        return SQLiteStateStore(url[len("sqlite:///"):])
+    raise ValueError(f"不支援的 BOT_STATE_STORE: {url}")
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import secrets
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Webhook 更新分派：有界佇列 + 固定數量的 worker 併發處理
+class UpdateDispatcher:
+    def __init__(self, application: Application, concurrency: int, queue_size: int):
+        self.application = application
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=queue_size)
+        self.workers: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, update: Update) -> bool:
+        try:
+            self.queue.put_nowait(update)
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            self.in_flight += 1
+            try:
+                await self.application.process_update(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Update %s failed: %s", update.update_id, e)
+            finally:
+                self.in_flight -= 1
+                self.queue.task_done()
+
+    def start(self):
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self, drain_timeout: float = 10):
+        # 先把佇列中的更新處理完，再停止 worker
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropped %d queued updates on shutdown", self.queue.qsize())
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "in_flight": self.in_flight,
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+# 所有請求 (含 /healthz) 都必須帶正確的 Secret Token，否則任何人都能偽造更新冒用使用者開門
+def create_webhook_app(application: Application, dispatcher: UpdateDispatcher, path: str, secret: str) -> Starlette:
+    def authorized(request: Request) -> bool:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        return secrets.compare_digest(token.encode(), secret.encode())
+
+    async def telegram_update(request: Request):
+        if not authorized(request):
+            return Response(status_code=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception:
+            return Response(status_code=400)
+        # 佇列已滿時回應 503，Telegram 會稍後重送
+        if not dispatcher.submit(update):
+            return Response(status_code=503)
+        return Response(status_code=200)
+
+    async def health(request: Request):
+        if not authorized(request):
+            return Response(status_code=403)
+        return JSONResponse(dispatcher.stats())
+
+    return Starlette(routes=[
+        Route(path, telegram_update, methods=["POST"]),
+        Route("/healthz", health, methods=["GET"]),
+    ])
+
+# 以 Webhook 模式執行 Bot
+async def run_webhook(
+    application: Application,
+    listen: str,
+    port: int,
+    path: str,
+    webhook_url: str | None,
+    secret: str,
+    concurrency: int,
+    queue_size: int,
+):
+    if not secret:
+        raise RuntimeError("Webhook 模式必須設定 WEBHOOK_SECRET")
+    dispatcher = UpdateDispatcher(application, concurrency, queue_size)
+    server = uvicorn.Server(uvicorn.Config(
+        create_webhook_app(application, dispatcher, path, secret),
+        host=listen,
+        port=port,
+        log_level="info",
+    ))
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    # 未設定 WEBHOOK_URL 時不向 Telegram 註冊，方便在本機直接 POST 測試更新
+    if webhook_url:
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=secret,
+            max_connections=concurrency,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info("Webhook registered: %s", webhook_url)
+    await application.start()
+    dispatcher.start()
+    try:
+        await server.serve()
+    finally:
+        await dispatcher.stop()
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
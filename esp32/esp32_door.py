@@ -1,25 +1,85 @@
 from modules.lcd import display_msg
-from modules.rfid import read_uid
+from modules.rfid import read_uid, set_poll_interval, init_reader
 from modules.network import connect_wifi, connect_mqtt
 from modules.access import show_standby, grant_access, deny_access
+from modules import journal, telemetry, signing
 import urequests, json, time
 
 CONFIG = {
     "WIFI_SSID": "your-wifi-ssid",
     "WIFI_PASS": "your-wifi-password",
-    "API_URL": "your-api-url", 
+    "API_URL": "your-api-url",
+    "JOURNAL_URL": "your-journal-api-url",
     "DEVICE_TOKEN": "your-device-token",
+    "DEVICE_HMAC_KEY": "",  # 以簽章模式佈建的設備填入 HMAC 金鑰，留空則使用 DEVICE_TOKEN
     "DEVICE_ID": "your-device-id",
     "MQTT_BROKER": "your-mqtt-broker-ip",
     "MQTT_USER": "your-mqtt-broker-username",
     "MQTT_PASS": "your-mqtt-broker-password",
-    "MQTT_PORT": "your-mqtt-broker-port"
+    "MQTT_PORT": "your-mqtt-broker-port",
+    "JOURNAL_BATCH": 20,
+    "JOURNAL_RETRY_S": 15,
+    "RFID_POLL_MS": 100,
+    "RFID_IRQ_PIN": None,  # RC522 IRQ 接線的 GPIO，未接線為 None
+    "LOOP_SLEEP_MS": 20,
+    "HEARTBEAT_S": 30
 }
 
+last_replay = 0
+# 回補時可重試的狀態碼 (驗證失敗、其他請求回補中、限流)
+RETRY_STATUS = (401, 403, 408, 409, 429)
+
 def mqtt_callback(topic, msg):
     if msg == b"OPEN":
         grant_access("Remote")
 
+# subject 為簽章涵蓋的內容 (卡號或請求內容摘要)，舊的 Token 模式不使用
+def device_headers(subject):
+    headers = {"Content-Type": "application/json"}
+    if signing.enabled():
+        headers.update(signing.headers(CONFIG["DEVICE_ID"], subject))
+    else:
+        headers["x-device-token"] = CONFIG["DEVICE_TOKEN"]
+    return headers
+
+# 後端恢復連線後，分批回補離線刷卡紀錄 (每次只送一批，不阻塞刷卡)
+def replay_journal():
+    global last_replay
+    if not journal.pending():
+        return
+    if time.ticks_diff(time.ticks_ms(), last_replay) < CONFIG["JOURNAL_RETRY_S"] * 1000:
+        return
+    last_replay = time.ticks_ms()
+
+    entries = journal.read_batch(CONFIG["JOURNAL_BATCH"])
+    if not entries:
+        return
+    try:
+        payload = {
+            "device_id": CONFIG["DEVICE_ID"],
+            "entries": entries
+        }
+        # 簽章涵蓋實際送出的內容
+        body = json.dumps(payload).encode()
+        res = urequests.post(
+            CONFIG["JOURNAL_URL"],
+            headers=device_headers(signing.body_digest(body)),
+            data=body,
+            timeout=3
+        )
+        # 4xx 中除了驗證失敗、衝突與限流以外都是內容錯誤，重送也不會成功，略過這一批
+        rejected = 400 <= res.status_code < 500 and res.status_code not in RETRY_STATUS
+        if rejected:
+            print("Journal batch rejected:", res.status_code, entries[0]["seq"], "-", entries[-1]["seq"])
+        if res.status_code == 200 or rejected:
+            journal.ack(entries[-1]["seq"])
+            # 還有剩餘紀錄時，下一輪立即繼續回補
+            if journal.pending():
+                last_replay = time.ticks_add(last_replay, -CONFIG["JOURNAL_RETRY_S"] * 1000)
+        res.close()
+    except Exception as e:
+        print("Journal Replay Error:", e)
+
 def main():
     ip = connect_wifi(CONFIG["WIFI_SSID"], CONFIG["WIFI_PASS"])
     if not ip:
@@ -28,6 +88,13 @@ def main():
     display_msg("WiFi OK", ip)
     time.sleep(2)
 
+    init_reader(CONFIG["RFID_IRQ_PIN"])
+    set_poll_interval(CONFIG["RFID_POLL_MS"])
+    signing.set_key(CONFIG["DEVICE_HMAC_KEY"])
+    journal.init()
+    if journal.pending():
+        print("Journal pending:", journal.pending())
+
     client = connect_mqtt(CONFIG, mqtt_callback)
     if client:
         display_msg("MQTT OK", "System Ready")
@@ -44,13 +111,10 @@ def main():
 
             uid = read_uid()
             if uid:
+                swipe_start = time.ticks_ms()
                 display_msg("Verifying...", uid)
 
                 try:
-                    headers = {
-                        "Content-Type": "application/json",
-                        "x-device-token": CONFIG["DEVICE_TOKEN"]
-                    }
                     payload = {
                         "card_uid": uid,
                         "device_id": CONFIG["DEVICE_ID"]
@@ -58,25 +122,35 @@ def main():
 
                     res = urequests.post(
                         CONFIG["API_URL"],
-                        headers=headers,
+                        headers=device_headers(uid),
                         data=json.dumps(payload),
                         timeout=5
                     )
 
+                    granted = False
                     if res.status_code == 200:
                         body = res.json()
-                        if body.get("access") == True:
-                            grant_access(body.get("student_id"))
-                        else:
-                            deny_access()
+                        granted = body.get("access") == True
+                    elif res.status_code >= 500:
+                        # 後端異常 (5xx) 時也記錄到離線日誌
+                        journal.append(uid)
+                    res.close()
+
+                    telemetry.record_swipe(time.ticks_diff(time.ticks_ms(), swipe_start))
+                    if granted:
+                        grant_access(body.get("student_id"))
                     else:
                         deny_access()
-
-                    res.close()
                 except:
+                    # 後端無法連線，記錄到離線日誌
+                    journal.append(uid)
+                    telemetry.record_swipe(time.ticks_diff(time.ticks_ms(), swipe_start))
                     deny_access()
+            else:
+                replay_journal()
+                telemetry.maybe_publish(client, CONFIG["DEVICE_ID"], CONFIG["HEARTBEAT_S"])
 
-            time.sleep(0.1)
+            time.sleep_ms(CONFIG["LOOP_SLEEP_MS"])
 
         except OSError:
             print("MQTT Restarting...")
@@ -87,4 +161,4 @@ def main():
                 pass
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
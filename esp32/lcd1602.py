@@ -9,7 +9,9 @@ from machine import SoftI2C, Pin
 
 
 class LCD():
-    def __init__(self, i2c):
+    ROW_ADDR = (0x80, 0xC0, 0x80 + 20, 0xC0 + 20)
+
+    def __init__(self, i2c, cols=16, rows=2, pad=0):
 
         # board definition
         # P0: RS
@@ -25,8 +27,14 @@ class LCD():
             print("Cannot Locate I2C Device")
             time.sleep_ms(10)
             scan_result = i2c.scan()
-        self.LCD_I2C_ADDR = i2c.scan()[0]
+        self.LCD_I2C_ADDR = scan_result[0]
         self.bufs = []  # a list of bytes, created as writing things all in one go with i2c.writeto is more efficient than writing each byte
+        self.cols = cols
+        self.rows = rows
+        # extra idle bytes after each command/data, keeps >37us between writes on fast (400kHz) buses
+        self.pad = pad
+        # shadow frame buffer, mirrors what is currently shown on the display
+        self.frame = bytearray(b' ' * (cols * rows))
         self.BK = 0x08
         self.RS = 0x00
         self.E = 0x04
@@ -45,6 +53,7 @@ class LCD():
         self.add_command(0x06)  # 0000   0110
         self.add_command(0x01)  # 0000   0001
         self.execute()
+        time.sleep_ms(2)
 
     def queue(self, dat):
         '''
@@ -62,10 +71,7 @@ class LCD():
             
     def execute(self):
         try:
-            bytearray_to_write = bytearray(len(self.bufs))
-            for i in range(len(self.bufs)):
-                bytearray_to_write[i] = self.bufs[i]
-            self.i2c.writeto(self.LCD_I2C_ADDR, bytearray_to_write)
+            self.i2c.writeto(self.LCD_I2C_ADDR, bytearray(self.bufs))
             self.bufs=[]
             time.sleep_us(50)
         except Exception as e:
@@ -76,6 +82,7 @@ class LCD():
         # I2C chip only has 8 bit, so only 4 bit can be used for data, thus the data needs to be send in two parts
         self.queue(cmd)
         self.queue(cmd << 4)
+        self.queue_pad()
         if run:
             self.execute()
 
@@ -84,9 +91,17 @@ class LCD():
         # I2C chip only has 8 bit, so only 4 bit can be used for data, thus the data needs to be send in two parts
         self.queue(dat)
         self.queue(dat << 4)
+        self.queue_pad()
+
+    def queue_pad(self):
+        for _ in range(self.pad):
+            self.bufs.append(self.bufs[-1])
 
     def clear(self):
         self.add_command(1,run=True)
+        time.sleep_ms(2)  # clear display needs ~1.52ms
+        for i in range(len(self.frame)):
+            self.frame[i] = 0x20
 
     def backlight(self, on):
         if on:
@@ -109,16 +124,7 @@ class LCD():
 
     def char(self, ch, x=-1, y=0):
         if x >= 0:
-            if y == 0:
-                a = 0x80
-            if y == 1:
-                a = 0xC0
-            if y == 2:
-                a = 0x80 + 20
-            if y == 3:
-                a = 0xC0 + 20
-            a += x
-            self.add_command(a)
+            self.add_command(self.ROW_ADDR[y] + x)
         self.add_data(ch)
 
     def puts(self, s, y=0, x=0):
@@ -134,10 +140,38 @@ class LCD():
                 self.char(ord(s[0]), x, y)
                 for i in range(1, len(s)):
                     self.char(ord(s[i]))
+                # keep the shadow frame in sync
+                if y < self.rows:
+                    base = y * self.cols
+                    for i in range(min(len(s), self.cols - x)):
+                        self.frame[base + x + i] = ord(s[i]) & 0xFF
         except Exception as e:
             print(e)
         self.execute()
 
+    def update(self, *lines):
+        '''
+        Redraw the display from the shadow frame buffer, only the cells that changed are sent,
+        all in a single i2c.writeto, no clear command needed
+        :param lines: one string per row, ascii only, padded/truncated to the row width
+        :return:
+        '''
+        for y in range(min(len(lines), self.rows)):
+            data = lines[y].encode()[:self.cols]
+            base = y * self.cols
+            cursor = -1
+            for x in range(self.cols):
+                ch = data[x] if x < len(data) else 0x20
+                if self.frame[base + x] == ch:
+                    continue
+                if cursor != x:
+                    self.add_command(self.ROW_ADDR[y] + x)
+                self.add_data(ch)
+                self.frame[base + x] = ch
+                cursor = x + 1
+        if self.bufs:
+            self.execute()
+
     def create_charactor(self, ram_position, char):
         '''
 
@@ -152,4 +186,4 @@ class LCD():
         self.add_command(set_CGRAM_address | (ram_position << 3))
         for i in range(8):
             self.add_data(char[i])
-        self.execute()
\ No newline at end of file
+        self.execute()
\ No newline at end of file
@@ -1,7 +1,8 @@
 # https://github.com/cefn/micropython-mfrc522/blob/master/mfrc522.py
 
-from machine import Pin, SPI
+from machine import Pin, SPI, idle
 from os import uname
+from time import ticks_ms, ticks_add, ticks_diff
 
 emptyRecv = b""
 
@@ -19,7 +20,9 @@ class MFRC522:
     AUTHENT1A = 0x60
     AUTHENT1B = 0x61
 
-    def __init__(self, spi=None, gpioRst=None, gpioCs=None):
+    FIFO_REG = 0x09
+
+    def __init__(self, spi=None, gpioRst=None, gpioCs=None, gpioIrq=None, timeout_ms=30):
 
         if gpioRst is not None:
             self.rst = Pin(gpioRst, Pin.OUT)
@@ -39,6 +42,20 @@ class MFRC522:
         self.rregBuf = bytearray(1)
         self.recvBuf = bytearray(16)
         self.recvMv = memoryview(self.recvBuf)
+        # burst FIFO read: one address byte per data byte, plus a terminating 0x00
+        self.fifoAddrBuf = bytearray([((self.FIFO_REG << 1) & 0x7e) | 0x80] * 16 + [0])
+        self.fifoInBuf = bytearray(17)
+
+        # max time to wait for a card response, instead of a fixed number of register polls
+        self.timeout_ms = timeout_ms
+
+        # optional IRQ pin, lets _tocard sleep until the chip signals completion
+        self.irqHit = False
+        if gpioIrq is not None:
+            self.irq = Pin(gpioIrq, Pin.IN, Pin.PULL_UP)
+            self.irq.irq(trigger=Pin.IRQ_FALLING, handler=self._on_irq)
+        else:
+            self.irq = None
 
         if self.rst is not None:
             self.rst.value(0)
@@ -86,6 +103,30 @@ class MFRC522:
 
         return val[0]
 
+    def _wfifo(self, data):
+        # burst write: address byte followed by all data bytes in one chip-select cycle
+        if self.cs is not None:
+            self.cs.value(0)
+        self.wregBuf[0] = (self.FIFO_REG << 1) & 0x7e
+        self.spi.write(self.wregBuf[:1])
+        self.spi.write(data if isinstance(data, (bytes, bytearray)) else bytes(data))
+        if self.cs is not None:
+            self.cs.value(1)
+
+    def _rfifo(self, into, n):
+        # burst read: n address bytes clocked out, data comes back shifted by one byte
+        if self.cs is not None:
+            self.cs.value(0)
+        out = memoryview(self.fifoAddrBuf)[16 - n:]
+        inb = memoryview(self.fifoInBuf)[:n + 1]
+        self.spi.write_readinto(out, inb)
+        if self.cs is not None:
+            self.cs.value(1)
+        into[:n] = inb[1:]
+
+    def _on_irq(self, pin):
+        self.irqHit = True
+
     def _sflags(self, reg, mask):
         self._wreg(reg, self._rreg(reg) | mask)
 
@@ -105,28 +146,36 @@ class MFRC522:
             irq_en = 0x77
             wait_irq = 0x30
 
-        self._wreg(0x02, irq_en | 0x80)
+        if self.irq is not None:
+            # only route completion, error and timer interrupts to the IRQ pin
+            self._wreg(0x02, wait_irq | 0x03 | 0x80)
+        else:
+            self._wreg(0x02, irq_en | 0x80)
         self._cflags(0x04, 0x80)
         self._sflags(0x0A, 0x80)
         self._wreg(0x01, 0x00)
 
-        for c in send:
-            self._wreg(0x09, c)
+        self._wfifo(send)
+        self.irqHit = False
         self._wreg(0x01, cmd)
 
         if cmd == 0x0C:
             self._sflags(0x0D, 0x80)
 
-        i = 2000
-        while True:
+        deadline = ticks_add(ticks_ms(), self.timeout_ms)
+        if self.irq is not None:
+            while not self.irqHit and ticks_diff(deadline, ticks_ms()) > 0:
+                idle()
             n = self._rreg(0x04)
-            i -= 1
-            if ~((i != 0) and ~(n & 0x01) and ~(n & wait_irq)):
-                break
+        else:
+            while True:
+                n = self._rreg(0x04)
+                if (n & 0x01) or (n & wait_irq) or ticks_diff(deadline, ticks_ms()) <= 0:
+                    break
 
         self._cflags(0x0D, 0x80)
 
-        if i:
+        if (n & 0x01) or (n & wait_irq):
             if (self._rreg(0x06) & 0x1B) == 0x00:
                 stat = self.OK
 
@@ -149,10 +198,7 @@ class MFRC522:
                         recv = self.recvBuf
                     else:
                         recv = into
-                    pos = 0
-                    while pos < n:
-                        recv[pos] = self._rreg(0x09)
-                        pos += 1
+                    self._rfifo(recv, n)
                     if into is None:
                         recv = self.recvMv[:n]
                     else:
@@ -168,10 +214,7 @@ class MFRC522:
         self._cflags(0x05, 0x04)
         self._sflags(0x0A, 0x80)
 
-        dataPos = 0
-        while dataPos < count:
-            self._wreg(0x09, data[dataPos])
-            dataPos += 1
+        self._wfifo(memoryview(data)[:count])
 
         self._wreg(0x01, 0x03)
 
@@ -194,6 +237,8 @@ class MFRC522:
         self._wreg(0x2C, 0)
         self._wreg(0x15, 0x40)
         self._wreg(0x11, 0x3D)
+        if self.irq is not None:
+            self._wreg(0x03, 0x80)  # DivIEnReg: IRQ pin push-pull
         self.set_gain(self.MAX_GAIN)
         self.antenna_on()
 
@@ -208,6 +253,29 @@ class MFRC522:
         else:
             self._cflags(0x14, 0x03)
 
+    # Non-blocking card-presence detection: start a REQA/WUPA transceive and return at once.
+    # A card answering raises RxIRq on the IRQ pin; without a card the chip's auto timer ends
+    # the wait silently and the caller re-arms later. Requires the IRQ pin.
+    def arm_request(self, mode):
+        self._wreg(0x02, 0x20 | 0x80)  # ComIEnReg: route only RxIRq, pin active low
+        self._wreg(0x04, 0x7F)  # clear all ComIrqReg bits
+        self._sflags(0x0A, 0x80)
+        self._wreg(0x01, 0x00)
+        self._wreg(0x0D, 0x07)
+        self._wfifo(bytes([mode]))
+        self.irqHit = False
+        self._wreg(0x01, 0x0C)
+        self._sflags(0x0D, 0x80)
+
+    # True once after an armed request was answered with a valid 16-bit ATQA;
+    # the card is then in READY state and anticoll() can follow directly
+    def card_present(self):
+        if not self.irqHit:
+            return False
+        self.irqHit = False
+        self._cflags(0x0D, 0x80)
+        return (self._rreg(0x06) & 0x1B) == 0x00 and self._rreg(0x0A) == 2
+
     def request(self, mode):
 
         self._wreg(0x0D, 0x07)
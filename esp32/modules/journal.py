@@ -0,0 +1,97 @@
+import os, struct, time
+
+# 離線刷卡日誌：固定大小的環狀緩衝區，存放在 Flash
+# 每筆紀錄固定 32 bytes: seq(uint32) + ts(uint32) + uid(24 bytes)
+# 紀錄依 seq 輪流寫入不同槽位，檔案大小固定，寫入量有上限
+
+JOURNAL_FILE = "journal.bin"
+ACK_FILE = "journal.ack"
+SLOTS = 128
+RECORD_FMT = "<II24s"
+RECORD_SIZE = struct.calcsize(RECORD_FMT)
+EMPTY_SEQ = 0xFFFFFFFF
+
+# MicroPython 部分 port 的 epoch 為 2000-01-01，統一換算成 Unix 時間
+EPOCH_OFFSET = 946684800 if time.gmtime(0)[0] == 2000 else 0
+
+_head = 0   # 最後寫入的 seq
+_acked = 0  # 後端已確認的 seq
+
+def _exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+def _format():
+    empty = struct.pack(RECORD_FMT, EMPTY_SEQ, 0, b"")
+    with open(JOURNAL_FILE, "wb") as f:
+        for _ in range(SLOTS):
+            f.write(empty)
+
+def init():
+    global _head, _acked
+    if not _exists(JOURNAL_FILE):
+        _format()
+
+    # 掃描所有槽位找出最大的 seq，不需要額外的 header 寫入
+    _head = 0
+    with open(JOURNAL_FILE, "rb") as f:
+        for _ in range(SLOTS):
+            seq = struct.unpack(RECORD_FMT, f.read(RECORD_SIZE))[0]
+            if seq != EMPTY_SEQ and seq > _head:
+                _head = seq
+
+    _acked = 0
+    if _exists(ACK_FILE):
+        with open(ACK_FILE) as f:
+            try:
+                _acked = int(f.read())
+            except ValueError:
+                _acked = 0
+    if _acked > _head:
+        _acked = _head
+
+def pending():
+    return _head - _oldest() + 1 if _head > _acked else 0
+
+def _oldest():
+    # 超過容量時，最舊的紀錄已被覆蓋
+    return max(_acked + 1, _head - SLOTS + 1)
+
+def append(uid):
+    global _head
+    _head += 1
+    ts = time.time() + EPOCH_OFFSET
+    with open(JOURNAL_FILE, "r+b") as f:
+        f.seek((_head % SLOTS) * RECORD_SIZE)
+        f.write(struct.pack(RECORD_FMT, _head, ts, uid.encode()))
+    return _head
+
+def read_batch(limit):
+    entries = []
+    if _head <= _acked:
+        return entries
+    with open(JOURNAL_FILE, "rb") as f:
+        seq = _oldest()
+        while seq <= _head and len(entries) < limit:
+            f.seek((seq % SLOTS) * RECORD_SIZE)
+            rec_seq, ts, uid = struct.unpack(RECORD_FMT, f.read(RECORD_SIZE))
+            if rec_seq == seq:
+                entries.append({
+                    "seq": rec_seq,
+                    "ts": ts,
+                    "card_uid": uid.rstrip(b"\x00").decode()
+                })
+            seq += 1
+    return entries
+
+def ack(seq):
+    # 只有整批回補成功才寫入一次 ack 檔
+    global _acked
+    if seq <= _acked:
+        return
+    _acked = seq
+    with open(ACK_FILE, "w") as f:
+        f.write(str(seq))
@@ -1,17 +1,17 @@
-from machine import SoftI2C, Pin
+from machine import I2C, SoftI2C, Pin
 from lcd1602 import LCD
 
-i2c = SoftI2C(scl=Pin(27), sda=Pin(32), freq=100000)
-lcd = LCD(i2c)
+# 優先使用硬體 I2C (400 kHz)，失敗時退回 SoftI2C
+LCD_I2C_FREQ = 400000
+
+try:
+    i2c = I2C(0, scl=Pin(27), sda=Pin(32), freq=LCD_I2C_FREQ)
+    lcd = LCD(i2c, pad=1)
+except Exception as e:
+    print("HW I2C Error:", e)
+    i2c = SoftI2C(scl=Pin(27), sda=Pin(32), freq=100000)
+    lcd = LCD(i2c)
 
 def display_msg(line1="", line2=""):
-    lcd.clear()
-    
-    if len(line1) > 16:
-        line1 = line1[:16]
-        
-    if len(line2) > 16:
-        line2 = line2[:16]
-        
-    lcd.puts(line1, 0, 0)
-    lcd.puts(line2, 1, 0)
\ No newline at end of file
+    # 只更新有變動的字元，不需要 clear
+    lcd.update(line1, line2)
@@ -1,6 +1,7 @@
-import network, time
+import network, time, ntptime
 from umqtt.simple import MQTTClient
 from .lcd import display_msg
+from . import telemetry
 
 client = None
 
@@ -16,12 +17,25 @@ def connect_wifi(ssid, password):
             retry += 1
 
     if wlan.isconnected():
+        sync_time()
         return wlan.ifconfig()[0]
     else:
         display_msg("WiFi Error", "Check Settings")
         return None
 
 
+# 校時，離線日誌的時間戳記依賴 RTC
+def sync_time():
+    try:
+        before = time.time()
+        ntptime.settime()
+        telemetry.clock_changed(time.time() - before)
+        return True
+    except Exception as e:
+        print("NTP Error:", e)
+        return False
+
+
 def connect_mqtt(cfg, callback):
     global client
     try:
@@ -41,4 +55,4 @@ def connect_mqtt(cfg, callback):
         return client
     except Exception as e:
         print("MQTT Error:", e)
-        return None
\ No newline at end of file
+        return None
\ No newline at end of file
@@ -1,20 +1,58 @@
 from machine import Pin, SPI
 from mfrc522 import MFRC522
+import time
 
 spi = SPI(2, baudrate=2500000, polarity=0, phase=0,
           sck=Pin(18), mosi=Pin(23), miso=Pin(19))
 spi.init()
 
-rdr = MFRC522(spi=spi, gpioRst=4, gpioCs=0)
+rdr = None
+irq_mode = False
 
-def read_uid():
-    (stat, tag_type) = rdr.request(rdr.REQIDL)
-    if stat != rdr.OK:
-        return None
+# 兩次偵測卡片的最小間隔 (ms)；IRQ 模式下為重新送出 REQA 的間隔
+poll_interval_ms = 100
+last_poll = time.ticks_ms()
 
+# irq_pin 為 RC522 IRQ 腳位 (CONFIG["RFID_IRQ_PIN"])，未接線時為 None，改以輪詢 REQIDL 偵測卡片
+def init_reader(irq_pin=None):
+    global rdr, irq_mode
+    rdr = MFRC522(spi=spi, gpioRst=4, gpioCs=0, gpioIrq=irq_pin)
+    irq_mode = irq_pin is not None
+    if irq_mode:
+        rdr.arm_request(rdr.REQIDL)
+
+def set_poll_interval(ms):
+    global poll_interval_ms
+    poll_interval_ms = ms
+
+def _select():
     (stat, raw_uid) = rdr.anticoll()
     if stat != rdr.OK:
         return None
 
     uid = raw_uid[:-1]  # 去掉 CRC
-    return " ".join(["{:02X}".format(x) for x in uid])
\ No newline at end of file
+    return " ".join(["{:02X}".format(x) for x in uid])
+
+def read_uid():
+    global last_poll
+    now = time.ticks_ms()
+    if irq_mode:
+        # 卡片回應 REQA 時由 IRQ 通知，待機時不必等待晶片；沒有卡片時定期重新送出 REQA
+        if not rdr.card_present():
+            if time.ticks_diff(now, last_poll) >= poll_interval_ms:
+                last_poll = now
+                rdr.arm_request(rdr.REQIDL)
+            return None
+        last_poll = now
+        uid = _select()
+        rdr.arm_request(rdr.REQIDL)
+        return uid
+
+    if time.ticks_diff(now, last_poll) < poll_interval_ms:
+        return None
+    last_poll = now
+
+    (stat, tag_type) = rdr.request(rdr.REQIDL)
+    if stat != rdr.OK:
+        return None
+    return _select()
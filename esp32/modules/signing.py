@@ -0,0 +1,46 @@
+import binascii, hashlib, os, time
+from modules.journal import EPOCH_OFFSET
+
+# 請求簽章：HMAC-SHA256("device_id\nsubject\ntimestamp\nnonce")
+# MicroPython 沒有 hmac 模組，以 hashlib 自行組合；時間戳記依賴 NTP 校時
+BLOCK = 64
+
+_key = None
+_ipad = None
+_opad = None
+
+def set_key(hex_key):
+    global _key, _ipad, _opad
+    _key = binascii.unhexlify(hex_key) if hex_key else None
+    if _key is None:
+        return
+    key = _key
+    if len(key) > BLOCK:
+        key = hashlib.sha256(key).digest()
+    key = key + b"\x00" * (BLOCK - len(key))
+    _ipad = bytes(b ^ 0x36 for b in key)
+    _opad = bytes(b ^ 0x5C for b in key)
+
+def enabled():
+    return _key is not None
+
+def _hmac(msg):
+    inner = hashlib.sha256(_ipad)
+    inner.update(msg)
+    outer = hashlib.sha256(_opad)
+    outer.update(inner.digest())
+    return binascii.hexlify(outer.digest()).decode()
+
+def body_digest(body):
+    return binascii.hexlify(hashlib.sha256(body).digest()).decode()
+
+# subject: 刷卡時為卡號，回補日誌時為請求內容的 body_digest
+def headers(device_id, subject):
+    ts = int(time.time()) + EPOCH_OFFSET
+    nonce = binascii.hexlify(os.urandom(8)).decode()
+    msg = "{}\n{}\n{}\n{}".format(device_id, subject, ts, nonce)
+    return {
+        "x-device-timestamp": str(ts),
+        "x-device-nonce": nonce,
+        "x-device-signature": _hmac(msg.encode())
+    }
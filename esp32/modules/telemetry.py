@@ -0,0 +1,63 @@
+import gc, json, network, time
+
+# 設備心跳：定期透過 MQTT 回報運行狀態
+# ticks_ms 約 6.2 天就會溢位，運行時間改以開機時的 RTC 秒數計算
+boot_s = time.time()
+swipe_count = 0
+last_publish = time.ticks_ms()
+
+# 最近 N 次刷卡到判定結果的延遲 (ms)，環狀保存
+MAX_SAMPLES = 64
+latencies = []
+latency_pos = 0
+
+# NTP 校時會讓 RTC 跳動，開機時間一併平移
+def clock_changed(offset_s):
+    global boot_s
+    boot_s += offset_s
+
+def record_swipe(latency_ms):
+    global swipe_count, latency_pos
+    swipe_count += 1
+    if len(latencies) < MAX_SAMPLES:
+        latencies.append(latency_ms)
+    else:
+        latencies[latency_pos] = latency_ms
+        latency_pos = (latency_pos + 1) % MAX_SAMPLES
+
+def _percentile(samples, p):
+    if not samples:
+        return None
+    idx = min(len(samples) - 1, (len(samples) * p) // 100)
+    return samples[idx]
+
+def _rssi():
+    try:
+        return network.WLAN(network.STA_IF).status("rssi")
+    except Exception:
+        return None
+
+def heartbeat():
+    samples = sorted(latencies)
+    gc.collect()
+    return {
+        "up": int(time.time() - boot_s),
+        "heap": gc.mem_free(),
+        "rssi": _rssi(),
+        "sw": swipe_count,
+        "p50": _percentile(samples, 50),
+        "p95": _percentile(samples, 95),
+        "p99": _percentile(samples, 99)
+    }
+
+def maybe_publish(client, device_id, interval_s):
+    global last_publish
+    if client is None:
+        return
+    if time.ticks_diff(time.ticks_ms(), last_publish) < interval_s * 1000:
+        return
+    last_publish = time.ticks_ms()
+    try:
+        client.publish("door/" + device_id + "/telemetry", json.dumps(heartbeat()))
+    except Exception as e:
+        print("Telemetry Error:", e)
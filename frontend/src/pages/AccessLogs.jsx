@@ -13,7 +13,10 @@ const AccessLogs = () => {
   const fetchLogs = async () => {
     if (logs.length === 0) setLoading(true);
     try {
-      const res = await apiClient.get('/access/logs');
+      // 只取表格顯示的欄位
+      const res = await apiClient.get('/access/logs', {
+        params: { fields: 'id,timestamp,user_name,card_uid,device_name,method,status,details' }
+      });
       setLogs(res.data);
     } catch (e) {
       console.error(e);
@@ -83,6 +86,7 @@ const AccessLogs = () => {
         </Box>
       )
     },
+    { field: 'device_name', headerName: '設備', width: 130, valueFormatter: (value) => value || '-' },
     { field: 'method', headerName: '方式', width: 100 },
     { 
       field: 'status', 
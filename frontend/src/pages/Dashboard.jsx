@@ -30,15 +30,14 @@ const Dashboard = () => {
   const fetchData = async () => {
     try {
       const [usersRes, logsRes] = await Promise.all([
-        apiClient.get('/users/'),
-        apiClient.get('/access/logs?limit=1000')
+        apiClient.get('/users/', { params: { page_size: 1, fields: 'id' } }),
+        apiClient.get('/access/logs', { params: { limit: 1000, fields: 'timestamp' } })
       ]);
-      const users = usersRes.data;
       const logs = logsRes.data;
       const today = dayjs().format('YYYY-MM-DD');
       const todayLogs = logs.filter(log => dayjs(log.timestamp).format('YYYY-MM-DD') === today);
 
-      setStats({ userCount: users.length, logCount: logs.length, todayCount: todayLogs.length });
+      setStats({ userCount: usersRes.data.total, logCount: logs.length, todayCount: todayLogs.length });
       
       setIsOnline(true);
     } catch (error) { 
@@ -1,7 +1,7 @@
 import React, { useEffect, useState, useMemo } from 'react';
 import { 
   Box, Button, Typography, Dialog, DialogTitle, DialogContent, DialogContentText,
-  DialogActions, TextField, Chip, Stack, Snackbar, Alert, IconButton, Switch, FormControlLabel, Paper
+  DialogActions, TextField, Chip, Stack, Snackbar, Alert, IconButton, Switch, FormControlLabel, Paper, MenuItem
 } from '@mui/material';
 import { DataGrid } from '@mui/x-data-grid';
 import { zhTW } from '@mui/x-data-grid/locales';
@@ -19,11 +19,13 @@ const DeviceManagement = () => {
   const [open, setOpen] = useState(false);
   const [isEditMode, setIsEditMode] = useState(false);
   const [currentId, setCurrentId] = useState(null);
-  const [formData, setFormData] = useState({ device_name: '', location: '', is_active: true });
+  const [formData, setFormData] = useState({ device_name: '', location: '', is_active: true, direction: '' });
   
   const [errors, setErrors] = useState({});
 
-  const [tokenDialog, setTokenDialog] = useState({ open: false, token: '', deviceName: '' });
+  // 簽章模式：設備以 HMAC 金鑰簽署每次請求，取代靜態 Token
+  const [signed, setSigned] = useState(false);
+  const [tokenDialog, setTokenDialog] = useState({ open: false, token: '', hmacKey: null, deviceName: '' });
   const [confirmDialog, setConfirmDialog] = useState({ 
     open: false, type: '', targetId: null, targetName: '' 
   });
@@ -49,7 +51,8 @@ const DeviceManagement = () => {
 
   const handleOpenAdd = () => {
     setIsEditMode(false);
-    setFormData({ device_name: '', location: '', is_active: true });
+    setFormData({ device_name: '', location: '', is_active: true, direction: '' });
+    setSigned(false);
     setErrors({});
     setOpen(true);
   };
@@ -57,7 +60,7 @@ const DeviceManagement = () => {
   const handleOpenEdit = (row) => {
     setIsEditMode(true);
     setCurrentId(row.id);
-    setFormData({ device_name: row.device_name, location: row.location, is_active: row.is_active });
+    setFormData({ device_name: row.device_name, location: row.location, is_active: row.is_active, direction: row.direction || '' });
     setErrors({});
     setOpen(true);
   };
@@ -66,7 +69,8 @@ const DeviceManagement = () => {
     setConfirmDialog({ open: true, type: 'DELETE', targetId: id, targetName: name });
   };
 
-  const handleClickReset = (id, name) => {
+  const handleClickReset = (id, name, isSigned) => {
+    setSigned(isSigned);
     setConfirmDialog({ open: true, type: 'RESET', targetId: id, targetName: name });
   };
 
@@ -77,8 +81,8 @@ const DeviceManagement = () => {
         await apiClient.delete(`/devices/${targetId}`);
         setMsg({ open: true, txt: '刪除成功', type: 'success' });
       } else if (type === 'RESET') {
-        const res = await apiClient.post(`/devices/${targetId}/reset-token`);
-        setTokenDialog({ open: true, token: res.data.token, deviceName: targetName });
+        const res = await apiClient.post(`/devices/${targetId}/reset-token`, null, { params: { signed } });
+        setTokenDialog({ open: true, token: res.data.token, hmacKey: res.data.hmac_key, deviceName: targetName });
         setMsg({ open: true, txt: 'Token 重設成功', type: 'success' });
       }
       fetchDevices();
@@ -92,13 +96,14 @@ const DeviceManagement = () => {
   const handleSubmit = async () => {
     if (!validate()) return;
 
+    const payload = { ...formData, direction: formData.direction || null };
     try {
       if (isEditMode) {
-        await apiClient.put(`/devices/${currentId}`, formData);
+        await apiClient.put(`/devices/${currentId}`, payload);
         setMsg({ open: true, txt: '更新成功', type: 'success' });
       } else {
-        const res = await apiClient.post('/devices/', formData);
-        setTokenDialog({ open: true, token: res.data.token, deviceName: res.data.device_name });
+        const res = await apiClient.post('/devices/', payload, { params: { signed } });
+        setTokenDialog({ open: true, token: res.data.token, hmacKey: res.data.hmac_key, deviceName: res.data.device_name });
         setMsg({ open: true, txt: '新增成功', type: 'success' });
       }
       setOpen(false);
@@ -109,7 +114,7 @@ const DeviceManagement = () => {
   };
 
   const copyToken = () => {
-    navigator.clipboard.writeText(tokenDialog.token);
+    navigator.clipboard.writeText(tokenDialog.hmacKey || tokenDialog.token);
     setMsg({ open: true, txt: '已複製到剪貼簿', type: 'success' });
   };
 
@@ -118,18 +123,40 @@ const DeviceManagement = () => {
     { field: 'location', headerName: '位置', width: 150 },
     { 
       field: 'token_status', headerName: 'Token', width: 150, sortable: false,
-      renderCell: () => <Typography variant="caption" color="text.secondary">●●●●●● (已隱藏)</Typography>
+      renderCell: (p) => p.row.signed
+        ? <Chip label="HMAC 簽章" color="primary" variant="outlined" size="small"/>
+        : <Typography variant="caption" color="text.secondary">●●●●●● (已隱藏)</Typography>
     },
     { 
       field: 'is_active', headerName: '狀態', width: 100, 
       renderCell: (p) => <Chip label={p.value?"啟用":"停用"} color={p.value?"success":"default"} size="small"/> 
     },
+    { 
+      field: 'online', headerName: '連線', width: 100, 
+      renderCell: (p) => <Chip label={p.value?"在線":"離線"} color={p.value?"success":"error"} variant="outlined" size="small"/> 
+    },
+    { 
+      field: 'last_seen', headerName: '最後心跳', width: 180, 
+      valueFormatter: (value) => value ? new Date(value).toLocaleString() : '-'
+    },
+    { 
+      field: 'free_heap', headerName: '可用記憶體', width: 110, 
+      valueFormatter: (value) => value != null ? `${Math.round(value / 1024)} KB` : '-'
+    },
+    { 
+      field: 'rssi', headerName: 'RSSI', width: 90, 
+      valueFormatter: (value) => value != null ? `${value} dBm` : '-'
+    },
+    { 
+      field: 'latency_p95_ms', headerName: '刷卡延遲 p95', width: 120, 
+      valueFormatter: (value) => value != null ? `${value} ms` : '-'
+    },
     {
       field: 'actions', headerName: '操作', width: 180, sortable: false,
       renderCell: (p) => (
         <>
           <IconButton color="primary" onClick={() => handleOpenEdit(p.row)} title="編輯資訊"><EditIcon /></IconButton>
-          <IconButton color="warning" onClick={() => handleClickReset(p.row.id, p.row.device_name)} title="重設 Token"><RefreshIcon /></IconButton>
+          <IconButton color="warning" onClick={() => handleClickReset(p.row.id, p.row.device_name, p.row.signed)} title="重設 Token"><RefreshIcon /></IconButton>
           <IconButton color="error" onClick={() => handleClickDelete(p.row.id, p.row.device_name)} title="刪除設備"><DeleteIcon /></IconButton>
         </>
       ),
@@ -169,7 +196,20 @@ const DeviceManagement = () => {
             helperText={errors.location}
             error={!!errors.location}
           />
+          <TextField
+            select margin="dense" label="進出方向" fullWidth
+            value={formData.direction}
+            onChange={e => setFormData({...formData, direction: e.target.value})}
+            helperText="設定後刷卡成功會計入所屬 Zone 的在場人數"
+          >
+            <MenuItem value="">不統計</MenuItem>
+            <MenuItem value="in">進門</MenuItem>
+            <MenuItem value="out">出門</MenuItem>
+          </TextField>
           <FormControlLabel control={<Switch checked={formData.is_active} onChange={e => setFormData({...formData, is_active: e.target.checked})} />} label="啟用設備" sx={{ mt: 2 }} />
+          {!isEditMode && (
+            <FormControlLabel control={<Switch checked={signed} onChange={e => setSigned(e.target.checked)} />} label="簽章模式 (需新版韌體)" sx={{ mt: 2 }} />
+          )}
         </DialogContent>
         <DialogActions>
           <Button onClick={() => setOpen(false)}>取消</Button>
@@ -189,6 +229,9 @@ const DeviceManagement = () => {
               : `確定要重設 [${confirmDialog.targetName}] 的 Token 嗎？舊的 Token 將立即失效。`
             }
           </DialogContentText>
+          {confirmDialog.type === 'RESET' && (
+            <FormControlLabel control={<Switch checked={signed} onChange={e => setSigned(e.target.checked)} />} label="簽章模式 (需新版韌體)" sx={{ mt: 1 }} />
+          )}
         </DialogContent>
         <DialogActions>
           <Button onClick={() => setConfirmDialog({...confirmDialog, open: false})}>取消</Button>
@@ -200,15 +243,19 @@ const DeviceManagement = () => {
 
       {/* Token 顯示 Dialog */}
       <Dialog open={tokenDialog.open} onClose={() => {}}> 
-        <DialogTitle sx={{ bgcolor: '#e3f2fd' }}>⚠️ 請保存您的 Token</DialogTitle>
+        <DialogTitle sx={{ bgcolor: '#e3f2fd' }}>⚠️ 請保存您的{tokenDialog.hmacKey ? ' HMAC 金鑰' : ' Token'}</DialogTitle>
         <DialogContent sx={{ mt: 2, minWidth: 400 }}>
           <DialogContentText sx={{ mb: 2 }}>
-            設備 <strong>{tokenDialog.deviceName}</strong> 的驗證 Token 已產生。<br/>
-            基於安全考量，<strong>此 Token 只會顯示這一次</strong>。
+            {tokenDialog.hmacKey ? (
+              <>設備 <strong>{tokenDialog.deviceName}</strong> 已改用簽章模式，請將金鑰填入韌體的 DEVICE_HMAC_KEY。<br/></>
+            ) : (
+              <>設備 <strong>{tokenDialog.deviceName}</strong> 的驗證 Token 已產生。<br/></>
+            )}
+            基於安全考量，<strong>此{tokenDialog.hmacKey ? '金鑰' : ' Token '}只會顯示這一次</strong>。
           </DialogContentText>
           <Paper variant="outlined" sx={{ p: 2, display: 'flex', alignItems: 'center', bgcolor: '#f5f5f5' }}>
             <Typography variant="body1" sx={{ fontFamily: 'monospace', flexGrow: 1, wordBreak: 'break-all' }}>
-              {tokenDialog.token}
+              {tokenDialog.hmacKey || tokenDialog.token}
             </Typography>
             <IconButton onClick={copyToken} color="primary"><ContentCopyIcon /></IconButton>
           </Paper>
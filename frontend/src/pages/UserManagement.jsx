@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useMemo } from 'react';
+import React, { useEffect, useState, useMemo, useRef } from 'react';
 import { 
   Box, Button, Typography, Dialog, DialogTitle, DialogContent, 
   DialogActions, TextField, Chip, Stack, Snackbar, Alert, IconButton, Switch, FormControlLabel,
@@ -9,12 +9,22 @@ import { zhTW } from '@mui/x-data-grid/locales';
 import AddIcon from '@mui/icons-material/Add';
 import EditIcon from '@mui/icons-material/Edit';
 import DeleteIcon from '@mui/icons-material/Delete';
+import LinkOffIcon from '@mui/icons-material/LinkOff';
 import apiClient from '../api/client';
 
 const UserManagement = () => {
   const [users, setUsers] = useState([]);
+  const [rowCount, setRowCount] = useState(0);
   const [allDevices, setAllDevices] = useState([]);
   const [loading, setLoading] = useState(false);
+
+  // 分頁、排序與搜尋皆由後端處理
+  const [paginationModel, setPaginationModel] = useState({ page: 0, pageSize: 50 });
+  const [sortModel, setSortModel] = useState([]);
+  const [search, setSearch] = useState('');
+  const [query, setQuery] = useState('');
+  const [reload, setReload] = useState(0);
+  const freshRead = useRef(false);
   
   const [open, setOpen] = useState(false);
   const [isEditMode, setIsEditMode] = useState(false);
@@ -29,14 +39,23 @@ const UserManagement = () => {
   const [msg, setMsg] = useState({ open: false, txt: '', type: 'success' });
 
   const fetchData = async () => {
-    if (users.length === 0) setLoading(true);
+    setLoading(true);
     try {
-      const [usersRes, devicesRes] = await Promise.all([
-        apiClient.get('/users/'),
-        apiClient.get('/devices/')
-      ]);
-      setUsers(usersRes.data);
-      setAllDevices(devicesRes.data);
+      const sort = sortModel[0];
+      const res = await apiClient.get('/users/', {
+        params: {
+          page: paginationModel.page + 1,
+          page_size: paginationModel.pageSize,
+          sort: sort ? sort.field : 'id',
+          order: sort ? sort.sort : 'asc',
+          q: query || undefined,
+          // 剛修改完資料時讀主庫，避免唯讀副本尚未同步
+          fresh: freshRead.current || undefined
+        }
+      });
+      freshRead.current = false;
+      setUsers(res.data.items);
+      setRowCount(res.data.total);
     } catch (e) {
       console.error(e);
     } finally {
@@ -44,7 +63,26 @@ const UserManagement = () => {
     }
   };
 
-  useEffect(() => { fetchData(); }, []);
+  useEffect(() => {
+    apiClient.get('/devices/', { params: { fields: 'id,device_name,location' } }).then(res => setAllDevices(res.data)).catch(e => console.error(e));
+  }, []);
+
+  useEffect(() => { fetchData(); }, [paginationModel, sortModel, query, reload]);
+
+  // 表格欄位的按鈕只建立一次，以計數觸發重新查詢，避免使用到舊的分頁狀態
+  const refresh = () => {
+    freshRead.current = true;
+    setReload(n => n + 1);
+  };
+
+  // 輸入停頓 300ms 後才搜尋，並回到第一頁
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      setQuery(search.trim());
+      setPaginationModel(prev => (prev.page === 0 ? prev : { ...prev, page: 0 }));
+    }, 300);
+    return () => clearTimeout(timer);
+  }, [search]);
 
   const validate = () => {
     let tempErrors = {};
@@ -84,12 +122,23 @@ const UserManagement = () => {
     try {
       await apiClient.delete(`/users/${id}`);
       setMsg({ open: true, txt: '刪除成功', type: 'success' });
-      fetchData();
+      refresh();
     } catch (e) {
       setMsg({ open: true, txt: '刪除失敗', type: 'error' });
     }
   };
 
+  const handleUnbind = async (id) => {
+    if (!window.confirm("確定要解除此學生的 Telegram 綁定嗎？")) return;
+    try {
+      await apiClient.post(`/users/${id}/unbind-telegram`);
+      setMsg({ open: true, txt: '已解除綁定', type: 'success' });
+      refresh();
+    } catch (e) {
+      setMsg({ open: true, txt: '解除綁定失敗', type: 'error' });
+    }
+  };
+
   const handleSubmit = async () => {
     if (!validate()) return;
     try {
@@ -100,7 +149,7 @@ const UserManagement = () => {
       }
       setMsg({ open: true, txt: isEditMode ? '更新成功' : '新增成功', type: 'success' });
       setOpen(false);
-      fetchData();
+      refresh();
     } catch (e) {
       const errorDetail = e.response?.data?.detail || '操作失敗';
       setMsg({ open: true, txt: `操作失敗: ${errorDetail}`, type: 'error' });
@@ -123,6 +172,7 @@ const UserManagement = () => {
       field: 'accessible_device_names', 
       headerName: '可通行設備', 
       width: 250,
+      sortable: false,
       renderCell: (params) => (
         <Box sx={{ display: 'flex', gap: 0.5, alignItems: 'center', height: '100%', overflowX: 'auto' }}>
           {params.value && params.value.length > 0 ? (
@@ -139,6 +189,7 @@ const UserManagement = () => {
       field: 'card_uid', 
       headerName: '卡號', 
       width: 180,
+      sortable: false,
       renderCell: (params) => (
         <Box sx={{ display: 'flex', alignItems: 'center', height: '100%' }}>
           {params.value ? (
@@ -157,6 +208,7 @@ const UserManagement = () => {
       field: 'is_active', 
       headerName: '狀態', 
       width: 90, 
+      sortable: false,
       renderCell: (params) => (
         <Chip 
           label={params.value ? "啟用" : "停用"} 
@@ -168,13 +220,18 @@ const UserManagement = () => {
     {
       field: 'actions', 
       headerName: '操作', 
-      width: 120, 
+      width: 160, 
       sortable: false,
       renderCell: (params) => (
         <>
           <IconButton color="primary" onClick={() => handleOpenEdit(params.row)}>
             <EditIcon />
           </IconButton>
+          {params.row.telegram_bound && (
+            <IconButton color="warning" onClick={() => handleUnbind(params.row.id)} title="解除 Telegram 綁定">
+              <LinkOffIcon />
+            </IconButton>
+          )}
           <IconButton color="error" onClick={() => handleDelete(params.row.id)}>
             <DeleteIcon />
           </IconButton>
@@ -187,6 +244,11 @@ const UserManagement = () => {
     <Box sx={{ height: 600, width: '100%' }}>
       <Stack direction="row" justifyContent="space-between" mb={2}>
         <Typography variant="h5">學生管理</Typography>
+        <TextField
+          size="small" placeholder="搜尋學號、姓名或 Email"
+          value={search} onChange={e => setSearch(e.target.value)}
+          sx={{ ml: 'auto', mr: 2, width: 280 }}
+        />
         <Button variant="contained" startIcon={<AddIcon />} onClick={handleOpenAdd}>
           新增學生
         </Button>
@@ -198,6 +260,14 @@ const UserManagement = () => {
         loading={loading}
         disableRowSelectionOnClick
         sortingOrder={['asc', 'desc']}
+        paginationMode="server"
+        sortingMode="server"
+        rowCount={rowCount}
+        paginationModel={paginationModel}
+        onPaginationModelChange={setPaginationModel}
+        pageSizeOptions={[25, 50, 100]}
+        sortModel={sortModel}
+        onSortModelChange={setSortModel}
         localeText={zhTW.components.MuiDataGrid.defaultProps.localeText}
       />
       